@@ -0,0 +1,76 @@
+"""
+Bounded I/O pool for blocking file-system work in async handlers.
+
+Prompt assembly reads the current file, attached files, the workspace tree
+and the symbol index. Doing that inline blocks the event loop, and doing it
+one read after another adds the latencies up. `IOPool.gather` runs the reads
+in parallel on a small dedicated thread pool (so they don't compete with
+model calls for the default executor) under one per-request deadline. Reads
+that miss the deadline are reported and left out instead of stalling the
+response; their threads finish in the background.
+
+A late read keeps its worker until it returns, so longer blocking jobs
+(static analysis, file operations) get a pool of their own and cannot use
+up the workers that prompt context reads need.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class IOPool:
+    """Thread pool with deadline-bounded async helpers"""
+
+    def __init__(self, max_workers: int = 8, metrics=None, name: str = "io"):
+        self.max_workers = max_workers
+        self.metrics = metrics
+        self.timeouts = 0
+        self.errors = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"gemmapilot-{name}")
+
+    def _count(self, name: str, value: int = 1) -> None:
+        if self.metrics is not None:
+            self.metrics.incr(name, value)
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run one blocking call on the pool; exceptions propagate"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def gather(self, calls: Dict[str, Callable[[], Any]], deadline: Optional[float] = None,
+                     default: Any = None) -> Tuple[Dict[str, Any], List[str]]:
+        """Run calls in parallel; returns (results by name, names that timed out)
+
+        Calls that raise or miss the deadline get `default` as their result.
+        """
+        if not calls:
+            return {}, []
+        loop = asyncio.get_running_loop()
+        futures = {name: loop.run_in_executor(self._executor, fn) for name, fn in calls.items()}
+        done, _ = await asyncio.wait(futures.values(), timeout=deadline)
+
+        results: Dict[str, Any] = {}
+        timed_out: List[str] = []
+        for name, future in futures.items():
+            if future not in done:
+                # Retrieve the late result/exception so asyncio doesn't log it as unhandled
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                results[name] = default
+                timed_out.append(name)
+                continue
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                print(f"⚠️ Warning: Context read {name} failed: {e}")
+                self.errors += 1
+                self._count("io.errors")
+                results[name] = default
+        if timed_out:
+            self.timeouts += len(timed_out)
+            self._count("io.timeouts", len(timed_out))
+        return results, timed_out
+
+    def stats(self) -> Dict[str, Any]:
+        return {"max_workers": self.max_workers, "timeouts": self.timeouts, "errors": self.errors}
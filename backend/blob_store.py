@@ -0,0 +1,87 @@
+"""
+Content-addressed blob store for attached file contents.
+
+Clients refer to file bodies by their SHA-256 hash. The server reports which
+hashes it does not have yet, so each body only crosses the wire once per
+server lifetime (or until it is evicted).
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+
+def content_hash(content: str) -> str:
+    """Return the SHA-256 hex digest used as the blob key"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class BlobStore:
+    """LRU blob store bounded by total size in bytes"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._blobs: "OrderedDict[str, str]" = OrderedDict()
+
+    def __contains__(self, blob_hash: str) -> bool:
+        with self._lock:
+            return blob_hash in self._blobs
+
+    def __len__(self) -> int:
+        return len(self._blobs)
+
+    def put(self, content: str, expected_hash: Optional[str] = None) -> str:
+        """Store `content` and return its hash; raises ValueError on hash mismatch"""
+        blob_hash = content_hash(content)
+        if expected_hash and expected_hash != blob_hash:
+            raise ValueError(f"Hash mismatch: expected {expected_hash}, got {blob_hash}")
+
+        size = len(content.encode("utf-8"))
+        if size > self.max_bytes:
+            raise ValueError(f"Blob of {size} bytes exceeds store capacity of {self.max_bytes} bytes")
+
+        with self._lock:
+            if blob_hash in self._blobs:
+                self._blobs.move_to_end(blob_hash)
+                return blob_hash
+            self._blobs[blob_hash] = content
+            self.total_bytes += size
+            self._evict()
+        return blob_hash
+
+    def get(self, blob_hash: str) -> Optional[str]:
+        with self._lock:
+            content = self._blobs.get(blob_hash)
+            if content is not None:
+                self._blobs.move_to_end(blob_hash)
+            return content
+
+    def missing(self, hashes: Iterable[str]) -> List[str]:
+        """Return the hashes (in request order, deduplicated) that are not stored"""
+        with self._lock:
+            seen = set()
+            result = []
+            for blob_hash in hashes:
+                if blob_hash not in self._blobs and blob_hash not in seen:
+                    seen.add(blob_hash)
+                    result.append(blob_hash)
+            return result
+
+    def _evict(self) -> None:
+        while self.total_bytes > self.max_bytes and self._blobs:
+            _, content = self._blobs.popitem(last=False)
+            self.total_bytes -= len(content.encode("utf-8"))
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "blobs": len(self._blobs),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,179 @@
+"""
+Near-duplicate answer cache for `/chat`.
+
+Prompts are normalized (case, whitespace, punctuation) and turned into word
+shingles. Candidates are found through MinHash LSH bands and confirmed with
+exact Jaccard similarity of the shingle sets. Answers are only reused when
+the context hash (workspace, current file, selection, attachments) matches
+too, so the same question about a different file is never served stale.
+"""
+
+import hashlib
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+WORD = re.compile(r"[a-z0-9_]+")
+_MAX_HASH = (1 << 32) - 1
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lower-case, drop punctuation and collapse whitespace"""
+    return " ".join(WORD.findall(prompt.lower()))
+
+
+def shingles(text: str, size: int = 2) -> Set[str]:
+    words = text.split()
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """MinHash signatures from a fixed family of universal hash functions"""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        self.num_perm = num_perm
+        params = hashlib.sha256(f"minhash-{seed}".encode()).digest()
+        self._params: List[Tuple[int, int]] = []
+        counter = 0
+        while len(self._params) < num_perm:
+            params = hashlib.sha256(params + counter.to_bytes(4, 'little')).digest()
+            a, b = struct.unpack('<QQ', params[:16])
+            self._params.append((a % _MERSENNE_PRIME or 1, b % _MERSENNE_PRIME))
+            counter += 1
+
+    def signature(self, items: Set[str]) -> Tuple[int, ...]:
+        values = [struct.unpack('<I', hashlib.blake2b(item.encode(), digest_size=4).digest())[0] for item in items]
+        if not values:
+            return tuple([_MAX_HASH] * self.num_perm)
+        return tuple(min(((a * v + b) % _MERSENNE_PRIME) & _MAX_HASH for v in values) for a, b in self._params)
+
+
+class ChatAnswerCache:
+    """LRU cache of chat answers matched by near-duplicate prompt and exact context hash"""
+
+    def __init__(self, threshold: float = 0.85, max_entries: int = 2048, ttl: float = 3600.0,
+                 num_perm: int = 64, bands: int = 16):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm)
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], Set[int]] = {}
+        self._next_id = 0
+
+    def _band_keys(self, context_hash: str, signature: Tuple[int, ...]):
+        for band in range(self.bands):
+            yield (context_hash, band, signature[band * self.rows:(band + 1) * self.rows])
+
+    def lookup(self, prompt: str, context_hash: str) -> Optional[Dict[str, Any]]:
+        """Best cached entry for a near-duplicate prompt with the same context, or None"""
+        normalized = normalize_prompt(prompt)
+        prompt_shingles = shingles(normalized)
+        signature = self.hasher.signature(prompt_shingles)
+        now = time.monotonic()
+
+        with self._lock:
+            candidates: Set[int] = set()
+            for key in self._band_keys(context_hash, signature):
+                candidates |= self._buckets.get(key, set())
+
+            best, best_score = None, 0.0
+            for entry_id in candidates:
+                entry = self._entries.get(entry_id)
+                if entry is None or entry["expires"] < now:
+                    continue
+                score = 1.0 if entry["normalized"] == normalized else jaccard(prompt_shingles, entry["shingles"])
+                # Ties go to the newest entry
+                if score >= self.threshold and (score > best_score or (score == best_score and entry_id > best["id"])):
+                    best, best_score = entry, score
+
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best["id"])
+            self.hits += 1
+            if best_score < 1.0:
+                self.near_hits += 1
+            return {**best["value"], "similarity": round(best_score, 3), "cached_at": best["cached_at"]}
+
+    def store(self, prompt: str, context_hash: str, value: Dict[str, Any]) -> None:
+        """Cache an answer, replacing any earlier answer to the same normalized prompt and context"""
+        normalized = normalize_prompt(prompt)
+        prompt_shingles = shingles(normalized)
+        signature = self.hasher.signature(prompt_shingles)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            bucket_keys = list(self._band_keys(context_hash, signature))
+            # An identical prompt has an identical signature, so it shares the first band's bucket
+            for old_id in list(self._buckets.get(bucket_keys[0], ())):
+                old = self._entries.get(old_id)
+                if old is not None and old["normalized"] == normalized:
+                    del self._entries[old_id]
+                    self._unlink(old)
+            self._entries[entry_id] = {
+                "id": entry_id,
+                "normalized": normalized,
+                "shingles": prompt_shingles,
+                "bucket_keys": bucket_keys,
+                "value": value,
+                "expires": time.monotonic() + self.ttl,
+                "cached_at": time.time(),
+            }
+            for key in bucket_keys:
+                self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._unlink(evicted)
+
+    def record_bypass(self) -> None:
+        """Count a request that skipped the cache (use_cache=false)"""
+        with self._lock:
+            self.bypassed += 1
+
+    def _unlink(self, entry: Dict[str, Any]) -> None:
+        for key in entry["bucket_keys"]:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry["id"])
+                if not bucket:
+                    del self._buckets[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "near_duplicate_hits": self.near_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,120 @@
+"""
+Circuit breaker for model calls.
+
+When Ollama is down, restarting or overloaded, every request used to wait
+for its own error or timeout. The breaker counts consecutive failures (errors
+and calls slower than their limit). After `failure_threshold` of them it
+opens: calls fail immediately with `CircuitOpenError` for `recovery_timeout`
+seconds. Then it lets a single probe call through (half-open); success closes
+the circuit, failure opens it again.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the model while the circuit is open"""
+
+
+class CallOutcome:
+    """Shared by a caller that may give up on a call and the call itself, so only one reports it
+
+    A caller that times out reports the failure right away; when the abandoned
+    call returns later, `claim` fails and it must not be counted again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._claimed = False
+
+    def claim(self) -> bool:
+        with self._lock:
+            if self._claimed:
+                return False
+            self._claimed = True
+            return True
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe"""
+
+    def __init__(self, failure_threshold: int = 3, recovery_timeout: float = 15.0, metrics=None):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.metrics = metrics
+        self.state = CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self.transitions: Deque[Dict[str, Any]] = deque(maxlen=20)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str, reason: str) -> None:
+        """Caller holds the lock"""
+        if state == self.state:
+            return
+        self.transitions.append({"from": self.state, "to": state, "reason": reason, "at": time.time()})
+        print(f"⚡ Model circuit {self.state} -> {state} ({reason})")
+        self.state = state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        if self.metrics is not None:
+            self.metrics.incr(f"circuit.{state}")
+
+    def allow(self) -> bool:
+        """Whether a call may go to the model now (claims the probe slot when half-open)"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                self._set_state(HALF_OPEN, "recovery timeout elapsed")
+                self._probe_in_flight = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def check(self) -> None:
+        """Raise CircuitOpenError unless a call is allowed"""
+        if not self.allow():
+            raise CircuitOpenError("Model unavailable (circuit open), retry later")
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self._opened_at < self.recovery_timeout
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            self._set_state(CLOSED, "call succeeded")
+
+    def record_failure(self, reason: str = "call failed") -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+                self._set_state(OPEN, f"probe failed: {reason}")
+            elif self.state == CLOSED and self.failures >= self.failure_threshold:
+                self._set_state(OPEN, f"{self.failures} consecutive failures, last: {reason}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "failure_threshold": self.failure_threshold,
+                "recovery_timeout": self.recovery_timeout,
+                "rejected": self.rejected,
+                "transitions": list(self.transitions),
+            }
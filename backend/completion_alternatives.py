@@ -0,0 +1,138 @@
+"""
+N-best completion alternatives from one completion prompt.
+
+Ollama has no `n` parameter, but it keeps the KV cache of the last prompt
+evaluated on a runner. `sample_alternatives` therefore sends the same prompt
+several times, one request after another: a greedy sample first, then
+`n - 1` temperature samples with different seeds. Only the first request
+pays the prefill; the others re-evaluate at most a token or two of the
+prompt, so N alternatives cost about one completion plus N generations.
+`prefill_tokens` in the result shows whether the cache was actually reused.
+
+Alternatives are de-duplicated after whitespace normalization and ranked by
+a score:
+
+  logprob   - mean token log-probability (length-normalized), when the
+              Ollama server returns `logprobs`
+  agreement - otherwise, the mean over the candidate's tokens of the share of
+              samples that produced the same prefix, i.e. how often the model
+              went down this path. Also length-normalized.
+
+`confidence` is exp(score) for logprobs and the agreement itself otherwise.
+"""
+
+import math
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+GREEDY_BONUS = 0.05  # the greedy sample wins agreement ties
+
+
+def sample_options(n: int, temperature: float = 0.8, top_p: float = 0.95, seed: int = 0) -> List[Dict[str, Any]]:
+    """Options for each sample: greedy first, then seeded temperature samples"""
+    plans = [{"temperature": 0}]
+    for i in range(1, n):
+        plans.append({"temperature": temperature, "top_p": top_p, "seed": seed + i})
+    return plans
+
+
+def _field(response: Any, name: str, default: Any = None) -> Any:
+    try:
+        value = response[name]
+    except (KeyError, TypeError, IndexError):
+        return default
+    return default if value is None else value
+
+
+def mean_logprob(response: Any) -> Optional[float]:
+    """Mean token log-probability of a generate response, or None without logprobs"""
+    tokens = _field(response, "logprobs")
+    if not tokens:
+        return None
+    values = [_field(token, "logprob") for token in tokens]
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else None
+
+
+def normalize(text: str) -> str:
+    """Key used for de-duplication: trailing whitespace and blank edges ignored"""
+    return "\n".join(line.rstrip() for line in text.strip("\n").split("\n")).strip()
+
+
+def agreement(tokens: List[str], samples: List[List[str]]) -> float:
+    """Mean share of samples that start with each prefix of `tokens`"""
+    if not tokens or not samples:
+        return 0.0
+    total = 0.0
+    for i in range(1, len(tokens) + 1):
+        prefix = tokens[:i]
+        total += sum(1 for sample in samples if sample[:i] == prefix) / len(samples)
+    return total / len(tokens)
+
+
+def rank(samples: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """De-duplicate and rank samples of {"text", "logprob", "greedy"}"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for sample in samples:
+        key = normalize(sample["text"])
+        if not key:
+            continue
+        entry = merged.get(key)
+        if entry is None:
+            merged[key] = {"completion": sample["text"], "votes": 1, "greedy": sample["greedy"],
+                           "logprob": sample.get("logprob")}
+            continue
+        entry["votes"] += 1
+        entry["greedy"] = entry["greedy"] or sample["greedy"]
+        if sample.get("logprob") is not None and (entry["logprob"] is None or sample["logprob"] > entry["logprob"]):
+            entry["logprob"] = sample["logprob"]
+
+    use_logprobs = bool(merged) and all(e["logprob"] is not None for e in merged.values())
+    token_samples = [normalize(sample["text"]).split() for sample in samples if normalize(sample["text"])]
+    ranked = []
+    for entry in merged.values():
+        if use_logprobs:
+            score = entry["logprob"]
+            confidence = math.exp(score)
+        else:
+            confidence = agreement(entry["completion"].split(), token_samples)
+            score = confidence + (GREEDY_BONUS if entry["greedy"] else 0.0)
+        ranked.append({
+            "completion": entry["completion"],
+            "score": round(score, 4),
+            "confidence": round(min(confidence, 1.0), 3),
+            "votes": entry["votes"],
+            "greedy": entry["greedy"],
+            "scoring": "logprob" if use_logprobs else "agreement",
+        })
+    ranked.sort(key=lambda a: (a["score"], a["votes"]), reverse=True)
+    return ranked
+
+
+def sample_alternatives(generate: Callable[[Dict[str, Any]], Any], clean: Callable[[str], str], n: int,
+                        deadline: Optional[float] = None, first: Any = None, **sampling) -> Dict[str, Any]:
+    """Draw up to `n` samples of one prompt sequentially and rank them
+
+    `generate(options)` makes one model call for the shared prompt. `first`
+    is an already generated greedy response to reuse. Samples that would
+    start after `deadline` (time.monotonic()) are skipped, and a failing
+    extra sample only ends sampling early.
+    """
+    samples = []
+    prefill_tokens = []
+    for i, options in enumerate(sample_options(n, **sampling)):
+        if i == 0 and first is not None:
+            response = first
+        else:
+            if i > 0 and deadline is not None and time.monotonic() >= deadline:
+                break
+            try:
+                response = generate(options)
+            except Exception:
+                if i == 0:
+                    raise
+                break
+        prefill_tokens.append(_field(response, "prompt_eval_count", 0))
+        samples.append({"text": clean(_field(response, "response", "")), "logprob": mean_logprob(response),
+                        "greedy": i == 0})
+    return {"alternatives": rank(samples), "samples": len(samples), "prefill_tokens": prefill_tokens}
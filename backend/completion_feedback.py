@@ -0,0 +1,175 @@
+"""
+Completion acceptance telemetry and adaptive triggering.
+
+Every `/complete` answer carries a `completion_id`. The editor reports
+whether that completion was `shown`, `accepted` or `dismissed`. The tracker
+keeps shown/accepted counts per language and per *context bucket*, a coarse
+class of the line being completed (comment, string, member access, after a
+keyword, ...). Counts decay, so recent behaviour dominates.
+
+`decide` uses the bucket's acceptance rate to pick how much to spend on the
+next request:
+
+  full  - normal completion route
+  cheap - the "completion.cheap" route (smaller model, shorter num_predict)
+  skip  - no model call at all
+
+Rates are smoothed towards a prior until a bucket has `min_samples` shown
+completions. Skipped buckets still get every `explore_every`-th request
+(served cheaply), so a bucket whose suggestions become useful again can
+recover.
+"""
+
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict
+
+FULL = "full"
+CHEAP = "cheap"
+SKIP = "skip"
+EVENTS = ("shown", "accepted", "dismissed")
+
+KEYWORDS = {"def", "class", "if", "elif", "else", "for", "while", "with", "try", "except", "return", "import",
+            "from", "function", "const", "let", "var", "async", "await", "yield", "raise", "throw", "new",
+            "switch", "case", "fn", "func", "pub", "struct", "interface", "type", "export"}
+LEADING_WORD = re.compile(r"\s*([A-Za-z_]+)")
+
+
+def context_bucket(prompt: str, language: str) -> str:
+    """Coarse class of the line being completed, e.g. "python:comment" or "typescript:keyword:if" """
+    line = prompt.rsplit("\n", 1)[-1]
+    stripped = line.strip()
+    language = (language or "plaintext").lower()
+    if not stripped:
+        kind = "blank"
+    elif stripped.startswith(("#", "//", "/*", "*", "--")):
+        kind = "comment"
+    elif (line.count('"') % 2) or (line.count("'") % 2) or (line.count("`") % 2):
+        kind = "string"
+    elif line.rstrip().endswith("."):
+        kind = "member"
+    elif line.rstrip()[-1] in "([{,":
+        kind = "open_bracket"
+    elif line.rstrip()[-1] in ";:)}]":
+        kind = "line_end"
+    else:
+        match = LEADING_WORD.match(line)
+        word = match.group(1) if match else ""
+        kind = f"keyword:{word}" if word in KEYWORDS else "expression"
+    return f"{language}:{kind}"
+
+
+class AcceptanceTracker:
+    """Shown/accepted statistics per language and context bucket, and the trigger policy"""
+
+    def __init__(self, min_samples: int = 30, skip_below: float = 0.02, cheap_below: float = 0.08,
+                 explore_every: int = 10, prior_rate: float = 0.2, prior_weight: float = 10.0,
+                 half_life: float = 500.0, max_pending: int = 4096, enabled: bool = True):
+        self.min_samples = min_samples
+        self.skip_below = skip_below
+        self.cheap_below = cheap_below
+        self.explore_every = explore_every
+        self.prior_rate = prior_rate
+        self.prior_weight = prior_weight
+        self.half_life = half_life  # shown completions after which old counts weigh half
+        self.max_pending = max_pending
+        self.enabled = enabled
+        self.unknown_events = 0
+        self._lock = threading.Lock()
+        # id -> (language, bucket, issued_at, events seen)
+        self._issued: "OrderedDict[str, tuple[str, str, float, set]]" = OrderedDict()
+        self._buckets: Dict[str, Dict[str, float]] = {}
+        self._languages: Dict[str, Dict[str, float]] = {}
+
+    @staticmethod
+    def _empty() -> Dict[str, float]:
+        return {"shown": 0.0, "accepted": 0.0, "dismissed": 0.0, "requests": 0, "skipped": 0, "cheap": 0}
+
+    def _rate(self, stats: Dict[str, float]) -> float:
+        return (stats["accepted"] + self.prior_rate * self.prior_weight) / (stats["shown"] + self.prior_weight)
+
+    def decide(self, prompt: str, language: str) -> Dict[str, Any]:
+        """{"mode", "bucket", "rate", "samples"} for the next completion request"""
+        bucket = context_bucket(prompt, language)
+        with self._lock:
+            stats = self._buckets.setdefault(bucket, self._empty())
+            totals = self._languages.setdefault(bucket.split(":", 1)[0], self._empty())
+            stats["requests"] += 1
+            totals["requests"] += 1
+            rate = self._rate(stats)
+            mode = FULL
+            if self.enabled and stats["shown"] >= self.min_samples:
+                if rate < self.skip_below:
+                    explore = self.explore_every and stats["requests"] % self.explore_every == 0
+                    mode = CHEAP if explore else SKIP
+                elif rate < self.cheap_below:
+                    mode = CHEAP
+            if mode == SKIP:
+                stats["skipped"] += 1
+                totals["skipped"] += 1
+            elif mode == CHEAP:
+                stats["cheap"] += 1
+                totals["cheap"] += 1
+        return {"mode": mode, "bucket": bucket, "rate": round(rate, 4), "samples": int(stats["shown"])}
+
+    def issue(self, language: str, bucket: str) -> str:
+        """Register a completion sent to the editor; returns its completion_id"""
+        completion_id = uuid.uuid4().hex[:16]
+        with self._lock:
+            self._issued[completion_id] = ((language or "plaintext").lower(), bucket, time.time(), set())
+            while len(self._issued) > self.max_pending:
+                self._issued.popitem(last=False)
+        return completion_id
+
+    def _count(self, stats: Dict[str, float], event: str) -> None:
+        if event == "shown" and self.half_life:
+            decay = 0.5 ** (1 / self.half_life)
+            for name in ("shown", "accepted", "dismissed"):
+                stats[name] *= decay
+        stats[event] += 1
+
+    def record(self, completion_id: str, event: str) -> bool:
+        """Count one editor event; False for unknown ids or events"""
+        with self._lock:
+            entry = self._issued.get(completion_id)
+            if entry is None or event not in EVENTS:
+                self.unknown_events += 1
+                return False
+            language, bucket, _, seen = entry
+            if event in seen:
+                return True
+            # An accepted or dismissed completion was necessarily shown
+            events = ["shown"] if event != "shown" and "shown" not in seen else []
+            events.append(event)
+            for name in events:
+                seen.add(name)
+                self._count(self._buckets.setdefault(bucket, self._empty()), name)
+                self._count(self._languages.setdefault(language, self._empty()), name)
+            if event != "shown":
+                self._issued.pop(completion_id, None)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        def summarize(stats: Dict[str, float]) -> Dict[str, Any]:
+            return {
+                "shown": round(stats["shown"], 1),
+                "accepted": round(stats["accepted"], 1),
+                "dismissed": round(stats["dismissed"], 1),
+                "acceptance_rate": round(stats["accepted"] / stats["shown"], 4) if stats["shown"] else None,
+                "requests": int(stats["requests"]),
+                "skipped": int(stats["skipped"]),
+                "cheap": int(stats["cheap"]),
+            }
+
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "pending": len(self._issued),
+                "unknown_events": self.unknown_events,
+                "languages": {name: summarize(s) for name, s in sorted(self._languages.items())},
+                "buckets": {name: {**summarize(s), "smoothed_rate": round(self._rate(s), 4)}
+                            for name, s in sorted(self._buckets.items())},
+            }
@@ -0,0 +1,131 @@
+"""
+Local completion suggestions for when the model is unavailable.
+
+Used by `/complete` while the model circuit is open or after a failed or
+timed-out model call. Sources, tried in order:
+
+1. recent model completions for the same current line,
+2. keyword templates (e.g. `for` -> loop skeleton) for the language,
+3. identifiers from the open file that extend the word being typed.
+
+Everything is in-memory string work, so suggestions return well under a
+millisecond for typical contexts.
+"""
+
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, Optional
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+TRAILING_WORD = re.compile(r"([A-Za-z_][A-Za-z0-9_]*)$")
+CONTEXT_SCAN_CHARS = 8000  # tail of the open file scanned for identifiers
+
+PYTHON_TEMPLATES = {
+    "def": " function_name(params):\n    pass",
+    "class": " ClassName:\n    def __init__(self):\n        pass",
+    "if": " condition:\n    pass",
+    "elif": " condition:\n    pass",
+    "for": " item in items:\n    pass",
+    "while": " condition:\n    pass",
+    "with": " open(path) as f:\n    pass",
+    "try": ":\n    pass\nexcept Exception as e:\n    raise",
+    "import": " module",
+    "from": " module import name",
+    "return": " result",
+}
+C_LIKE_TEMPLATES = {
+    "function": " name(params) {\n    return result;\n}",
+    "const": " name = value;",
+    "let": " name = value;",
+    "var": " name = value;",
+    "if": " (condition) {\n    // Code block\n}",
+    "for": " (let i = 0; i < array.length; i++) {\n    // Loop body\n}",
+    "while": " (condition) {\n    // Loop body\n}",
+    "import": " { Component } from \"library\";",
+    "class": " ClassName {\n    constructor() {\n        // Initialize\n    }\n}",
+    "return": " result;",
+}
+TEMPLATES = {
+    "python": PYTHON_TEMPLATES,
+    "javascript": C_LIKE_TEMPLATES,
+    "typescript": C_LIKE_TEMPLATES,
+    "javascriptreact": C_LIKE_TEMPLATES,
+    "typescriptreact": C_LIKE_TEMPLATES,
+}
+
+
+def current_line(prompt: str) -> str:
+    return prompt.rsplit("\n", 1)[-1]
+
+
+class DegradedCompleter:
+    """Fallback completions from recent answers, file identifiers and templates"""
+
+    def __init__(self, max_recent: int = 2048):
+        self.max_recent = max_recent
+        self.served: Counter = Counter()
+        self._lock = threading.Lock()
+        self._recent: "OrderedDict[tuple[str, str], str]" = OrderedDict()
+
+    def remember(self, language: str, prompt: str, completion: str) -> None:
+        """Keep a model completion for the prompt's current line"""
+        line = current_line(prompt).strip()
+        if not line or not completion:
+            return
+        with self._lock:
+            self._recent[(language, line)] = completion
+            self._recent.move_to_end((language, line))
+            while len(self._recent) > self.max_recent:
+                self._recent.popitem(last=False)
+
+    def _from_recent(self, language: str, line: str) -> Optional[str]:
+        with self._lock:
+            return self._recent.get((language, line.strip()))
+
+    @staticmethod
+    def _from_identifiers(line: str, context: str) -> Optional[str]:
+        match = TRAILING_WORD.search(line)
+        if not match or len(match.group(1)) < 2:
+            return None
+        partial = match.group(1)
+        counts = Counter(word for word in IDENTIFIER.findall(context[-CONTEXT_SCAN_CHARS:])
+                         if len(word) > len(partial) and word.startswith(partial))
+        if not counts:
+            return None
+        best = max(counts.items(), key=lambda item: (item[1], -len(item[0])))[0]
+        return best[len(partial):]
+
+    @staticmethod
+    def _from_templates(language: str, line: str) -> Optional[str]:
+        templates = TEMPLATES.get((language or "").lower())
+        if not templates:
+            return None
+        match = TRAILING_WORD.search(line.rstrip())
+        template = templates.get(match.group(1)) if match else None
+        if template is None:
+            return None
+        if line.endswith(" "):
+            template = template.lstrip(" ")
+        return template
+
+    def suggest(self, prompt: str, context: str, language: str) -> Dict[str, str]:
+        """{"completion", "source"}; source is "recent", "template", "identifier" or "none" """
+        line = current_line(prompt)
+        for source, lookup in (
+            ("recent", lambda: self._from_recent(language, line)),
+            ("template", lambda: self._from_templates(language, line)),
+            ("identifier", lambda: self._from_identifiers(line, context)),
+        ):
+            completion = lookup()
+            if completion:
+                with self._lock:
+                    self.served[source] += 1
+                return {"completion": completion, "source": source}
+        with self._lock:
+            self.served["none"] += 1
+        return {"completion": "", "source": "none"}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"recent_entries": len(self._recent), **{f"served_{k}": v for k, v in self.served.items()}}
@@ -0,0 +1,135 @@
+"""
+Edit-oriented output for `fix_code` / `optimize_code`.
+
+Instead of reproducing the whole corrected code, the model answers with
+SEARCH/REPLACE blocks (or a unified diff). The edits are validated against
+the original code and applied on the server, so the response carries both
+the patch and the resulting code while the model only writes the changed
+lines.
+"""
+
+import difflib
+import re
+from typing import Dict, List, Optional, Tuple
+
+from file_batch import PatchError, apply_unified_diff
+
+SEARCH_REPLACE_BLOCK = re.compile(
+    r'<<<<<<< SEARCH\n(.*?)\n?=======\n(.*?)\n?>>>>>>> REPLACE',
+    re.DOTALL,
+)
+DIFF_FENCE = re.compile(r'```(?:diff|patch)\n(.*?)```', re.DOTALL)
+
+EDIT_INSTRUCTIONS = """Answer with the minimal edits only, using one or more SEARCH/REPLACE blocks:
+
+<<<<<<< SEARCH
+exact lines copied from the original code
+=======
+replacement lines
+>>>>>>> REPLACE
+
+Rules:
+- SEARCH text must match the original code exactly, including indentation.
+- Include just enough lines to make each SEARCH unique; do not repeat unchanged code.
+- Put the blocks first, then a short explanation (at most a few sentences)."""
+
+
+EDIT_ACTIONS = {
+    "fix_code": "find and fix the bugs in",
+    "optimize_code": "optimize",
+}
+
+
+def build_edit_prompt(action: str, language: str, code: str, context: str) -> str:
+    """Edit-mode prompt for an action in EDIT_ACTIONS"""
+    return f"""Please {EDIT_ACTIONS[action]} this {language} code:
+
+```{language}
+{code}
+```
+
+{EDIT_INSTRUCTIONS}
+
+Context: {context}"""
+
+
+class EditError(ValueError):
+    """Model edits that cannot be applied to the original code"""
+
+
+def parse_search_replace(text: str) -> List[Tuple[str, str]]:
+    return [(search, replace) for search, replace in SEARCH_REPLACE_BLOCK.findall(text)]
+
+
+def _find_unique(code: str, search: str) -> Tuple[int, int]:
+    """Locate `search` in `code`; falls back to whitespace-insensitive line matching"""
+    # Exact matches only count when they start and end at a line boundary
+    end_anchor = '' if search.endswith('\n') else r'(?=\n|$)'
+    starts = [m.start() for m in re.finditer(r'(?m)^' + re.escape(search) + end_anchor, code)]
+    if len(starts) > 1:
+        raise EditError(f"SEARCH block is ambiguous: {search.splitlines()[0][:80]!r}")
+    if starts:
+        return starts[0], starts[0] + len(search)
+
+    # Models often get indentation or trailing spaces slightly wrong
+    code_lines = code.splitlines(keepends=True)
+    search_lines = [line.strip() for line in search.splitlines()]
+    matches = []
+    for start in range(len(code_lines) - len(search_lines) + 1):
+        window = code_lines[start:start + len(search_lines)]
+        if [line.strip() for line in window] == search_lines:
+            matches.append(start)
+    if len(matches) != 1:
+        first = search.splitlines()[0][:80] if search else ""
+        raise EditError(f"SEARCH block {'is ambiguous' if matches else 'not found'}: {first!r}")
+    begin = sum(len(line) for line in code_lines[:matches[0]])
+    end = begin + sum(len(line) for line in code_lines[matches[0]:matches[0] + len(search_lines)])
+    if code_lines[matches[0] + len(search_lines) - 1].endswith('\n'):
+        end -= 1
+    return begin, end
+
+
+def apply_search_replace(code: str, edits: List[Tuple[str, str]]) -> str:
+    for search, replace in edits:
+        if not search.strip():
+            raise EditError("Empty SEARCH block")
+        begin, end = _find_unique(code, search)
+        code = code[:begin] + replace + code[end:]
+    return code
+
+
+def unified_diff(original: str, updated: str, name: str = "code") -> str:
+    return "".join(difflib.unified_diff(
+        original.splitlines(keepends=True), updated.splitlines(keepends=True),
+        fromfile=f"a/{name}", tofile=f"b/{name}",
+    ))
+
+
+def apply_model_edits(original: str, response: str) -> Optional[Dict[str, str]]:
+    """Apply the edits in a model response to `original`
+
+    Returns {"format", "patch", "result", "explanation"}, or None when the
+    response contains no edits. Raises EditError when edits don't apply.
+    """
+    edits = parse_search_replace(response)
+    if edits:
+        result = apply_search_replace(original, edits)
+        explanation = SEARCH_REPLACE_BLOCK.sub("", response)
+        edit_format = "search_replace"
+    else:
+        diff_match = DIFF_FENCE.search(response)
+        if not diff_match:
+            return None
+        try:
+            result = apply_unified_diff(original, diff_match.group(1))
+        except PatchError as e:
+            raise EditError(str(e))
+        explanation = DIFF_FENCE.sub("", response)
+        edit_format = "unified_diff"
+
+    return {
+        "format": edit_format,
+        "patch": unified_diff(original, result),
+        "result": result,
+        "explanation": explanation.strip(),
+    }
@@ -0,0 +1,284 @@
+"""
+Atomic multi-file operations and server-side unified-diff patching.
+
+A batch is applied in two phases. First every operation is validated and its
+new content computed in memory (expected hashes checked, patches applied).
+Operations on the same path are planned against the result of the earlier
+ones, so two patches to one file both apply. Then the changes are committed
+one by one through temp-file + rename, and if any commit fails the ones
+already committed are rolled back, including directories they created.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Union
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+
+class PatchError(ValueError):
+    """A unified diff that does not apply cleanly"""
+
+
+class BatchError(Exception):
+    """An operation in a batch failed; `index` is its position in the batch"""
+
+    def __init__(self, index: int, message: str):
+        super().__init__(message)
+        self.index = index
+
+
+def file_hash(content: Union[str, bytes]) -> str:
+    data = content if isinstance(content, bytes) else content.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def apply_unified_diff(original: str, patch: str) -> str:
+    """Apply a unified diff (single file) to `original` and return the result
+
+    File headers (---/+++) are optional. Context and removed lines must match
+    the original exactly, otherwise PatchError is raised.
+    """
+    source = original.splitlines(keepends=True)
+    result: List[str] = []
+    position = 0  # next unconsumed line in `source`
+    patch_lines = patch.splitlines(keepends=True)
+    i = 0
+    saw_hunk = False
+
+    while i < len(patch_lines):
+        header = HUNK_HEADER.match(patch_lines[i])
+        if not header:
+            if patch_lines[i].startswith(('---', '+++', 'diff ', 'index ')) or not patch_lines[i].strip():
+                i += 1
+                continue
+            raise PatchError(f"Unexpected line outside hunk: {patch_lines[i].rstrip()}")
+
+        saw_hunk = True
+        old_start = int(header.group(1))
+        hunk_start = max(old_start - 1, 0) if header.group(2) != '0' else old_start
+        if hunk_start < position:
+            raise PatchError(f"Overlapping or out-of-order hunk at line {old_start}")
+        result.extend(source[position:hunk_start])
+        position = hunk_start
+        i += 1
+
+        while i < len(patch_lines) and not patch_lines[i].startswith('@@'):
+            line = patch_lines[i]
+            tag, text = line[:1], line[1:]
+            if line.startswith('\\'):  # "\ No newline at end of file"
+                if result and result[-1].endswith('\n'):
+                    result[-1] = result[-1][:-1]
+                i += 1
+                continue
+            if tag in (' ', '-'):
+                if position >= len(source) or source[position].rstrip('\r\n') != text.rstrip('\r\n'):
+                    found = source[position].rstrip('\n') if position < len(source) else '<EOF>'
+                    raise PatchError(f"Context mismatch at line {position + 1}: expected {text.rstrip()!r}, found {found!r}")
+                if tag == ' ':
+                    result.append(source[position])
+                position += 1
+            elif tag == '+':
+                result.append(text if text.endswith('\n') else text + '\n')
+            elif not line.strip():
+                # Blank context line whose leading space was stripped by an editor
+                if position < len(source) and not source[position].strip():
+                    result.append(source[position])
+                    position += 1
+            else:
+                break
+            i += 1
+
+    if not saw_hunk:
+        raise PatchError("Patch contains no hunks")
+    result.extend(source[position:])
+    return ''.join(result)
+
+
+def atomic_write(path: str, content: Union[str, bytes]) -> None:
+    """Write `content` (text as UTF-8, or raw bytes) to a temp file next to `path`, fsync, then rename over it"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.gemmapilot-', suffix='.tmp')
+    try:
+        text = isinstance(content, str)
+        with os.fdopen(fd, 'w' if text else 'wb', encoding='utf-8' if text else None, newline='' if text else None) as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_snapshot(path: str) -> Optional[bytes]:
+    """Raw file content for hashing and rollback; binary files are fine"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def plan_operation(index: int, op: Dict[str, Any], planned: Optional[Dict[str, Optional[str]]] = None) -> Dict[str, Any]:
+    """Validate one operation and compute its effect without touching the disk
+
+    `planned` maps absolute paths to the content earlier operations in the
+    batch leave behind (None for deleted); it is updated with this one.
+    `original` is the content to restore on rollback: text for a path an
+    earlier operation planned, otherwise the bytes on disk.
+    """
+    operation = op.get('operation')
+    path = op.get('file_path', '')
+    key = os.path.abspath(path)
+    if planned is not None and key in planned:
+        original = planned[key]
+        exists = original is not None
+    else:
+        try:
+            original = _read_snapshot(path) if operation != 'mkdir' and not os.path.isdir(path) else None
+        except OSError as e:
+            raise BatchError(index, f"{path}: {e}")
+        exists = os.path.exists(path)
+
+    expected_hash = op.get('expected_hash')
+    if expected_hash:
+        actual = file_hash(original) if original is not None else None
+        if actual != expected_hash:
+            raise BatchError(index, f"{path}: expected hash {expected_hash}, found {actual or 'missing file'}")
+
+    if operation == 'create':
+        if exists:
+            raise BatchError(index, f"{path}: file already exists")
+        new_content = op.get('content') or ""
+    elif operation == 'write':
+        new_content = op.get('content') or ""
+    elif operation == 'patch':
+        if original is None:
+            raise BatchError(index, f"{path}: file not found")
+        try:
+            text = original.decode('utf-8') if isinstance(original, bytes) else original
+        except UnicodeDecodeError:
+            raise BatchError(index, f"{path}: not a UTF-8 text file, cannot patch")
+        try:
+            new_content = apply_unified_diff(text, op.get('patch') or "")
+        except PatchError as e:
+            raise BatchError(index, f"{path}: {e}")
+    elif operation == 'delete':
+        if original is None:
+            raise BatchError(index, f"{path}: file not found")
+        new_content = None
+    elif operation == 'mkdir':
+        new_content = None
+    else:
+        raise BatchError(index, f"Unknown operation: {operation}")
+
+    if planned is not None and operation != 'mkdir':
+        planned[key] = new_content
+    return {
+        "index": index,
+        "operation": operation,
+        "file_path": path,
+        "original": original,
+        "existed": exists,
+        "new_content": new_content,
+    }
+
+
+def _missing_dirs(directory: str) -> List[str]:
+    """`directory` and its ancestors that do not exist yet, deepest first"""
+    missing = []
+    current = os.path.abspath(directory)
+    while current and not os.path.exists(current):
+        missing.append(current)
+        parent = os.path.dirname(current)
+        if parent == current:
+            break
+        current = parent
+    return missing
+
+
+def _commit(plan: Dict[str, Any]) -> None:
+    operation, path = plan["operation"], plan["file_path"]
+    target = path if operation == 'mkdir' else os.path.dirname(os.path.abspath(path))
+    plan["created_dirs"] = _missing_dirs(target)
+    if operation == 'mkdir':
+        os.makedirs(path, exist_ok=True)
+    elif operation == 'delete':
+        os.remove(path)
+    else:
+        atomic_write(path, plan["new_content"])
+
+
+def _rollback(plan: Dict[str, Any]) -> None:
+    operation, path = plan["operation"], plan["file_path"]
+    if operation != 'mkdir':
+        if plan["original"] is not None:
+            atomic_write(path, plan["original"])
+        elif os.path.exists(path):
+            os.remove(path)
+    for directory in plan.get("created_dirs", []):
+        if os.path.isdir(directory) and not os.listdir(directory):
+            os.rmdir(directory)
+
+
+def apply_batch(operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply all operations or none; returns per-file results with timings"""
+    results = [{"file_path": op.get('file_path', ''), "operation": op.get('operation')} for op in operations]
+    plans = []
+    planned: Dict[str, Optional[str]] = {}
+
+    # Phase 1: validate and compute new contents
+    for index, op in enumerate(operations):
+        started = time.perf_counter()
+        try:
+            plans.append(plan_operation(index, op, planned))
+        except BatchError as e:
+            results[index].update(success=False, error=str(e))
+            return {"success": False, "failed_index": index, "error": str(e), "rolled_back": False, "results": results}
+        results[index]["plan_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+    # Phase 2: commit, rolling back on the first failure
+    committed = []
+    for plan in plans:
+        index = plan["index"]
+        started = time.perf_counter()
+        try:
+            _commit(plan)
+        except Exception as e:
+            results[index].update(success=False, error=str(e))
+            rollback_errors = []
+            # The failed operation's file is untouched, but directories made for it are not
+            for directory in plan.get("created_dirs", []):
+                if os.path.isdir(directory) and not os.listdir(directory):
+                    os.rmdir(directory)
+            for done in reversed(committed):
+                try:
+                    _rollback(done)
+                    results[done["index"]]["rolled_back"] = True
+                except Exception as rollback_error:
+                    rollback_errors.append(f"{done['file_path']}: {rollback_error}")
+            return {
+                "success": False,
+                "failed_index": index,
+                "error": str(e),
+                "rolled_back": True,
+                "rollback_errors": rollback_errors,
+                "results": results,
+            }
+        committed.append(plan)
+        new_content = plan["new_content"]
+        results[index].update(
+            success=True,
+            commit_ms=round((time.perf_counter() - started) * 1000, 3),
+            new_hash=file_hash(new_content) if new_content is not None else None,
+        )
+
+    return {"success": True, "rolled_back": False, "results": results}
@@ -0,0 +1,98 @@
+"""
+Windowed file reads backed by mmap and a cached line-offset index.
+
+The index for a file is built once (one pass over the mapped bytes) and reused
+until the file's mtime or size changes, so reading any line range afterwards
+only touches the bytes of that range.
+"""
+
+import mmap
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Tuple
+
+
+class LineIndex:
+    """Byte offsets of the start of every line in a file"""
+
+    def __init__(self, path: str):
+        stat = os.stat(path)
+        self.path = path
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+        # offsets[i] is where line i (0-based) starts; the final entry is EOF
+        self.offsets = array('q', [0])
+        if self.size:
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pos = mm.find(b'\n')
+                while pos != -1:
+                    self.offsets.append(pos + 1)
+                    pos = mm.find(b'\n', pos + 1)
+            if self.offsets[-1] != self.size:
+                self.offsets.append(self.size)
+
+    @property
+    def line_count(self) -> int:
+        return len(self.offsets) - 1
+
+    def is_current(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return stat.st_mtime_ns == self.mtime_ns and stat.st_size == self.size
+
+
+class FileReader:
+    """LRU cache of line indexes with O(range) line reads"""
+
+    def __init__(self, max_files: int = 64):
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._indexes: "OrderedDict[str, LineIndex]" = OrderedDict()
+
+    def index(self, path: str) -> LineIndex:
+        path = os.path.abspath(path)
+        with self._lock:
+            cached = self._indexes.get(path)
+            if cached is not None and cached.is_current():
+                self._indexes.move_to_end(path)
+                return cached
+
+        line_index = LineIndex(path)
+        with self._lock:
+            self._indexes[path] = line_index
+            self._indexes.move_to_end(path)
+            while len(self._indexes) > self.max_files:
+                self._indexes.popitem(last=False)
+        return line_index
+
+    def read_lines(self, path: str, start: int, end: int) -> Tuple[str, LineIndex]:
+        """Return lines [start, end) (0-based) decoded as UTF-8, plus the file's index"""
+        line_index = self.index(path)
+        start = max(0, min(start, line_index.line_count))
+        end = max(start, min(end, line_index.line_count))
+        if start == end:
+            return "", line_index
+
+        begin, finish = line_index.offsets[start], line_index.offsets[end]
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = mm[begin:finish]
+        return data.decode('utf-8'), line_index
+
+    def invalidate(self, path: str) -> None:
+        with self._lock:
+            self._indexes.pop(os.path.abspath(path), None)
+
+
+def centered_window(center_line: int, max_lines: int, total_lines: int) -> Tuple[int, int]:
+    """0-based [start, end) window of at most `max_lines` lines centred on `center_line` (0-based)"""
+    start = max(0, center_line - max_lines // 2)
+    end = min(total_lines, start + max_lines)
+    start = max(0, end - max_lines)
+    return start, end
+
+
+file_reader = FileReader()
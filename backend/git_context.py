@@ -0,0 +1,322 @@
+"""
+Prompt context built from the uncommitted change set of a git workspace.
+
+For review questions ("what did I break?") the useful context is what
+changed, not the top of the current file and a directory tree. `GitContext`
+runs `git status` and `git diff HEAD` for a workspace and formats the changed
+hunks (with a configurable number of surrounding lines) together with the
+signatures of the functions and classes that contain them.
+
+Git calls are cached. The status is keyed on the mtimes of `.git/HEAD`, the
+branch ref and `.git/index`, and is re-checked at most every
+`status_interval` seconds so newly edited files show up. The diff is keyed on
+the status plus the mtime/size of every changed file, so an unchanged work
+tree costs a handful of `stat` calls instead of a `git diff`.
+"""
+
+import os
+import re
+import subprocess
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from cache import cache_key
+from symbol_index import extract_symbols
+
+EMPTY_TREE = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"  # diff base before the first commit
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+GIT_TIMEOUT = 10
+# Lexical extractors only see a definition's first line; these kinds are assumed to
+# extend down to the next symbol, one-line kinds (constants, type aliases) are not
+BLOCK_KINDS = {"function", "method", "class", "struct", "interface", "trait", "enum", "impl"}
+
+
+class NotAGitRepository(ValueError):
+    """The workspace is not inside a git work tree"""
+
+
+def run_git(cwd: str, *args: str) -> str:
+    # No optional locks: `git status` would otherwise rewrite the index and invalidate our cache key
+    result = subprocess.run(["git", "--no-optional-locks", "-c", "core.quotepath=off", *args], cwd=cwd, capture_output=True,
+                            text=True, errors="replace", timeout=GIT_TIMEOUT)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"git {args[0]} failed")
+    return result.stdout
+
+
+def _mtime(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def _file_state(path: str) -> Tuple[int, int]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return (0, -1)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def parse_status(status: str) -> List[Dict[str, str]]:
+    """`git status --porcelain` lines as {"code", "path"} (renames use the new path)"""
+    entries = []
+    for line in status.splitlines():
+        if len(line) < 4:
+            continue
+        path = line[3:]
+        if " -> " in path:
+            path = path.split(" -> ", 1)[1]
+        entries.append({"code": line[:2], "path": path.strip('"')})
+    return entries
+
+
+def split_diff(diff: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Hunks per file path: {"header", "start", "end", "text"}
+
+    `start`/`end` are the new-side line numbers of the changed lines, without
+    the surrounding context (a deletion counts as the line it precedes).
+    """
+    files: Dict[str, List[Dict[str, Any]]] = {}
+    current: Optional[List[Dict[str, Any]]] = None
+    hunk: Optional[Dict[str, Any]] = None
+    new_line = 0
+    for line in diff.split("\n"):
+        if line.startswith("diff --git "):
+            current, hunk = None, None
+            continue
+        if line.startswith("+++ ") and hunk is None:
+            path = line[4:]
+            if path != "/dev/null":
+                current = files.setdefault(path[2:] if path.startswith("b/") else path, [])
+            continue
+        if line.startswith("--- ") and hunk is None:
+            old = line[4:]
+            if old != "/dev/null":
+                # Deleted files have no "+++ b/" path; keep them under the old path
+                current = files.setdefault(old[2:] if old.startswith("a/") else old, [])
+            continue
+        match = HUNK_HEADER.match(line)
+        if match and current is not None:
+            new_line = int(match.group(1))
+            hunk = {"header": line, "start": None, "end": None, "lines": [line]}
+            current.append(hunk)
+            continue
+        if hunk is not None and current is not None and line[:1] in (" ", "+", "-", "\\"):
+            hunk["lines"].append(line)
+            if line[:1] in ("+", "-"):
+                if hunk["start"] is None:
+                    hunk["start"] = new_line
+                hunk["end"] = new_line
+            if line[:1] in (" ", "+"):
+                new_line += 1
+    for hunks in files.values():
+        for hunk in hunks:
+            hunk["text"] = "\n".join(hunk.pop("lines"))
+            if hunk["start"] is None:
+                hunk["start"] = hunk["end"] = int(HUNK_HEADER.match(hunk["header"]).group(1))
+    return files
+
+
+def enclosing_symbols(path: str, hunks: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """Innermost definition containing each hunk, per hunk
+
+    Without end lines (lexical extractors) the nearest function or class
+    above the hunk stands in for the one containing it.
+    """
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            source = f.read()
+    except OSError:
+        return [None] * len(hunks)
+    extracted = extract_symbols(path, source)
+    symbols = extracted["symbols"] if extracted else []
+    ranged = extracted is not None and extracted["language"] == "python"
+    found = []
+    for hunk in hunks:
+        best = None
+        for symbol in symbols:
+            if symbol["line"] > hunk["end"]:
+                continue
+            end = symbol.get("end_line", symbol["line"])
+            if end >= hunk["start"] or (not ranged and symbol["kind"] in BLOCK_KINDS):
+                if best is None or symbol["line"] >= best["line"]:
+                    best = symbol
+        found.append(best)
+    return found
+
+
+class GitContext:
+    """Cached `git status` / `git diff` context for one workspace"""
+
+    def __init__(self, workspace_path: str, status_interval: float = 2.0, max_chars: int = 24000,
+                 max_untracked_lines: int = 200):
+        self.workspace_path = os.path.abspath(workspace_path)
+        self.status_interval = status_interval
+        self.max_chars = max_chars
+        self.max_untracked_lines = max_untracked_lines
+        self.git_calls = 0
+        self.hits = 0
+        try:
+            self.root = run_git(self.workspace_path, "rev-parse", "--show-toplevel").strip()
+            self.git_dir = run_git(self.workspace_path, "rev-parse", "--absolute-git-dir").strip()
+        except (OSError, RuntimeError, subprocess.TimeoutExpired) as e:
+            raise NotAGitRepository(f"{workspace_path} is not a git work tree: {e}")
+        self._lock = threading.Lock()
+        self._status: Optional[Tuple[Tuple, float, str, List[Dict[str, str]]]] = None
+        self._diffs: Dict[int, Tuple[Tuple, Dict[str, Any]]] = {}
+
+    def _git(self, *args: str) -> str:
+        self.git_calls += 1
+        return run_git(self.workspace_path, *args)
+
+    def repo_state(self) -> Tuple[int, int, int]:
+        """(HEAD, branch ref, index) mtimes"""
+        head_path = os.path.join(self.git_dir, "HEAD")
+        ref_mtime = 0
+        try:
+            with open(head_path, "r", encoding="utf-8") as f:
+                head = f.read().strip()
+            if head.startswith("ref: "):
+                ref_mtime = _mtime(os.path.join(self.git_dir, head[5:])) or _mtime(os.path.join(self.git_dir, "packed-refs"))
+        except OSError:
+            pass
+        return (_mtime(head_path), ref_mtime, _mtime(os.path.join(self.git_dir, "index")))
+
+    def status(self) -> Tuple[str, List[Dict[str, str]]]:
+        """Porcelain status limited to the workspace, re-run when HEAD/index change or it is stale"""
+        state = self.repo_state()
+        now = time.monotonic()
+        with self._lock:
+            if self._status and self._status[0] == state and now - self._status[1] < self.status_interval:
+                return self._status[2], self._status[3]
+        text = self._git("status", "--porcelain=v1", "--untracked-files=all", "--", ".")
+        entries = parse_status(text)
+        with self._lock:
+            self._status = (state, now, text, entries)
+        return text, entries
+
+    def context(self, context_lines: int = 3) -> Dict[str, Any]:
+        """{"text", "key", "files", "hunks"} describing the uncommitted changes"""
+        status_text, entries = self.status()
+        paths = [os.path.join(self.root, entry["path"]) for entry in entries]
+        key = (self.repo_state(), status_text, tuple(_file_state(path) for path in paths))
+        with self._lock:
+            cached = self._diffs.get(context_lines)
+            if cached and cached[0] == key:
+                self.hits += 1
+                return cached[1]
+
+        diff = ""
+        if entries:
+            args = ["--no-color", "--no-ext-diff", f"--unified={max(0, context_lines)}", "--", "."]
+            try:
+                diff = self._git("diff", "HEAD", *args)
+            except RuntimeError:
+                diff = self._git("diff", EMPTY_TREE, *args)  # no commits yet
+        result = self._format(status_text, entries, split_diff(diff))
+        result["key"] = cache_key(*key)[:16]
+        with self._lock:
+            self._diffs[context_lines] = (key, result)
+        return result
+
+    def _format(self, status_text: str, entries: List[Dict[str, str]],
+                hunks_by_file: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+        parts = [f"git status:\n{status_text.rstrip()}" if status_text.strip() else "git status: clean"]
+        hunk_count = 0
+        truncated = 0
+        size = len(parts[0])
+        for entry in entries:
+            path = entry["path"]
+            full_path = os.path.join(self.root, path)
+            if entry["code"] == "??":
+                block = self._untracked_block(path, full_path, self.max_chars - size)
+                if block is None:
+                    truncated += 1
+                    continue
+            elif path in hunks_by_file:
+                block = self._diff_block(path, full_path, hunks_by_file[path])
+                hunk_count += len(hunks_by_file[path])
+            else:
+                continue
+            if not block:
+                continue
+            if size + len(block) > self.max_chars:
+                truncated += 1
+                continue
+            parts.append(block)
+            size += len(block)
+        if truncated:
+            parts.append(f"... ({truncated} more changed files not shown)")
+        return {"text": "\n\n".join(parts), "files": len(entries), "hunks": hunk_count}
+
+    def _diff_block(self, path: str, full_path: str, hunks: List[Dict[str, Any]]) -> str:
+        lines = [f"--- {path}"]
+        for hunk, symbol in zip(hunks, enclosing_symbols(full_path, hunks)):
+            if symbol is not None:
+                lines.append(f"In {symbol['signature']} (line {symbol['line']}):")
+            lines.append(hunk["text"])
+        return "\n".join(lines)
+
+    def _untracked_block(self, path: str, full_path: str, budget: int) -> Optional[str]:
+        """First lines of a new file, or None when they do not fit in `budget` characters
+
+        The file is read line by line and reading stops at the line or
+        character limit, so a large untracked file is never loaded whole.
+        """
+        if not os.path.isfile(full_path):
+            return ""
+        header = f"--- {path} (new file)"
+        size = len(header)
+        shown = []
+        more = False
+        try:
+            with open(full_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if len(shown) >= self.max_untracked_lines:
+                        more = True
+                        break
+                    line = "+" + line.rstrip("\n")
+                    size += len(line) + 1
+                    if size > budget:
+                        return None
+                    shown.append(line)
+        except (OSError, UnicodeDecodeError):
+            return f"--- {path} (new file, not shown)"
+        if more:
+            shown.append("... (more lines not shown)")
+        return "\n".join([header] + shown)
+
+    def stats(self) -> Dict[str, int]:
+        return {"git_calls": self.git_calls, "hits": self.hits}
+
+
+class GitContextRegistry:
+    """One GitContext per workspace"""
+
+    def __init__(self, status_interval: float = 2.0, max_chars: int = 24000):
+        self.status_interval = status_interval
+        self.max_chars = max_chars
+        self._contexts: Dict[str, GitContext] = {}
+        self._lock = threading.Lock()
+
+    def get(self, workspace_path: str) -> GitContext:
+        workspace_path = os.path.abspath(workspace_path)
+        with self._lock:
+            context = self._contexts.get(workspace_path)
+        if context is None:
+            context = GitContext(workspace_path, self.status_interval, self.max_chars)
+            with self._lock:
+                context = self._contexts.setdefault(workspace_path, context)
+        return context
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            contexts = list(self._contexts.values())
+        return {
+            "workspaces": len(contexts),
+            "git_calls": sum(c.git_calls for c in contexts),
+            "hits": sum(c.hits for c in contexts),
+        }
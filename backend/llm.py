@@ -0,0 +1,133 @@
+"""
+Single entry point for model calls.
+
+All endpoints call the model through `LLMClient` with a route name, so model
+selection, generation options and latency tracking live in one place instead
+of being repeated around every `ollama.chat` / `ollama.generate` call.
+
+The calls themselves go to a provider: Ollama by default, or the recording
+and replay providers from `trace_replay`.
+"""
+
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import ollama
+
+from circuit_breaker import CallOutcome, CircuitBreaker
+from model_router import ModelRouter
+
+
+class OllamaProvider:
+    """Provider backed by the local Ollama server"""
+
+    def chat(self, route: str, **kwargs):
+        return ollama.chat(**kwargs)
+
+    def generate(self, route: str, **kwargs):
+        return ollama.generate(**kwargs)
+
+    def embed(self, route: str, **kwargs):
+        return ollama.embed(**kwargs)
+
+
+class LLMClient:
+    """Routes chat/generate calls to a provider and records their latency
+
+    With a circuit breaker, calls fail fast with CircuitOpenError while the
+    model is considered down. Errors count as failures, and so do calls
+    slower than `slow_after` seconds (per call, default `slow_call_seconds`).
+    A caller that gives up on a call passes an `outcome` and claims it before
+    reporting the failure itself, so the call is not counted twice. Background
+    work passes `use_breaker=False` so it neither probes nor trips the breaker.
+    """
+
+    def __init__(self, router: ModelRouter, keep_alive: Optional[str] = None, provider=None,
+                 breaker: Optional[CircuitBreaker] = None, slow_call_seconds: float = 60.0):
+        self.router = router
+        self.keep_alive = keep_alive
+        self.provider = provider or OllamaProvider()
+        self.breaker = breaker
+        self.slow_call_seconds = slow_call_seconds
+
+    def resolve(self, route: str):
+        return self.router.resolve(route)
+
+    def _prepare(self, route: str, options: Optional[Dict[str, Any]], model: Optional[str]):
+        routed_model, routed_options = self.router.resolve(route)
+        merged = {**routed_options, **(options or {})}
+        return model or routed_model, merged
+
+    def _finish(self, route: str, model: str, start: float, slow_after: Optional[float],
+                error: Optional[BaseException] = None, outcome: Optional[CallOutcome] = None,
+                use_breaker: bool = True) -> None:
+        seconds = time.perf_counter() - start
+        self.router.record(route, model, seconds)
+        if self.breaker is None or not use_breaker or (outcome is not None and not outcome.claim()):
+            return
+        limit = slow_after or self.slow_call_seconds
+        if error is not None:
+            self.breaker.record_failure(f"{route}: {error.__class__.__name__}: {error}")
+        elif seconds > limit:
+            self.breaker.record_failure(f"{route}: {seconds:.1f}s > {limit:.1f}s")
+        else:
+            self.breaker.record_success()
+
+    def _call(self, call: str, route: str, slow_after: Optional[float], model: str, stream: bool,
+              outcome: Optional[CallOutcome] = None, use_breaker: bool = True, **kwargs):
+        if self.breaker is not None and use_breaker:
+            self.breaker.check()
+        start = time.perf_counter()
+        try:
+            response = getattr(self.provider, call)(route, model=model, stream=stream, **kwargs)
+        except Exception as e:
+            self._finish(route, model, start, slow_after, e, outcome, use_breaker)
+            raise
+        if stream:
+            return self._timed_stream(route, model, response, start, slow_after, outcome, use_breaker)
+        self._finish(route, model, start, slow_after, outcome=outcome, use_breaker=use_breaker)
+        return response
+
+    def _timed_stream(self, route: str, model: str, stream: Iterator[Any], start: float,
+                      slow_after: Optional[float], outcome: Optional[CallOutcome] = None,
+                      use_breaker: bool = True) -> Iterator[Any]:
+        error = None
+        try:
+            for chunk in stream:
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._finish(route, model, start, slow_after, error, outcome, use_breaker)
+
+    def chat(self, route: str, messages: List[Dict[str, str]], stream: bool = False,
+             options: Optional[Dict[str, Any]] = None, model: Optional[str] = None,
+             slow_after: Optional[float] = None, outcome: Optional[CallOutcome] = None,
+             use_breaker: bool = True, **kwargs):
+        model, options = self._prepare(route, options, model)
+        kwargs.setdefault("keep_alive", self.keep_alive)
+        return self._call("chat", route, slow_after, model, stream, outcome, use_breaker, messages=messages,
+                          options=options or None, **kwargs)
+
+    def generate(self, route: str, prompt: str, stream: bool = False,
+                 options: Optional[Dict[str, Any]] = None, model: Optional[str] = None,
+                 slow_after: Optional[float] = None, outcome: Optional[CallOutcome] = None,
+                 use_breaker: bool = True, **kwargs):
+        model, options = self._prepare(route, options, model)
+        kwargs.setdefault("keep_alive", self.keep_alive)
+        return self._call("generate", route, slow_after, model, stream, outcome, use_breaker, prompt=prompt,
+                          options=options or None, **kwargs)
+
+    def embed(self, route: str, texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+        model = model or self.router.resolve(route)[0]
+        if self.breaker is not None:
+            self.breaker.check()
+        start = time.perf_counter()
+        try:
+            response = self.provider.embed(route, model=model, input=texts, keep_alive=self.keep_alive)
+        except Exception as e:
+            self._finish(route, model, start, None, e)
+            raise
+        self._finish(route, model, start, None)
+        return response["embeddings"]
@@ -0,0 +1,73 @@
+"""
+In-process metrics for the GemmaPilot backend.
+
+Counters and rolling latency windows are kept in memory and exposed as JSON
+through the `/metrics` endpoint.
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, Any
+
+
+class Metrics:
+    """Thread-safe counters and rolling latency windows"""
+
+    def __init__(self, window_size: int = 200):
+        self.window_size = window_size
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._latencies: Dict[str, Deque[float]] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Record a latency sample (in seconds) for `name`"""
+        with self._lock:
+            window = self._latencies.get(name)
+            if window is None:
+                window = self._latencies[name] = deque(maxlen=self.window_size)
+            window.append(seconds)
+
+    def counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def percentile(self, name: str, pct: float) -> float:
+        """Return the `pct` percentile (0-100) of the rolling window, or 0.0 if empty"""
+        with self._lock:
+            samples = sorted(self._latencies.get(name, ()))
+        if not samples:
+            return 0.0
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def sample_count(self, name: str) -> int:
+        with self._lock:
+            return len(self._latencies.get(name, ()))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            names = list(self._latencies)
+        latencies = {
+            name: {
+                "count": self.sample_count(name),
+                "p50_ms": round(self.percentile(name, 50) * 1000, 2),
+                "p95_ms": round(self.percentile(name, 95) * 1000, 2),
+                "p99_ms": round(self.percentile(name, 99) * 1000, 2),
+            }
+            for name in names
+        }
+        return {
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "counters": counters,
+            "latency": latencies,
+        }
+
+
+metrics = Metrics()
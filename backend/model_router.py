@@ -0,0 +1,155 @@
+"""
+Per-route model selection with latency-SLO based fallback.
+
+Every model call names a route: "completion", "chat", "analysis.<type>" or
+"code_action.<action>". A route's settings come from the most specific entry
+in the routing table ("analysis.issues", then "analysis", then "default").
+
+When a route has an SLO (`slo_p95_ms`) and the rolling p95 latency of its
+current model breaks it, the route steps down to the next model in its
+`fallback` list. After `recovery_seconds` it tries the primary model again.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+DEFAULT_ROUTE_SETTINGS = {
+    "model": None,  # None means the server's default MODEL
+    "options": {},
+    "slo_p95_ms": None,
+    "fallback": [],
+    "min_samples": 10,
+    "window": 50,
+    "recovery_seconds": 300,
+}
+
+
+class ModelRouter:
+    """Resolves routes to (model, options) and tracks per-route latency"""
+
+    def __init__(self, default_model: str, routes: Optional[Dict[str, Dict[str, Any]]] = None,
+                 config_path: Optional[str] = None, metrics=None):
+        self.default_model = default_model
+        self.config_path = config_path
+        self.metrics = metrics
+        self.routes: Dict[str, Dict[str, Any]] = {"default": {}}
+        self.routes.update(routes or {})
+        self._lock = threading.Lock()
+        self._level: Dict[str, int] = {}  # route -> index into [model] + fallback
+        self._degraded_at: Dict[str, float] = {}
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {}
+        self.switches: Deque[Dict[str, Any]] = deque(maxlen=50)
+        # Runner options from runtime tuning, by model ("*" for all); route options win over them
+        self.tuned_options: Dict[str, Dict[str, Any]] = {}
+        if config_path:
+            self.load(config_path)
+
+    def load(self, path: str) -> None:
+        """Merge routes from a JSON file ({"routes": {name: settings}}), if it exists"""
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            with self._lock:
+                for name, settings in data.get("routes", {}).items():
+                    self.routes[name] = {**self.routes.get(name, {}), **settings}
+            print(f"✅ Loaded model routes from {path}")
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Warning: Could not load model routes from {path}: {e}")
+
+    def settings(self, route: str) -> Dict[str, Any]:
+        """Effective settings for `route`, merged from general to specific"""
+        merged = dict(DEFAULT_ROUTE_SETTINGS)
+        merged["options"] = {}
+        parts = route.split('.')
+        names = ["default"] + ['.'.join(parts[:i]) for i in range(1, len(parts) + 1)]
+        for name in names:
+            entry = self.routes.get(name)
+            if entry:
+                options = {**merged["options"], **entry.get("options", {})}
+                merged.update(entry)
+                merged["options"] = options
+        merged["model"] = merged["model"] or self.default_model
+        return merged
+
+    def _chain(self, settings: Dict[str, Any]) -> List[str]:
+        return [settings["model"]] + [m for m in settings.get("fallback", []) if m != settings["model"]]
+
+    def resolve(self, route: str) -> Tuple[str, Dict[str, Any]]:
+        """Model and generation options to use for `route` right now"""
+        settings = self.settings(route)
+        chain = self._chain(settings)
+        with self._lock:
+            level = self._level.get(route, 0)
+            degraded_at = self._degraded_at.get(route)
+            if level and degraded_at and time.monotonic() - degraded_at >= settings["recovery_seconds"]:
+                self._switch(route, chain, level, 0, "recovery")
+                level = 0
+        level = min(level, len(chain) - 1)
+        model = chain[level]
+        options = {**self.tuned_options.get("*", {}), **self.tuned_options.get(model, {}), **settings["options"]}
+        options.update(settings.get("model_options", {}).get(model, {}))
+        return model, options
+
+    def set_tuned_options(self, options: Dict[str, Any], model: str = "*") -> None:
+        with self._lock:
+            self.tuned_options[model] = dict(options)
+
+    def record(self, route: str, model: str, seconds: float) -> None:
+        """Record a call's latency and fall back if the route's SLO is broken"""
+        settings = self.settings(route)
+        if self.metrics is not None:
+            self.metrics.observe(f"model.{route}", seconds)
+        slo_ms = settings.get("slo_p95_ms")
+        with self._lock:
+            window = self._latencies.get((route, model))
+            if window is None:
+                window = self._latencies[(route, model)] = deque(maxlen=settings["window"])
+            window.append(seconds)
+            if not slo_ms or len(window) < settings["min_samples"]:
+                return
+            chain = self._chain(settings)
+            level = self._level.get(route, 0)
+            if level >= len(chain) - 1 or chain[level] != model:
+                return
+            p95_ms = sorted(window)[int(0.95 * (len(window) - 1))] * 1000
+            if p95_ms > slo_ms:
+                self._switch(route, chain, level, level + 1, f"p95 {p95_ms:.0f}ms > SLO {slo_ms}ms")
+
+    def _switch(self, route: str, chain: List[str], old_level: int, new_level: int, reason: str) -> None:
+        """Change a route's active model (caller holds the lock)"""
+        self._level[route] = new_level
+        if new_level:
+            self._degraded_at[route] = time.monotonic()
+        else:
+            self._degraded_at.pop(route, None)
+        self._latencies.pop((route, chain[new_level]), None)
+        event = {"route": route, "from": chain[old_level], "to": chain[new_level], "reason": reason, "at": time.time()}
+        self.switches.append(event)
+        if self.metrics is not None:
+            self.metrics.incr("routing.fallbacks" if new_level > old_level else "routing.recoveries")
+            self.metrics.incr(f"routing.switches.{route}")
+        print(f"🔀 Route {route}: {event['from']} -> {event['to']} ({reason})")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            names = sorted(set(self.routes) | set(self._level))
+            levels = dict(self._level)
+            switches = list(self.switches)
+        active = {}
+        for name in names:
+            settings = self.settings(name)
+            chain = self._chain(settings)
+            active[name] = {
+                "model": chain[min(levels.get(name, 0), len(chain) - 1)],
+                "primary": chain[0],
+                "fallback": chain[1:],
+                "slo_p95_ms": settings.get("slo_p95_ms"),
+                "options": settings["options"],
+            }
+        return {"routes": active, "switches": switches, "tuned_options": dict(self.tuned_options)}
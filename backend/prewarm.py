@@ -0,0 +1,143 @@
+"""
+Low-priority background scheduler for completion prewarm jobs.
+
+The editor asks for a prewarm when a file is opened or the cursor rests. Jobs
+are keyed (normally by document), a newer job replaces a pending one with the
+same key, and jobs only start while no foreground request is running. A
+running job is told to stop (via its cancel event) as soon as a foreground
+request arrives or the job is superseded.
+
+An Ollama request cannot be interrupted while it evaluates the prompt, so
+the prefill is split into growing prefixes (`prefix_steps`). Each request
+reuses the KV cache of the previous one and only evaluates the next piece,
+and the job checks its cancel event between them. A foreground request
+therefore waits for at most one piece.
+"""
+
+import asyncio
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from prompt_context import estimate_tokens
+
+PrewarmJob = Callable[[threading.Event], Awaitable[Any]]
+
+
+def prefix_steps(text: str, max_tokens: int) -> List[str]:
+    """Growing prefixes of `text`, cut at line ends, each adding about `max_tokens` tokens"""
+    steps = []
+    end = size = 0
+    for line in text.splitlines(keepends=True):
+        end += len(line)
+        size += estimate_tokens(line)
+        if size >= max_tokens:
+            steps.append(text[:end])
+            size = 0
+    if not steps or steps[-1] != text:
+        steps.append(text)
+    return steps
+
+
+class PrewarmScheduler:
+    """Single-worker queue of cancellable prewarm jobs"""
+
+    def __init__(self, max_pending: int = 16):
+        self.max_pending = max_pending
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+        self._pending: "OrderedDict[str, PrewarmJob]" = OrderedDict()
+        self._running_key: Optional[str] = None
+        self._running_cancel: Optional[threading.Event] = None
+        self._foreground = 0
+        self._lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+            if self._foreground == 0:
+                self._idle.set()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    def submit(self, key: str, job: PrewarmJob) -> None:
+        """Queue `job`, replacing any pending or running job with the same key"""
+        self._ensure_worker()
+        with self._lock:
+            if key in self._pending:
+                self.cancelled += 1
+            self._pending[key] = job
+            self._pending.move_to_end(key)
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+                self.cancelled += 1
+            if self._running_key == key and self._running_cancel is not None:
+                self._running_cancel.set()
+        self._wakeup.set()
+
+    def cancel(self, key: str) -> bool:
+        with self._lock:
+            found = self._pending.pop(key, None) is not None
+            if self._running_key == key and self._running_cancel is not None:
+                self._running_cancel.set()
+                found = True
+        if found:
+            self.cancelled += 1
+        return found
+
+    @contextmanager
+    def foreground(self):
+        """Mark a user-facing request as running; prewarm work yields to it"""
+        with self._lock:
+            self._foreground += 1
+            if self._running_cancel is not None:
+                self._running_cancel.set()
+        if self._idle is not None:
+            self._idle.clear()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._foreground -= 1
+                idle = self._foreground == 0
+            if idle and self._idle is not None:
+                self._idle.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            await self._idle.wait()
+            with self._lock:
+                if not self._pending:
+                    self._wakeup.clear()
+                    continue
+                key, job = self._pending.popitem(last=False)
+                cancel_event = threading.Event()
+                self._running_key, self._running_cancel = key, cancel_event
+            try:
+                await job(cancel_event)
+                if cancel_event.is_set():
+                    self.cancelled += 1
+                else:
+                    self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"⚠️ Warning: Prewarm job {key} failed: {e}")
+            finally:
+                with self._lock:
+                    self._running_key, self._running_cancel = None, None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "running": self._running_key,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "failed": self.failed,
+            }
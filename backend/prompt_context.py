@@ -0,0 +1,178 @@
+"""
+Deduplication and minification of prompt context.
+
+Prompts are assembled from sections (current file, selection, attached
+files, free-form context, ...) that often repeat each other: the current file
+is also attached, the selection is part of the current file, and `context`
+pastes both again. `pack_sections` normalizes whitespace in every section,
+optionally strips license headers and comment lines, and then replaces
+repeated text with a short reference to the section that already holds it.
+Sections are processed in order, so earlier sections keep their text.
+"""
+
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Shortest section that is replaced by a reference when it appears inside an
+# earlier one, and shortest earlier section that is cut out of a later one
+MIN_CONTAINED_CHARS = 80
+MIN_EMBEDDED_CHARS = 120
+
+TOKEN = re.compile(r"\w+|[^\w\s]")
+BLANK_RUN = re.compile(r"\n{3,}")
+INNER_SPACE_RUN = re.compile(r"(?<=\S)[ \t]{2,}")
+LICENSE_WORDS = re.compile(r"licen[cs]e|copyright|spdx-license-identifier|all rights reserved", re.IGNORECASE)
+
+HASH_COMMENTS = ("python", "shell", "bash", "ruby", "yaml", "toml", "perl", "r")
+SLASH_COMMENTS = ("javascript", "typescript", "java", "c", "cpp", "csharp", "go", "rust", "kotlin", "swift", "php", "scala")
+LANGUAGE_BY_EXTENSION = {
+    '.py': 'python', '.sh': 'shell', '.bash': 'bash', '.rb': 'ruby', '.yaml': 'yaml', '.yml': 'yaml',
+    '.toml': 'toml', '.pl': 'perl', '.r': 'r',
+    '.js': 'javascript', '.jsx': 'javascript', '.mjs': 'javascript', '.cjs': 'javascript',
+    '.ts': 'typescript', '.tsx': 'typescript', '.java': 'java', '.c': 'c', '.h': 'c',
+    '.cpp': 'cpp', '.cc': 'cpp', '.hpp': 'cpp', '.cs': 'csharp', '.go': 'go', '.rs': 'rust',
+    '.kt': 'kotlin', '.swift': 'swift', '.php': 'php', '.scala': 'scala',
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (words and punctuation), good enough to compare prompt sizes"""
+    return len(TOKEN.findall(text))
+
+
+def language_for(path: Optional[str] = None, language: Optional[str] = None) -> Optional[str]:
+    if language:
+        return language.lower()
+    if path:
+        return LANGUAGE_BY_EXTENSION.get(os.path.splitext(path)[1].lower())
+    return None
+
+
+def collapse_whitespace(text: str, prose: bool = False) -> str:
+    """Drop trailing whitespace and blank-line runs; prose also collapses inner space runs
+
+    Leading indentation is always kept: it is significant in code, and prose
+    context often has code pasted into it.
+    """
+    lines = [line.rstrip() for line in text.strip('\n').split('\n')]
+    if prose:
+        lines = [INNER_SPACE_RUN.sub(' ', line) for line in lines]
+    return BLANK_RUN.sub('\n\n', '\n'.join(lines))
+
+
+def _comment_prefix(language: Optional[str]) -> Optional[str]:
+    if language in HASH_COMMENTS:
+        return '#'
+    if language in SLASH_COMMENTS:
+        return '//'
+    return None
+
+
+def strip_license_header(text: str, language: Optional[str]) -> str:
+    """Remove a leading comment block that mentions a license or copyright"""
+    prefix = _comment_prefix(language)
+    if prefix is None:
+        return text
+    lines = text.split('\n')
+    start = 1 if lines and lines[0].startswith('#!') else 0
+    end = start
+    if prefix == '//' and end < len(lines) and lines[end].lstrip().startswith('/*'):
+        while end < len(lines) and '*/' not in lines[end]:
+            end += 1
+        end = min(end + 1, len(lines))
+    else:
+        while end < len(lines) and lines[end].lstrip().startswith(prefix):
+            end += 1
+    header = '\n'.join(lines[start:end])
+    if end == start or not LICENSE_WORDS.search(header):
+        return text
+    return '\n'.join(lines[:start] + lines[end:]).lstrip('\n')
+
+
+def strip_comment_lines(text: str, language: Optional[str]) -> str:
+    """Remove lines that only hold a comment (shebangs and type/lint pragmas are kept)"""
+    prefix = _comment_prefix(language)
+    if prefix is None:
+        return text
+    kept = []
+    for number, line in enumerate(text.split('\n')):
+        stripped = line.lstrip()
+        if stripped.startswith(prefix) and not (number == 0 and stripped.startswith('#!')) \
+                and not re.match(r'(#|//)\s*(type:|noqa|pylint:|eslint|@ts-|nolint|-\*-)', stripped):
+            continue
+        kept.append(line)
+    return '\n'.join(kept)
+
+
+def minify(text: str, language: Optional[str] = None, prose: bool = False,
+           strip_license: bool = False, strip_comments: bool = False) -> str:
+    if not prose:
+        if strip_license:
+            text = strip_license_header(text, language)
+        if strip_comments:
+            text = strip_comment_lines(text, language)
+    return collapse_whitespace(text, prose=prose).strip('\n')
+
+
+def section(label: str, text: str, path: Optional[str] = None, language: Optional[str] = None,
+            prose: bool = False, raw: bool = False) -> Dict[str, Any]:
+    """A prompt section for pack_sections
+
+    `label` is how references name it; `raw` sections are never rewritten
+    (only referenced), e.g. code the model has to quote back exactly.
+    """
+    return {"label": label, "text": text or "", "language": language_for(path, language),
+            "prose": prose, "raw": raw}
+
+
+def pack_sections(sections: List[Dict[str, Any]], strip_license: bool = False,
+                  strip_comments: bool = False) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """Minify sections and replace repeated text with references to earlier sections
+
+    Returns one {"text", "reference"} per section (same order as `sections`;
+    "reference" is True when the text only points at an earlier section) and
+    a report with estimated tokens before/after and the replacements made.
+    """
+    report = {"tokens_before": 0, "tokens_after": 0, "tokens_saved": 0, "duplicates": 0, "contained": 0}
+    # Repeats are found on whitespace-normalized text, before comments are
+    # stripped, so stripping one copy doesn't hide that it's a repeat.
+    kept: List[Tuple[str, str, str]] = []  # (label, normalized, final) of sections shown in full
+    results = []
+    for entry in sections:
+        report["tokens_before"] += estimate_tokens(entry["text"])
+        normalized = collapse_whitespace(entry["text"], prose=entry["prose"])
+        reference = None
+        for label, earlier, earlier_final in kept:
+            if not normalized or entry["raw"]:
+                break
+            if normalized == earlier:
+                reference = f"(identical to {label} above)"
+                report["duplicates"] += 1
+                break
+            if len(normalized) >= MIN_CONTAINED_CHARS and normalized in earlier:
+                final = minify(normalized, entry["language"], entry["prose"], strip_license, strip_comments)
+                index = earlier_final.find(final) if final else -1
+                if index != -1:
+                    first = earlier_final.count('\n', 0, index) + 1
+                    reference = f"(lines {first}-{first + final.count(chr(10))} of {label} above)"
+                else:
+                    reference = f"(part of {label} above)"
+                report["contained"] += 1
+                break
+            if len(earlier) >= MIN_EMBEDDED_CHARS and earlier in normalized:
+                normalized = normalized.replace(earlier, f"[{label} above]")
+                report["contained"] += 1
+
+        if reference is not None:
+            text = reference
+        elif entry["raw"]:
+            text = entry["text"]
+        else:
+            text = minify(normalized, entry["language"], entry["prose"], strip_license, strip_comments)
+        if reference is None and text:
+            kept.append((entry["label"], normalized, text))
+        report["tokens_after"] += estimate_tokens(text)
+        results.append({"text": text, "reference": reference is not None})
+    report["tokens_saved"] = report["tokens_before"] - report["tokens_after"]
+    return results, report
@@ -0,0 +1,277 @@
+"""
+Prompt template registry.
+
+Action and analysis prompts are templates with named `{fields}`. They are
+parsed and validated once, when the registry loads, and only the selected
+template is rendered for a request. Built-in templates can be overridden or
+extended with `<name>.txt` files in a templates directory
+(`~/.gemmapilot/templates`, e.g. `code_action.explain_code.txt`). The
+directory is checked for changes at most every `reload_interval` seconds and
+reloaded automatically. The check runs on a background thread, so rendering
+a template never touches the disk. A file that fails validation is reported and the
+previous (or built-in) template stays in use.
+
+`version` is a hash of all active templates. Anything that caches model
+output produced from these prompts can include it in its cache key.
+"""
+
+import hashlib
+import os
+import string
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+TEMPLATE_SUFFIX = ".txt"
+
+# Fields each kind of template may use (the part of the name before the first ".")
+TEMPLATE_FIELDS = {
+    "code_action": {"language", "code", "context"},
+    "analysis": {"file_ext", "file_name", "file_content", "analysis_type", "facts"},
+}
+
+BUILTIN_TEMPLATES = {
+    "code_action.explain_code": """Please explain this {language} code in detail:
+
+```{language}
+{code}
+```
+
+Provide a clear, comprehensive explanation of:
+1. What the code does
+2. How it works
+3. Key concepts used
+4. Any potential issues or improvements
+
+Context: {context}""",
+
+    "code_action.fix_code": """Please analyze this {language} code for issues and provide fixes:
+
+```{language}
+{code}
+```
+
+Please:
+1. Identify any bugs, errors, or issues
+2. Provide corrected code
+3. Explain what was wrong and how you fixed it
+4. Suggest best practices
+
+Context: {context}""",
+
+    "code_action.optimize_code": """Please optimize this {language} code for better performance and readability:
+
+```{language}
+{code}
+```
+
+Please:
+1. Analyze current performance characteristics
+2. Provide optimized version
+3. Explain the improvements made
+4. Consider memory usage, speed, and maintainability
+
+Context: {context}""",
+
+    "code_action.generate_tests": """Please generate comprehensive tests for this {language} code:
+
+```{language}
+{code}
+```
+
+Please:
+1. Create unit tests that cover all functionality
+2. Include edge cases and error conditions
+3. Use appropriate testing framework for {language}
+4. Provide clear test descriptions
+
+Context: {context}""",
+
+    "code_action.generate_docs": """Please generate comprehensive documentation for this {language} code:
+
+```{language}
+{code}
+```
+
+Please:
+1. Create detailed docstrings/comments
+2. Document parameters, return values, and exceptions
+3. Provide usage examples
+4. Include any relevant notes or warnings
+
+Context: {context}""",
+
+    "code_action.review_changes": """Please review these uncommitted changes:
+
+{context}
+
+Please:
+1. Point out bugs or regressions the changes may introduce
+2. Note missing error handling, edge cases and tests
+3. Suggest concrete fixes as code
+4. Keep comments about unchanged code to a minimum
+
+Code in question (may be empty):
+```{language}
+{code}
+```""",
+
+    "code_action.default": """Please help with this {language} code:
+
+```{language}
+{code}
+```""",
+
+    "analysis.overview": "Analyze this {file_ext} file and provide an overview of its purpose, structure, and key components:\n\n{file_content}",
+    "analysis.issues": "Review this {file_ext} file for potential issues, bugs, or improvements:\n\n{file_content}",
+    "analysis.suggestions": "Suggest improvements and best practices for this {file_ext} file:\n\n{file_content}",
+    "analysis.dependencies": "Analyze the dependencies and imports in this {file_ext} file:\n\n{file_content}",
+    "analysis.default": "Analyze this {file_ext} file:\n\n{file_content}",
+    "analysis.narrative": ("Here are precomputed facts about the {file_ext} file {file_name}. "
+                           "Write a short {analysis_type} summary based only on these facts:\n\n{facts}"),
+}
+
+
+class TemplateError(ValueError):
+    """A template that cannot be compiled"""
+
+
+class CompiledTemplate:
+    """A template parsed once into literal text and field references"""
+
+    def __init__(self, name: str, text: str, source: str = "builtin"):
+        self.name = name
+        self.text = text
+        self.source = source
+        self.hash = hashlib.sha256(f"{name}\0{text}".encode("utf-8")).hexdigest()[:12]
+        kind = name.split(".", 1)[0]
+        allowed = TEMPLATE_FIELDS.get(kind)
+        if allowed is None:
+            raise TemplateError(f"{name}: unknown template kind {kind!r}")
+        self.parts: List[Tuple[str, Optional[str]]] = []
+        try:
+            parsed = list(string.Formatter().parse(text))
+        except ValueError as e:
+            raise TemplateError(f"{name}: {e}")
+        for literal, field, format_spec, conversion in parsed:
+            if field is not None:
+                if field not in allowed:
+                    raise TemplateError(f"{name}: unknown field {{{field}}} (allowed: {', '.join(sorted(allowed))})")
+                if format_spec or conversion:
+                    raise TemplateError(f"{name}: format specs are not supported in {{{field}}}")
+            self.parts.append((literal, field))
+        self.fields = {field for _, field in self.parts if field is not None}
+
+    def render(self, values: Dict[str, Any]) -> str:
+        out = []
+        for literal, field in self.parts:
+            out.append(literal)
+            if field is not None:
+                out.append(str(values.get(field, "")))
+        return "".join(out)
+
+
+class PromptTemplateRegistry:
+    """Built-in plus on-disk templates, compiled once and hot-reloaded on change"""
+
+    def __init__(self, template_dir: Optional[str] = None, reload_interval: float = 2.0):
+        self.template_dir = template_dir
+        self.reload_interval = reload_interval
+        self.errors: Dict[str, str] = {}
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._builtin = {name: CompiledTemplate(name, text) for name, text in BUILTIN_TEMPLATES.items()}
+        self._templates: Dict[str, CompiledTemplate] = dict(self._builtin)
+        self._signature: Tuple = ()
+        self._last_check = float('-inf')
+        self._checking = False
+        self.version = self._compute_version()
+        self.reload()
+
+    def _compute_version(self) -> str:
+        digest = hashlib.sha256()
+        for name in sorted(self._templates):
+            digest.update(self._templates[name].hash.encode())
+        return digest.hexdigest()[:16]
+
+    def _dir_signature(self) -> Tuple:
+        if not self.template_dir or not os.path.isdir(self.template_dir):
+            return ()
+        entries = []
+        for entry in os.scandir(self.template_dir):
+            if entry.name.endswith(TEMPLATE_SUFFIX) and entry.is_file():
+                stat = entry.stat()
+                entries.append((entry.name, stat.st_mtime_ns, stat.st_size))
+        return tuple(sorted(entries))
+
+    def reload(self, force: bool = False) -> bool:
+        """Recompile user templates if the directory changed; returns True if it did"""
+        signature = self._dir_signature()
+        with self._lock:
+            self._last_check = time.monotonic()
+            if signature == self._signature and not force:
+                return False
+            templates = dict(self._builtin)
+            previous = self._templates
+            errors = {}
+            for file_name, _, _ in signature:
+                name = file_name[:-len(TEMPLATE_SUFFIX)]
+                path = os.path.join(self.template_dir, file_name)
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        templates[name] = CompiledTemplate(name, f.read().rstrip("\n"), source=path)
+                except (OSError, TemplateError) as e:
+                    errors[name] = str(e)
+                    if name in previous:
+                        templates[name] = previous[name]
+                    print(f"⚠️ Warning: Prompt template {name} not loaded: {e}")
+            self._templates = templates
+            self._signature = signature
+            self.errors = errors
+            self.version = self._compute_version()
+            self.reloads += 1
+            return True
+
+    def _maybe_reload(self) -> None:
+        """Start a background change check when one is due; callers keep the current templates"""
+        with self._lock:
+            if self._checking or time.monotonic() - self._last_check < self.reload_interval:
+                return
+            self._checking = True
+            self._last_check = time.monotonic()
+        threading.Thread(target=self._background_reload, name="gemmapilot-templates", daemon=True).start()
+
+    def _background_reload(self) -> None:
+        try:
+            self.reload()
+        except Exception as e:
+            print(f"⚠️ Warning: Prompt template reload failed: {e}")
+        finally:
+            with self._lock:
+                self._checking = False
+
+    def get(self, name: str, default: Optional[str] = None) -> CompiledTemplate:
+        self._maybe_reload()
+        with self._lock:
+            template = self._templates.get(name) or (self._templates.get(default) if default else None)
+        if template is None:
+            raise KeyError(f"No prompt template {name!r}")
+        return template
+
+    def render(self, name: str, default: Optional[str] = None, **values) -> str:
+        """Render one template (falling back to `default` when `name` is not defined)"""
+        return self.get(name, default).render(values)
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._maybe_reload()
+        with self._lock:
+            return {
+                "version": self.version,
+                "template_dir": self.template_dir,
+                "reloads": self.reloads,
+                "errors": dict(self.errors),
+                "templates": {
+                    name: {"hash": t.hash, "source": t.source, "fields": sorted(t.fields)}
+                    for name, t in sorted(self._templates.items())
+                },
+            }
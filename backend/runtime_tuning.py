@@ -0,0 +1,310 @@
+"""
+CPU-aware tuning of Ollama runner options.
+
+Without options Ollama picks its own thread count, batch size and context
+length, which are poor fits for both large many-core servers and small
+laptops. At startup `RuntimeTuner` detects the host (physical cores,
+memory, NUMA nodes) and runs a short micro-benchmark of the model with a few
+`num_thread` / `num_batch` candidates. From the results it picks
+`num_thread`, `num_batch` and `num_ctx`.
+
+The profile is persisted to JSON and reused while the hardware fingerprint
+and model stay the same. Values under "overrides" in that file are kept
+across recalibrations and win over measured values, and route options in
+`model_routes.json` win over both.
+
+The options are chosen per model, not per route. Ollama reloads the model
+whenever these runner options change, so routes that share a model must also
+share them.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import platform
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+PROFILE_VERSION = 1
+CONTEXT_SIZES = (2048, 4096, 8192, 16384)
+BATCH_CANDIDATES = (128, 256, 512)
+# Representative request used to score candidates: prompt tokens, output tokens
+WORKLOAD = (1500, 64)
+
+CALIBRATION_PROMPT = "Summarize what this function does in one sentence.\n\n" + "\n".join(
+    f"def step_{i}(values, factor={i}):\n    return [v * factor + {i} for v in values if v % {i + 2}]"
+    for i in range(24)
+)
+
+
+def _read(path: str) -> str:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def _parse_cpulist(text: str) -> List[int]:
+    cpus = []
+    for part in text.strip().split(","):
+        if "-" in part:
+            low, high = part.split("-", 1)
+            cpus.extend(range(int(low), int(high) + 1))
+        elif part.strip():
+            cpus.append(int(part))
+    return cpus
+
+
+def detect_hardware() -> Dict[str, Any]:
+    """Logical/physical CPUs usable by this process, memory and NUMA layout"""
+    try:
+        usable = sorted(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        usable = list(range(os.cpu_count() or 1))
+
+    # Physical cores: unique (package, core) pairs among the usable CPUs
+    cores = set()
+    cpu_model = platform.processor()
+    for block in _read("/proc/cpuinfo").split("\n\n"):
+        fields = dict(line.split(":", 1) for line in block.splitlines() if ":" in line)
+        fields = {k.strip(): v.strip() for k, v in fields.items()}
+        if "processor" not in fields or int(fields["processor"]) not in usable:
+            continue
+        cpu_model = fields.get("model name", cpu_model)
+        cores.add((fields.get("physical id", "0"), fields.get("core id", fields["processor"])))
+    physical = len(cores) or len(usable)
+
+    nodes = []
+    for node_path in sorted(glob.glob("/sys/devices/system/node/node[0-9]*")):
+        node_cpus = [c for c in _parse_cpulist(_read(os.path.join(node_path, "cpulist"))) if c in usable]
+        if node_cpus:
+            nodes.append({"node": int(node_path.rsplit("node", 1)[1]), "cpus": len(node_cpus)})
+
+    meminfo = {}
+    for line in _read("/proc/meminfo").splitlines():
+        name, _, value = line.partition(":")
+        if value.strip().endswith("kB"):
+            meminfo[name] = int(value.split()[0]) * 1024
+    total = meminfo.get("MemTotal")
+    if total is None:
+        try:
+            total = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (ValueError, OSError, AttributeError):
+            total = 0
+
+    return {
+        "cpu_model": cpu_model or platform.machine(),
+        "logical_cpus": len(usable),
+        "physical_cores": min(physical, len(usable)),
+        "numa_nodes": nodes or [{"node": 0, "cpus": len(usable)}],
+        "memory_bytes": total,
+        "memory_available_bytes": meminfo.get("MemAvailable", total),
+    }
+
+
+def fingerprint(hardware: Dict[str, Any], model: str) -> str:
+    key = [hardware["cpu_model"], hardware["logical_cpus"], hardware["physical_cores"],
+           len(hardware["numa_nodes"]), round(hardware["memory_bytes"] / 2**30), model, PROFILE_VERSION]
+    return hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()[:16]
+
+
+def thread_candidates(hardware: Dict[str, Any]) -> List[int]:
+    """Physical cores, one NUMA node's worth of them, and half of them"""
+    physical = hardware["physical_cores"]
+    nodes = hardware["numa_nodes"]
+    candidates = {physical, max(1, physical // 2)}
+    if len(nodes) > 1:
+        smt = max(1, hardware["logical_cpus"] // physical)
+        candidates.add(max(1, max(node["cpus"] for node in nodes) // smt))
+    return sorted(candidates)
+
+
+def pick_context_size(hardware: Dict[str, Any], prefill_tps: float, target: int, prefill_budget: float) -> int:
+    """Largest context up to `target` that fits memory and prefills within the budget"""
+    available_gb = hardware["memory_available_bytes"] / 2**30
+    memory_cap = 4096 if available_gb < 6 else 8192 if available_gb < 16 else 16384
+    chosen = CONTEXT_SIZES[0]
+    for size in CONTEXT_SIZES:
+        if size > target or size > memory_cap:
+            break
+        if prefill_tps and size / prefill_tps > prefill_budget:
+            break
+        chosen = size
+    return chosen
+
+
+def measure(response: Dict[str, Any]) -> Dict[str, float]:
+    """Prefill and decode throughput from an Ollama generate response"""
+    prompt_ns = response.get("prompt_eval_duration") or 0
+    eval_ns = response.get("eval_duration") or 0
+    prefill_tps = response.get("prompt_eval_count", 0) / (prompt_ns / 1e9) if prompt_ns else 0.0
+    decode_tps = response.get("eval_count", 0) / (eval_ns / 1e9) if eval_ns else 0.0
+    return {"prefill_tps": round(prefill_tps, 1), "decode_tps": round(decode_tps, 2)}
+
+
+def workload_seconds(result: Dict[str, float]) -> float:
+    if not result["prefill_tps"] or not result["decode_tps"]:
+        return float("inf")
+    return WORKLOAD[0] / result["prefill_tps"] + WORKLOAD[1] / result["decode_tps"]
+
+
+class RuntimeTuner:
+    """Detects the host, benchmarks runner options and keeps the resulting profile
+
+    `generate(prompt, options)` must call the model and return the Ollama
+    response (with prompt_eval_* / eval_* counters).
+    """
+
+    def __init__(self, model: str, profile_path: str, generate: Callable[[str, Dict[str, Any]], Dict[str, Any]],
+                 target_context: int = 8192, prefill_budget: float = 30.0, on_profile=None):
+        self.model = model
+        self.profile_path = profile_path
+        self.generate = generate
+        self.target_context = target_context
+        self.prefill_budget = prefill_budget
+        self.on_profile = on_profile
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.profile: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _load(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.profile_path):
+            return None
+        try:
+            with open(self.profile_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Warning: Could not read runtime profile {self.profile_path}: {e}")
+            return None
+
+    def _save(self, profile: Dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(self.profile_path), exist_ok=True)
+        tmp_path = self.profile_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(profile, f, indent=2)
+        os.replace(tmp_path, self.profile_path)
+
+    def options(self) -> Dict[str, Any]:
+        """Tuned runner options with manual overrides applied ({} until calibrated)"""
+        with self._lock:
+            if not self.profile:
+                return {}
+            return {**self.profile.get("options", {}), **self.profile.get("overrides", {})}
+
+    def _apply(self, profile: Dict[str, Any], status: str) -> None:
+        with self._lock:
+            self.profile = profile
+            self.status = status
+            self.error = None
+        if self.on_profile is not None:
+            self.on_profile(self.options())
+
+    def _benchmark(self, options: Dict[str, Any], run: int) -> Dict[str, Any]:
+        # A unique first line keeps Ollama from reusing the previous run's prompt cache
+        response = self.generate(f"Run {run}.\n{CALIBRATION_PROMPT}", {**options, "num_predict": 24, "temperature": 0})
+        return {**options, **measure(response)}
+
+    def calibrate(self) -> Dict[str, Any]:
+        """Run the micro-benchmark and persist a new profile"""
+        with self._lock:
+            self.status = "calibrating"
+        hardware = detect_hardware()
+        numa = len(hardware["numa_nodes"]) > 1
+        base = {"numa": True} if numa else {}
+        start = time.perf_counter()
+        runs = []
+        for threads in thread_candidates(hardware):
+            runs.append(self._benchmark({**base, "num_thread": threads}, len(runs)))
+        best = min(runs, key=workload_seconds)
+        for batch in BATCH_CANDIDATES:
+            if batch != best.get("num_batch", 512):
+                runs.append(self._benchmark({**base, "num_thread": best["num_thread"], "num_batch": batch}, len(runs)))
+        best = min(runs, key=workload_seconds)
+
+        options = {**base, "num_thread": best["num_thread"], "num_batch": best.get("num_batch", 512),
+                   "num_ctx": pick_context_size(hardware, best["prefill_tps"], self.target_context, self.prefill_budget)}
+        previous = self._load() or {}
+        profile = {
+            "version": PROFILE_VERSION,
+            "fingerprint": fingerprint(hardware, self.model),
+            "model": self.model,
+            "created_at": time.time(),
+            "calibration_seconds": round(time.perf_counter() - start, 1),
+            "hardware": hardware,
+            "benchmark": runs,
+            "options": options,
+            "overrides": previous.get("overrides", {}),
+        }
+        self._save(profile)
+        self._apply(profile, "calibrated")
+        print(f"⚙️ Runtime profile for {self.model}: {self.options()} "
+              f"({best['prefill_tps']} prompt tok/s, {best['decode_tps']} tok/s)")
+        return profile
+
+    def set_overrides(self, overrides: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge manual option overrides into the profile (None removes one) and persist them"""
+        with self._lock:
+            profile = dict(self.profile or {"version": PROFILE_VERSION, "model": self.model, "options": {}})
+            merged = {**profile.get("overrides", {}), **overrides}
+            profile["overrides"] = {k: v for k, v in merged.items() if v is not None}
+            status = self.status if self.profile else "overrides_only"
+        self._save(profile)
+        self._apply(profile, status)
+        return profile["overrides"]
+
+    def ensure(self, force: bool = False, calibrate: bool = True) -> None:
+        """Use the saved profile if it matches this host and model, else calibrate
+
+        With `calibrate=False` only the saved manual overrides are applied.
+        """
+        try:
+            profile = None if force else self._load()
+            if profile and profile.get("version") == PROFILE_VERSION and \
+                    profile.get("fingerprint") == fingerprint(detect_hardware(), self.model):
+                self._apply(profile, "loaded")
+            elif calibrate:
+                self.calibrate()
+            elif profile and profile.get("overrides"):
+                self._apply({**profile, "options": {}}, "overrides_only")
+            else:
+                with self._lock:
+                    self.status = "disabled"
+        except Exception as e:
+            with self._lock:
+                self.status = "failed"
+                self.error = str(e)
+            print(f"⚠️ Warning: Runtime calibration failed, using Ollama defaults: {e}")
+
+    def start(self, force: bool = False) -> bool:
+        """Run `ensure` on a background thread; False if one is already running"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(target=self.ensure, args=(force,), daemon=True,
+                                            name="gemmapilot-calibration")
+            self._thread.start()
+            return True
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            profile = self.profile or {}
+            status, error = self.status, self.error
+        hardware = profile.get("hardware") or {}
+        return {
+            "status": status,
+            "error": error,
+            "options": self.options(),
+            "overrides": profile.get("overrides", {}),
+            "physical_cores": hardware.get("physical_cores"),
+            "numa_nodes": len(hardware.get("numa_nodes", [])) or None,
+            "profile_path": self.profile_path,
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"status": self.status, "error": self.error, "profile": self.profile}
@@ -1,16 +1,48 @@
-from fastapi import FastAPI, WebSocket, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import ollama
 import asyncio
+import functools
+import inspect
 import json
+import math
 import os
 import subprocess
 import re
+import threading
+import time
 from pathlib import Path
 import mimetypes
 
+from blob_store import BlobStore
+from metrics import metrics
+from streaming import iterate_in_thread, sse_event, CodeFenceWatcher, CODE_FENCE
+from file_reader import file_reader, centered_window
+from file_batch import apply_batch, atomic_write
+from symbol_index import SymbolIndexRegistry, LANGUAGE_BY_EXTENSION
+from static_analysis import DependencyGraph, DependencyGraphRegistry, find_workspace_root, format_facts
+from cache import TTLCache, cache_key
+from prewarm import PrewarmScheduler, prefix_steps
+from chat_cache import ChatAnswerCache
+from model_router import ModelRouter
+from llm import LLMClient, OllamaProvider
+from circuit_breaker import CallOutcome, CircuitBreaker, CircuitOpenError
+from degraded_completion import DegradedCompleter
+from completion_feedback import CHEAP, SKIP, AcceptanceTracker
+from completion_alternatives import mean_logprob, rank, sample_alternatives
+from trace_replay import RecordingProvider, ReplayProvider, TraceMiddleware, TraceRecorder, as_dict
+from vector_index import HashingEmbedder, WorkspaceSearch
+from shell_sessions import SessionClosedError, SessionLimitError, ShellSessionManager
+from async_io import IOPool
+from prompt_context import pack_sections, section
+from edit_format import EDIT_ACTIONS, EditError, apply_model_edits, build_edit_prompt
+from prompt_templates import PromptTemplateRegistry
+from git_context import GitContextRegistry, NotAGitRepository
+from runtime_tuning import RuntimeTuner
+
 app = FastAPI(title="GemmaPilot API", description="Advanced AI coding assistant")
 
 # Allow CORS for VS Code extension
@@ -29,17 +61,31 @@ class ChatRequest(BaseModel):
     workspace_path: Optional[str] = ""
     current_file: Optional[str] = ""
     selection: Optional[str] = ""
-    files: Optional[List[Dict[str, str]]] = []
+    files: Optional[List[Dict[str, str]]] = []  # {"path", "content"} or {"path", "hash"}
+    # 1-based lines in current_file; the file context is windowed around them
+    cursor_line: Optional[int] = None
+    selection_start_line: Optional[int] = None
+    selection_end_line: Optional[int] = None
+    use_cache: bool = True  # False forces a fresh answer, which then replaces the cached one
+    strip_comments: Optional[bool] = None  # drop comment-only lines from file context (default PROMPT_STRIP_COMMENTS)
+    context_mode: str = "default"  # "git_diff": uncommitted changes instead of current file and workspace tree
+    diff_context_lines: Optional[int] = None  # git_diff: unchanged lines around each hunk (default GIT_DIFF_CONTEXT_LINES)
 
 class FileAnalysisRequest(BaseModel):
     file_path: str
     workspace_path: Optional[str] = ""
     analysis_type: str = "overview"  # overview, issues, suggestions, dependencies
+    narrative: bool = False  # overview/dependencies: add a model-written summary of the static facts
 
 class CommandRequest(BaseModel):
     command: str
     workspace_path: str
     explanation: Optional[str] = ""
+    session_id: Optional[str] = None  # run in this persistent shell session (see /shell_sessions)
+    persistent: bool = False  # run in the workspace's default persistent session
+
+class ShellSessionRequest(BaseModel):
+    workspace_path: str
 
 class ChatResponse(BaseModel):
     response: str
@@ -47,20 +93,35 @@ class ChatResponse(BaseModel):
     suggestions: List[str] = []
     files_referenced: List[str] = []
     commands_suggested: List[str] = []
+    cached: bool = False
+    cache_similarity: Optional[float] = None
+    context_stats: Dict[str, int] = {}  # estimated prompt tokens before/after deduplication
 
 # Additional Pydantic models for enhanced functionality
 class CodeActionRequest(BaseModel):
-    action: str  # explain_code, fix_code, optimize_code, generate_tests, generate_docs
-    code: str
+    action: str  # explain_code, fix_code, optimize_code, generate_tests, generate_docs, review_changes
+    code: str = ""
+    code_hash: Optional[str] = ""  # reference to a blob uploaded via /blobs instead of `code`
     language: str
     file_path: Optional[str] = ""
     workspace_path: Optional[str] = ""
+    # 1-based lines of `code` within file_path; the file context is windowed around them
+    selection_start_line: Optional[int] = None
+    selection_end_line: Optional[int] = None
+    stop_after_code: bool = False  # /code_action/stream: end generation once the first code block is complete (ignored for output_mode="diff")
+    output_mode: str = "rewrite"  # fix_code/optimize_code: "rewrite" (full code) or "diff" (minimal edits)
+    strip_comments: Optional[bool] = None  # drop comment-only lines from file context (default PROMPT_STRIP_COMMENTS)
+    context_mode: str = "default"  # "git_diff": uncommitted changes instead of current file and workspace tree
+    diff_context_lines: Optional[int] = None
 
 class FileOperationRequest(BaseModel):
     operation: str  # create, read, write, delete, mkdir
     file_path: str
     content: Optional[str] = ""
     workspace_path: Optional[str] = ""
+    # Line range for "read" (1-based, inclusive)
+    start_line: Optional[int] = None
+    end_line: Optional[int] = None
 
 class CodeActionResponse(BaseModel):
     response: str
@@ -68,36 +129,296 @@ class CodeActionResponse(BaseModel):
     suggested_code: Optional[str] = None
     file_operations: List[Dict[str, Any]] = []
     commands: List[str] = []
+    patch: Optional[str] = None  # unified diff against `code` (output_mode="diff")
+    edit_format: Optional[str] = None  # "search_replace" or "unified_diff"
+    edit_error: Optional[str] = None  # edits that could not be applied to `code`
+    usage: Dict[str, int] = {}  # prompt_tokens / output_tokens reported by the model
+    context_stats: Dict[str, int] = {}  # estimated prompt tokens before/after deduplication
+    template_version: Optional[str] = None  # prompt template set the answer was generated with
 
 class FileOperationResponse(BaseModel):
     success: bool
     message: str
     content: Optional[str] = None
+    start_line: Optional[int] = None
+    end_line: Optional[int] = None
+    total_lines: Optional[int] = None
+
+class BatchFileOperation(BaseModel):
+    operation: str  # create, write, patch, delete, mkdir
+    file_path: str
+    content: Optional[str] = ""
+    patch: Optional[str] = ""  # unified diff, for "patch"
+    expected_hash: Optional[str] = None  # sha256 of the current content; checked before anything is written
+
+class BatchFileOperationRequest(BaseModel):
+    operations: List[BatchFileOperation]
+    workspace_path: Optional[str] = ""
+
+class BatchFileOperationResponse(BaseModel):
+    success: bool
+    message: str
+    rolled_back: bool = False
+    failed_index: Optional[int] = None
+    results: List[Dict[str, Any]] = []
+    total_ms: float = 0.0
+
+class SymbolUpdateRequest(BaseModel):
+    workspace_path: str
+    files: List[str] = []  # changed or deleted files; empty means rescan the workspace
+
+class PrewarmRequest(BaseModel):
+    context: str
+    language: Optional[str] = ""
+    current_file: Optional[str] = ""
+    prompt: Optional[str] = ""  # current line prefix, used for the speculative completion
+    speculate: bool = False  # also generate the likely completion into the completion cache
+    key: Optional[str] = ""  # defaults to current_file; a newer prewarm with the same key replaces the old one
+
+class PrewarmCancelRequest(BaseModel):
+    key: str
+
+class ChatCacheConfigRequest(BaseModel):
+    enabled: Optional[bool] = None
+    threshold: Optional[float] = None  # Jaccard similarity of prompt shingles, 0-1
+    clear: bool = False
+
+class SearchRequest(BaseModel):
+    query: str
+    workspace_path: str
+    top_k: int = 10
+    refresh: bool = True  # embed new/changed files before searching
+    include_snippets: bool = True
+
+class RuntimeOverridesRequest(BaseModel):
+    overrides: Dict[str, Any]  # runner options to pin; null removes an override
+
+class CompletionFeedbackRequest(BaseModel):
+    events: List[Dict[str, str]]  # {"completion_id", "event": "shown" | "accepted" | "dismissed"}
+
+class BlobCheckRequest(BaseModel):
+    hashes: List[str]
+
+class BlobUploadRequest(BaseModel):
+    blobs: List[Dict[str, str]]  # {"hash", "content"}
+
+# Record/replay: GEMMAPILOT_RECORD=<trace.jsonl[.gz]> records model calls and HTTP requests;
+# GEMMAPILOT_REPLAY=<trace> serves model calls from a trace instead of Ollama
+TRACE_RECORD_PATH = os.environ.get("GEMMAPILOT_RECORD")
+TRACE_REPLAY_PATH = os.environ.get("GEMMAPILOT_REPLAY")
+TRACE_REPLAY_SPEED = float(os.environ.get("GEMMAPILOT_REPLAY_SPEED", "1.0"))
 
 # Initialize Ollama with Gemma-3n 4B
 MODEL = "gemma3:4b"
-try:
-    ollama.pull(MODEL)
-    print(f"✅ Model {MODEL} loaded successfully")
-except Exception as e:
-    print(f"⚠️ Warning: Could not load model {MODEL}: {e}")
+if not TRACE_REPLAY_PATH:
+    try:
+        ollama.pull(MODEL)
+        print(f"✅ Model {MODEL} loaded successfully")
+    except Exception as e:
+        print(f"⚠️ Warning: Could not load model {MODEL}: {e}")
+
+# How long Ollama keeps the model (and its prompt cache) loaded after a request
+MODEL_KEEP_ALIVE = "30m"
+
+# Per-route model selection. Routes: "completion", "chat", "analysis.<analysis_type>",
+# "code_action.<action>". Entries in ~/.gemmapilot/model_routes.json override these.
+MODEL_ROUTES = {
+    "completion": {
+        "options": {"num_predict": 64},
+        "slo_p95_ms": 2000,
+        "fallback": ["gemma3:1b"],
+    },
+    # Contexts where completions are rarely accepted (see COMPLETION_ADAPTIVE)
+    "completion.cheap": {
+        "model": "gemma3:1b",
+        "options": {"num_predict": 24},
+    },
+    "chat": {},
+    "embedding": {"model": "nomic-embed-text"},
+}
+model_router = ModelRouter(
+    default_model=MODEL,
+    routes=MODEL_ROUTES,
+    config_path=os.path.join(os.path.expanduser("~/.gemmapilot"), "model_routes.json"),
+    metrics=metrics,
+)
+
+model_provider = OllamaProvider()
+trace_recorder = None
+replay_provider = None
+if TRACE_REPLAY_PATH:
+    model_provider = replay_provider = ReplayProvider(TRACE_REPLAY_PATH, speed=TRACE_REPLAY_SPEED)
+    print(f"⏪ Replaying {replay_provider.loaded} model calls from {TRACE_REPLAY_PATH} (speed {TRACE_REPLAY_SPEED}x)")
+if TRACE_RECORD_PATH:
+    trace_recorder = TraceRecorder(TRACE_RECORD_PATH)
+    model_provider = RecordingProvider(model_provider, trace_recorder)
+    app.add_middleware(TraceMiddleware, recorder=trace_recorder)
+    print(f"⏺️ Recording model calls and requests to {TRACE_RECORD_PATH}")
+
+# Fail fast while the model is down: after MODEL_FAILURE_THRESHOLD consecutive errors or slow calls
+# the circuit opens for MODEL_RECOVERY_SECONDS, then a single probe call decides whether it closes
+MODEL_FAILURE_THRESHOLD = 3
+MODEL_RECOVERY_SECONDS = 15
+MODEL_SLOW_CALL_SECONDS = 120
+COMPLETION_TIMEOUT = 5.0
+model_breaker = CircuitBreaker(failure_threshold=MODEL_FAILURE_THRESHOLD,
+                               recovery_timeout=MODEL_RECOVERY_SECONDS, metrics=metrics)
+llm = LLMClient(model_router, keep_alive=MODEL_KEEP_ALIVE, provider=model_provider,
+                breaker=model_breaker, slow_call_seconds=MODEL_SLOW_CALL_SECONDS)
+
+for fallback_model in sorted({m for route in MODEL_ROUTES.values() for m in route.get("fallback", [])}):
+    if TRACE_REPLAY_PATH:
+        break
+    try:
+        ollama.pull(fallback_model)
+    except Exception as e:
+        print(f"⚠️ Warning: Could not load fallback model {fallback_model}: {e}")
+
+# Completions keyed by model + full prompt; filled by /complete and speculative prewarm
+completion_cache = TTLCache(max_entries=1024, ttl=300)
+prewarm_scheduler = PrewarmScheduler()
+PREWARM_CHUNK_TOKENS = 256  # prompt tokens per prefill request; a foreground /complete waits for at most one
+degraded_completer = DegradedCompleter()
+
+# Adaptive triggering from editor feedback (/completion_feedback): once a context bucket has
+# COMPLETION_MIN_SAMPLES shown completions, low acceptance moves it to the cheap route or skips it
+COMPLETION_ADAPTIVE = True
+COMPLETION_MIN_SAMPLES = 30
+COMPLETION_SKIP_BELOW = 0.02
+COMPLETION_CHEAP_BELOW = 0.08
+completion_acceptance = AcceptanceTracker(min_samples=COMPLETION_MIN_SAMPLES, skip_below=COMPLETION_SKIP_BELOW,
+                                          cheap_below=COMPLETION_CHEAP_BELOW, enabled=COMPLETION_ADAPTIVE)
+
+# N-best alternatives (`n` on /complete): samples of the same prompt reuse Ollama's prompt KV cache,
+# extra samples must start and finish within COMPLETION_ALTERNATIVES_BUDGET seconds of the request
+COMPLETION_MAX_ALTERNATIVES = 5
+COMPLETION_ALTERNATIVES_TEMPERATURE = 0.8
+COMPLETION_ALTERNATIVES_BUDGET = 3.0
+# Reported when the model returns no logprobs to derive a confidence from
+COMPLETION_DEFAULT_CONFIDENCE = 0.8
+# Token log-probabilities for ranking need an ollama client (and server) that supports them
+COMPLETION_LOGPROBS = "logprobs" in inspect.signature(ollama.generate).parameters
+
+# Near-duplicate /chat answers, keyed on prompt similarity plus an exact context hash
+CHAT_CACHE_ENABLED = True
+CHAT_CACHE_THRESHOLD = 0.85
+chat_cache = ChatAnswerCache(threshold=CHAT_CACHE_THRESHOLD)
+
+# On-disk caches (symbol indexes, ...)
+CACHE_DIR = os.path.expanduser("~/.gemmapilot")
+symbol_indexes = SymbolIndexRegistry(os.path.join(CACHE_DIR, "symbols"))
+
+# CPU-aware runner options (num_thread, num_batch, num_ctx), calibrated once per host and model.
+# "overrides" in the profile file and route options in model_routes.json take precedence.
+RUNTIME_AUTOTUNE = True
+RUNTIME_PROFILE_PATH = os.path.join(CACHE_DIR, "runtime_profile.json")
+RUNTIME_TARGET_CONTEXT = 8192
+RUNTIME_PREFILL_BUDGET = 30.0  # seconds to prefill a full context window
+RUNTIME_OVERRIDE_KEYS = {"num_thread", "num_batch", "num_ctx", "numa", "use_mmap", "use_mlock"}
+
+def calibration_generate(prompt: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    return as_dict(model_provider.generate("calibration", model=MODEL, prompt=prompt, options=options,
+                                           keep_alive=MODEL_KEEP_ALIVE))
+
+runtime_tuner = RuntimeTuner(MODEL, RUNTIME_PROFILE_PATH, calibration_generate,
+                             target_context=RUNTIME_TARGET_CONTEXT, prefill_budget=RUNTIME_PREFILL_BUDGET,
+                             on_profile=lambda options: model_router.set_tuned_options(options, MODEL))
+dependency_graphs = DependencyGraphRegistry()
+
+# Semantic search: "ollama" uses the "embedding" route, "hashing" is an offline stand-in
+SEARCH_EMBEDDER = "ollama"
+SEARCH_REFRESH_INTERVAL = 5.0
+workspace_searches: Dict[str, WorkspaceSearch] = {}
+workspace_search_refreshed: Dict[str, float] = {}
+workspace_search_lock = threading.Lock()
+
+# Analysis types answered from static facts instead of the model
+STATIC_ANALYSIS_TYPES = ("overview", "dependencies")
+
+# Blocking file reads for prompt context run on this pool, in parallel, under a per-request deadline
+IO_POOL_WORKERS = 8
+CONTEXT_IO_DEADLINE = 2.0
+io_pool = IOPool(max_workers=IO_POOL_WORKERS, metrics=metrics)
+# Longer blocking jobs (static analysis, file operations and batches, git calls) use their own workers,
+# so they can't starve the context reads above
+JOB_POOL_WORKERS = 4
+job_pool = IOPool(max_workers=JOB_POOL_WORKERS, name="jobs")
+
+# Size of the default prompt context (see benchmarks/sweep_context.py for measuring other values)
+FILE_CONTEXT_MAX_LINES = 500
+WORKSPACE_TREE_DEPTH = 3
+WORKSPACE_TREE_MAX_LINES = 100
+
+# Prompt context minification: license headers and comments are kept unless asked
+# (a license header can matter, e.g. when asking about licensing or writing a new file's header)
+PROMPT_STRIP_LICENSE = False
+PROMPT_STRIP_COMMENTS = False
+
+# context_mode="git_diff": prompt context from `git status`/`git diff HEAD` of the workspace
+CONTEXT_MODES = ("default", "git_diff")
+GIT_DIFF_CONTEXT_LINES = 3
+GIT_STATUS_INTERVAL = 2.0
+GIT_CONTEXT_MAX_CHARS = 24000
+git_contexts = GitContextRegistry(status_interval=GIT_STATUS_INTERVAL, max_chars=GIT_CONTEXT_MAX_CHARS)
+
+# Action/analysis prompt templates: built-ins plus <name>.txt overrides, reloaded when the directory changes
+PROMPT_TEMPLATE_DIR = os.path.join(CACHE_DIR, "templates")
+PROMPT_TEMPLATE_RELOAD_INTERVAL = 2.0
+prompt_templates = PromptTemplateRegistry(PROMPT_TEMPLATE_DIR, reload_interval=PROMPT_TEMPLATE_RELOAD_INTERVAL)
+
+# Content-addressed store for attached file bodies (see /blobs endpoints)
+BLOB_STORE_MAX_BYTES = 64 * 1024 * 1024
+blob_store = BlobStore(max_bytes=BLOB_STORE_MAX_BYTES)
+
+# Persistent shells for /execute_command (cd/export/venv activation carry over)
+SHELL_SESSION_LIMIT = 8
+SHELL_SESSION_IDLE_TIMEOUT = 900
+COMMAND_TIMEOUT = 30
+shell_sessions = ShellSessionManager(max_sessions=SHELL_SESSION_LIMIT, idle_timeout=SHELL_SESSION_IDLE_TIMEOUT)
 
 # Helper functions
-def get_file_content(file_path: str, max_lines: int = 500) -> str:
-    """Read file content safely with line limit"""
+def read_file_window(file_path: str, max_lines: int = 500, start_line: Optional[int] = None,
+                     end_line: Optional[int] = None, center_line: Optional[int] = None):
+    """Read a line window of a file via the mmap line index
+
+    Line numbers are 1-based and inclusive. An explicit `start_line` wins over
+    `center_line`; with neither, the first `max_lines` lines are returned.
+    An `end_line` past the end of the file is clamped; a range that starts past
+    the end or ends before it starts raises ValueError.
+    Returns (content, first_line, last_line, total_lines).
+    """
+    total_lines = file_reader.index(file_path).line_count
+    if start_line is not None:
+        if start_line < 1:
+            raise ValueError(f"start_line must be at least 1, got {start_line}")
+        if end_line is not None and end_line < start_line:
+            raise ValueError(f"end_line {end_line} is before start_line {start_line}")
+        if start_line > total_lines:
+            raise ValueError(f"start_line {start_line} is past the end of the file ({total_lines} lines)")
+        start = start_line - 1
+        end = end_line if end_line is not None else start + max_lines
+    elif center_line is not None:
+        start, end = centered_window(center_line - 1, max_lines, total_lines)
+    else:
+        start, end = 0, max_lines
+    end = min(end, total_lines)
+    content, _ = file_reader.read_lines(file_path, start, end)
+    return content, min(start + 1, end), end, total_lines
+
+def get_file_content(file_path: str, max_lines: int = 500, start_line: Optional[int] = None,
+                     end_line: Optional[int] = None, center_line: Optional[int] = None) -> str:
+    """Read file content safely with line limit (optionally a range or a window around a line)"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            if len(lines) > max_lines:
-                content = ''.join(lines[:max_lines])
-                content += f"\n\n... (truncated, showing first {max_lines} lines of {len(lines)} total)"
-            else:
-                content = ''.join(lines)
+        content, first, last, total = read_file_window(file_path, max_lines, start_line, end_line, center_line)
+        if first <= 1 and last >= total:
             return content
+        if first <= 1:
+            return content + f"\n\n... (truncated, showing first {last} lines of {total} total)"
+        return content + f"\n\n... (truncated, showing lines {first}-{last} of {total} total)"
     except Exception as e:
         return f"Error reading file: {str(e)}"
 
-def get_workspace_structure(workspace_path: str, max_depth: int = 3) -> str:
+def get_workspace_structure(workspace_path: str, max_depth: int = 3, max_lines: int = 100) -> str:
     """Get workspace structure for context"""
     if not os.path.exists(workspace_path):
         return "Workspace path not found"
@@ -125,7 +446,111 @@ def get_workspace_structure(workspace_path: str, max_depth: int = 3) -> str:
     except Exception as e:
         return f"Error reading workspace: {str(e)}"
     
-    return '\n'.join(structure[:100])  # Limit total lines
+    return '\n'.join(structure[:max_lines])  # Limit total lines
+
+def resolve_blob(blob_hash: str, missing: List[str]) -> Optional[str]:
+    """Look up a blob by hash, recording it in `missing` if the store doesn't have it"""
+    content = blob_store.get(blob_hash)
+    if content is None:
+        missing.append(blob_hash)
+        metrics.incr("blobs.misses")
+        return None
+    metrics.incr("blobs.hits")
+    metrics.incr("blobs.bytes_saved", len(content.encode("utf-8")))
+    return content
+
+def raise_if_missing_blobs(missing: List[str]):
+    """Ask the client to upload missing blobs and retry (409 Conflict)"""
+    if missing:
+        raise HTTPException(status_code=409, detail={"error": "missing_blobs", "missing": missing})
+
+def remember_inline_blob(content: str):
+    """Cache an inline body in the blob store; bodies too large for the store are only used inline"""
+    size = len(content.encode("utf-8"))
+    metrics.incr("blobs.inline_bytes", size)
+    if size > blob_store.max_bytes:
+        metrics.incr("blobs.oversized")
+        return
+    blob_store.put(content)
+
+def resolve_attached_files(files: Optional[List[Dict[str, str]]]) -> List[Dict[str, str]]:
+    """Replace hash references in attached files with their stored content"""
+    resolved = []
+    missing: List[str] = []
+    for file_info in files or []:
+        file_info = dict(file_info)
+        if not file_info.get('content') and file_info.get('hash'):
+            content = resolve_blob(file_info['hash'], missing)
+            if content is not None:
+                file_info['content'] = content
+        elif file_info.get('content'):
+            # Keep inline bodies so the client can send just the hash next turn
+            remember_inline_blob(file_info['content'])
+        resolved.append(file_info)
+    raise_if_missing_blobs(missing)
+    return resolved
+
+def check_in_workspace(file_path: str, workspace_path: Optional[str]):
+    """Raise 403 if `file_path` is outside `workspace_path` (when one is given)"""
+    if workspace_path:
+        workspace_path = os.path.abspath(workspace_path)
+        abs_file_path = os.path.abspath(file_path)
+        if not abs_file_path.startswith(workspace_path):
+            raise HTTPException(status_code=403, detail="File path outside workspace not allowed")
+
+def focus_line(cursor_line: Optional[int], selection_start: Optional[int], selection_end: Optional[int]) -> Optional[int]:
+    """Line to centre the file context on: the middle of the selection, else the cursor"""
+    if selection_start is not None:
+        return (selection_start + (selection_end or selection_start)) // 2
+    return cursor_line
+
+def get_related_signatures(code: str, workspace_path: Optional[str], current_file: Optional[str] = None) -> str:
+    """Signatures of workspace symbols used in `code` that are defined outside `current_file`"""
+    if not code or not workspace_path or not os.path.isdir(workspace_path):
+        return ""
+    try:
+        index = symbol_indexes.get(workspace_path)
+        symbols = index.signatures_for(code, exclude_file=current_file or None)
+    except Exception as e:
+        print(f"⚠️ Warning: Symbol lookup failed: {e}")
+        return ""
+    lines = []
+    for symbol in symbols:
+        line = f"{symbol['file']}:{symbol['line']}: {symbol['signature']}"
+        if symbol.get("doc"):
+            line += f"  # {symbol['doc'][:120]}"
+        lines.append(line)
+    return "\n".join(lines)
+
+def file_state(path: Optional[str]) -> str:
+    """mtime:size of a file, or "" if it doesn't exist"""
+    try:
+        stat = os.stat(path) if path else None
+    except OSError:
+        return ""
+    return f"{stat.st_mtime_ns}:{stat.st_size}" if stat else ""
+
+def chat_context_hash(request: ChatRequest) -> str:
+    """Hash of everything besides the prompt that shapes a chat answer"""
+    current_file_state = file_state(request.current_file)
+    attachments = []
+    for f in request.files or []:
+        if f.get('content') or f.get('hash'):
+            attachments.append((f.get('path', ''), f.get('hash') or cache_key(f.get('content', ''))))
+        else:
+            attachments.append((f.get('path', ''), file_state(f.get('path'))))
+    git_state = ""
+    if request.context_mode == "git_diff" and request.workspace_path:
+        try:
+            git_state = git_contexts.get(request.workspace_path).context(diff_context_lines(request))["key"]
+        except (NotAGitRepository, RuntimeError):
+            pass  # create_enhanced_prompt reports it
+    return cache_key(
+        llm.resolve("chat")[0], request.workspace_path, request.current_file, current_file_state,
+        request.selection, request.context, attachments,
+        request.cursor_line, request.selection_start_line, request.selection_end_line,
+        request.context_mode, git_state
+    )
 
 def format_ai_response(response: str) -> str:
     """Format AI response for better display in VS Code"""
@@ -151,8 +576,70 @@ def format_ai_response(response: str) -> str:
     
     return formatted
 
-def create_enhanced_prompt(request: ChatRequest) -> str:
-    """Create enhanced prompt with context"""
+def pack_prompt_context(sections: List[Dict[str, Any]], strip_comments: Optional[bool]):
+    """Deduplicate/minify prompt sections and count the tokens saved"""
+    packed, report = pack_sections(
+        sections,
+        strip_license=PROMPT_STRIP_LICENSE,
+        strip_comments=PROMPT_STRIP_COMMENTS if strip_comments is None else strip_comments,
+    )
+    metrics.incr("prompt.tokens_before", report["tokens_before"])
+    metrics.incr("prompt.tokens_saved", report["tokens_saved"])
+    return packed, report
+
+def read_context_file(path: str, center_line: Optional[int] = None) -> Optional[str]:
+    """File content for a prompt, or None if the file doesn't exist"""
+    if not path or not os.path.isfile(path):
+        return None
+    return get_file_content(path, max_lines=FILE_CONTEXT_MAX_LINES, center_line=center_line)
+
+def read_workspace_structure(workspace_path: Optional[str]) -> Optional[str]:
+    if not workspace_path or not os.path.exists(workspace_path):
+        return None
+    return get_workspace_structure(workspace_path, WORKSPACE_TREE_DEPTH, WORKSPACE_TREE_MAX_LINES)
+
+def diff_context_lines(request) -> int:
+    if request.diff_context_lines is None:
+        return GIT_DIFF_CONTEXT_LINES
+    return max(0, min(request.diff_context_lines, 50))
+
+async def git_context_for(request):
+    """GitContext for a git_diff request's workspace (400 if the mode can't be used)"""
+    if request.context_mode not in CONTEXT_MODES:
+        raise HTTPException(status_code=400, detail=f"context_mode must be one of {', '.join(CONTEXT_MODES)}")
+    if not request.workspace_path or not os.path.isdir(request.workspace_path):
+        raise HTTPException(status_code=400, detail="context_mode git_diff needs a workspace_path")
+    try:
+        return await job_pool.run(git_contexts.get, request.workspace_path)
+    except NotAGitRepository as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def read_chat_context(request: ChatRequest):
+    """Read workspace structure, current file, related signatures and path-only attachments in parallel
+
+    In git_diff mode the uncommitted changes replace the structure and current file.
+    """
+    if request.context_mode == "default":
+        calls = {"structure": lambda: read_workspace_structure(request.workspace_path)}
+    else:
+        git = await git_context_for(request)
+        calls = {"git_diff": lambda: git.context(diff_context_lines(request))}
+    if request.current_file and "structure" in calls:
+        center_line = focus_line(request.cursor_line, request.selection_start_line, request.selection_end_line)
+        calls["current_file"] = lambda: read_context_file(request.current_file, center_line)
+    if request.selection:
+        calls["related"] = lambda: get_related_signatures(request.selection, request.workspace_path, request.current_file)
+    for i, file_info in enumerate(request.files or []):
+        path = file_info.get('path', '')
+        if path and not file_info.get('content'):
+            # Attached by path only: the server reads it (inside the workspace)
+            check_in_workspace(path, request.workspace_path)
+            calls[f"file:{i}"] = functools.partial(read_context_file, path)
+    return await io_pool.gather(calls, deadline=CONTEXT_IO_DEADLINE)
+
+async def create_enhanced_prompt(request: ChatRequest):
+    """Create enhanced prompt with context; returns (prompt, context_stats)"""
+    reads, timed_out = await read_chat_context(request)
     prompt_parts = []
     
     # Add system context
@@ -160,51 +647,262 @@ def create_enhanced_prompt(request: ChatRequest) -> str:
     prompt_parts.append("You can analyze code, suggest improvements, help with debugging, and assist with development tasks.")
     prompt_parts.append("Provide helpful, accurate, and well-formatted responses.")
     
+    # Context sections as (heading, section), deduplicated against each other below
+    sections = []
+    
+    # Add uncommitted changes (git_diff mode)
+    git_diff = reads.get("git_diff")
+    if git_diff is not None:
+        sections.append(("Uncommitted changes (git diff)", section("the uncommitted changes", git_diff["text"], raw=True)))
+    
     # Add workspace context if available
-    if request.workspace_path and os.path.exists(request.workspace_path):
-        structure = get_workspace_structure(request.workspace_path)
-        prompt_parts.append(f"\nWorkspace structure:\n{structure}")
+    if reads.get("structure") is not None:
+        sections.append(("Workspace structure", section("the workspace structure", reads["structure"])))
     
     # Add current file context
-    if request.current_file and os.path.exists(request.current_file):
-        file_content = get_file_content(request.current_file)
+    file_content = reads.get("current_file")
+    if file_content is not None:
         file_name = os.path.basename(request.current_file)
-        prompt_parts.append(f"\nCurrent file ({file_name}):\n```\n{file_content}\n```")
+        sections.append((f"Current file ({file_name})",
+                         section(f"the current file ({file_name})", file_content, path=request.current_file)))
     
     # Add selection context
+    related = reads.get("related")
     if request.selection:
-        prompt_parts.append(f"\nSelected code:\n```\n{request.selection}\n```")
+        sections.append(("Selected code", section("the selected code", request.selection, path=request.current_file)))
     
     # Add attached files
     if request.files:
-        for file_info in request.files:
+        for i, file_info in enumerate(request.files):
             file_path = file_info.get('path', '')
-            file_content = file_info.get('content', '')
+            file_content = file_info.get('content') or reads.get(f"file:{i}")
             if file_content:
-                prompt_parts.append(f"\nAttached file ({file_path}):\n```\n{file_content}\n```")
+                sections.append((f"Attached file ({file_path})",
+                                 section(f"attached file {file_path}", file_content, path=file_path)))
     
     # Add general context
     if request.context:
-        prompt_parts.append(f"\nAdditional context:\n{request.context}")
+        sections.append(("Additional context", section("the additional context", request.context, prose=True)))
+    
+    packed, report = pack_prompt_context([entry for _, entry in sections], request.strip_comments)
+    report["io_timeouts"] = len(timed_out)
+    if git_diff is not None:
+        report["git_files"], report["git_hunks"] = git_diff["files"], git_diff["hunks"]
+    for (heading, entry), result in zip(sections, packed):
+        if not result["text"]:
+            continue
+        if result["reference"]:
+            prompt_parts.append(f"\n{heading}: {result['text']}")
+        elif entry["prose"] or heading == "Workspace structure":
+            prompt_parts.append(f"\n{heading}:\n{result['text']}")
+        else:
+            prompt_parts.append(f"\n{heading}:\n```\n{result['text']}\n```")
+        if heading == "Selected code" and related:
+            prompt_parts.append(f"\nDefinitions used in the selection:\n{related}")
     
     # Add user prompt
     prompt_parts.append(f"\nUser request: {request.prompt}")
     
-    return "\n".join(prompt_parts)
+    return "\n".join(prompt_parts), report
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "model": MODEL, "features": ["chat", "file_analysis", "code_completion", "command_execution"]}
+    return {
+        "status": "healthy",
+        "model": MODEL,
+        "routes": {name: route["model"] for name, route in model_router.snapshot()["routes"].items()},
+        "model_circuit": model_breaker.state,
+        "runtime_profile": runtime_tuner.summary(),
+        "features": ["chat", "file_analysis", "code_completion", "command_execution"]
+    }
+
+@app.get("/routing")
+async def get_routing():
+    """Active model per route, SLOs and recent fallback switches"""
+    return model_router.snapshot()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Counters and latency percentiles collected since startup"""
+    snapshot = metrics.snapshot()
+    snapshot["blob_store"] = blob_store.stats()
+    snapshot["completion_cache"] = completion_cache.stats()
+    snapshot["prewarm"] = prewarm_scheduler.stats()
+    snapshot["chat_cache"] = {"enabled": CHAT_CACHE_ENABLED, **chat_cache.stats()}
+    snapshot["routing"] = model_router.snapshot()
+    snapshot["shell_sessions"] = shell_sessions.stats()
+    snapshot["io_pool"] = io_pool.stats()
+    snapshot["job_pool"] = job_pool.stats()
+    snapshot["model_circuit"] = model_breaker.stats()
+    snapshot["degraded_completions"] = degraded_completer.stats()
+    snapshot["completion_acceptance"] = {k: v for k, v in completion_acceptance.stats().items() if k != "buckets"}
+    snapshot["git_context"] = git_contexts.stats()
+    snapshot["prompt_templates"] = {"version": prompt_templates.version, "reloads": prompt_templates.reloads,
+                                    "errors": len(prompt_templates.errors)}
+    if replay_provider is not None:
+        snapshot["replay"] = replay_provider.stats()
+    if trace_recorder is not None:
+        snapshot["recording"] = {"trace": trace_recorder.path, "records": trace_recorder.records}
+    return snapshot
+
+@app.post("/chat_cache/config")
+async def configure_chat_cache(request: ChatCacheConfigRequest):
+    """Enable/disable the chat answer cache, change its similarity threshold or clear it"""
+    global CHAT_CACHE_ENABLED
+    if request.enabled is not None:
+        CHAT_CACHE_ENABLED = request.enabled
+    if request.threshold is not None:
+        if not 0 < request.threshold <= 1:
+            raise HTTPException(status_code=400, detail="threshold must be in (0, 1]")
+        chat_cache.threshold = request.threshold
+    if request.clear:
+        chat_cache.clear()
+    return {"enabled": CHAT_CACHE_ENABLED, **chat_cache.stats()}
+
+@app.get("/templates")
+async def get_templates():
+    """Active prompt templates, their hashes and the combined version"""
+    return prompt_templates.snapshot()
+
+@app.post("/templates/reload")
+async def reload_templates():
+    """Recompile templates from the template directory now"""
+    changed = await asyncio.to_thread(prompt_templates.reload, True)
+    return {"reloaded": changed, **prompt_templates.snapshot()}
+
+@app.get("/symbols/outline")
+async def get_symbol_outline(workspace_path: str, file_path: str):
+    """Definitions in one file (name, kind, line, signature, doc)"""
+    if not os.path.isdir(workspace_path):
+        raise HTTPException(status_code=404, detail="Workspace not found")
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    # The first use of a workspace loads its saved index from disk
+    index = await asyncio.to_thread(symbol_indexes.get, workspace_path, refresh=False)
+    return {"file_path": file_path, "symbols": await asyncio.to_thread(index.outline, file_path)}
+
+@app.get("/symbols/lookup")
+async def lookup_symbol(workspace_path: str, name: str, kind: str = "", include_references: bool = False):
+    """Find definitions of `name` (or `Class.method`) across the workspace"""
+    if not os.path.isdir(workspace_path):
+        raise HTTPException(status_code=404, detail="Workspace not found")
+    index = await asyncio.to_thread(symbol_indexes.get, workspace_path)
+    result: Dict[str, Any] = {"name": name, "definitions": index.lookup(name, kind or None)}
+    if include_references:
+        result["referenced_in"] = await asyncio.to_thread(index.references, name.rsplit('.', 1)[-1])
+    return result
+
+@app.post("/symbols/update")
+async def update_symbols(request: SymbolUpdateRequest):
+    """Re-index changed files (or the whole workspace when no files are given)"""
+    if not os.path.isdir(request.workspace_path):
+        raise HTTPException(status_code=404, detail="Workspace not found")
+    index = await asyncio.to_thread(symbol_indexes.get, request.workspace_path, refresh=False)
+    if not request.files:
+        return await asyncio.to_thread(index.refresh)
+    updated = [path for path in request.files if await asyncio.to_thread(index.update_file, path)]
+    if updated:
+        await asyncio.to_thread(index.save)
+    return {"files": len(index.files), "updated": len(updated)}
+
+def get_workspace_search(workspace_path: str) -> WorkspaceSearch:
+    """Search index for a workspace, created (and its embedding size probed) on first use"""
+    workspace_path = os.path.abspath(workspace_path)
+    with workspace_search_lock:
+        search = workspace_searches.get(workspace_path)
+        if search is None:
+            if SEARCH_EMBEDDER == "hashing":
+                embedder, embedder_name = HashingEmbedder(), "hashing-256"
+            else:
+                embedder = lambda texts: llm.embed("embedding", texts)
+                embedder_name = llm.resolve("embedding")[0]
+            dim = len(embedder(["dimension probe"])[0])
+            safe = lambda name: re.sub(r'[^A-Za-z0-9_.-]', '_', name.strip(os.sep)) or 'root'
+            index_dir = os.path.join(CACHE_DIR, "vectors", safe(embedder_name), safe(workspace_path))
+            search = WorkspaceSearch(workspace_path, index_dir, embedder, dim)
+            workspace_searches[workspace_path] = search
+        return search
+
+@app.post("/search")
+async def semantic_search(request: SearchRequest):
+    """Semantic code search over embedded workspace chunks"""
+    if not os.path.isdir(request.workspace_path):
+        raise HTTPException(status_code=404, detail="Workspace not found")
+    try:
+        search = await asyncio.to_thread(get_workspace_search, request.workspace_path)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Embedding model unavailable: {str(e)}")
+    
+    refresh_stats = None
+    key = search.workspace_path
+    now = time.monotonic()
+    if request.refresh and now - workspace_search_refreshed.get(key, float('-inf')) >= SEARCH_REFRESH_INTERVAL:
+        workspace_search_refreshed[key] = now
+        refresh_stats = await asyncio.to_thread(search.refresh)
+    
+    start = time.perf_counter()
+    try:
+        results = await asyncio.to_thread(search.search, request.query, request.top_k)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Search error: {str(e)}")
+    search_ms = (time.perf_counter() - start) * 1000
+    metrics.observe("search", search_ms / 1000)
+    
+    if request.include_snippets:
+        for result in results:
+            result["snippet"] = get_file_content(result["full_path"], start_line=result["start_line"],
+                                                 end_line=result["end_line"])
+    
+    return {
+        "query": request.query,
+        "results": results,
+        "chunks": search.index.size,
+        "search_ms": round(search_ms, 2),
+        "refresh": refresh_stats
+    }
+
+@app.post("/blobs/check")
+async def check_blobs(request: BlobCheckRequest):
+    """Report which content hashes the server does not have yet"""
+    missing = blob_store.missing(request.hashes)
+    return {"missing": missing, "known": len(request.hashes) - len(missing)}
+
+@app.post("/blobs")
+async def upload_blobs(request: BlobUploadRequest):
+    """Upload blob contents; each hash is verified against its content"""
+    stored = []
+    for blob in request.blobs:
+        content = blob.get("content", "")
+        try:
+            stored.append(blob_store.put(content, expected_hash=blob.get("hash")))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        metrics.incr("blobs.uploaded")
+        metrics.incr("blobs.uploaded_bytes", len(content.encode("utf-8")))
+    return {"stored": stored}
 
 @app.post("/chat", response_model=ChatResponse)
 async def enhanced_chat(request: ChatRequest):
     """Enhanced chat with context awareness and file access"""
+    request.files = resolve_attached_files(request.files)
+    context_hash = await job_pool.run(chat_context_hash, request)
+    if CHAT_CACHE_ENABLED and request.use_cache:
+        cached = chat_cache.lookup(request.prompt, context_hash)
+        if cached is not None:
+            metrics.incr("chat.cache_hits")
+            return ChatResponse(**{k: v for k, v in cached.items() if k not in ("similarity", "cached_at")},
+                                cached=True, cache_similarity=cached["similarity"])
+    elif CHAT_CACHE_ENABLED:
+        chat_cache.record_bypass()
+    
     try:
         # Create enhanced prompt with context
-        enhanced_prompt = create_enhanced_prompt(request)
+        enhanced_prompt, context_stats = await create_enhanced_prompt(request)
         
         # Get AI response
-        response = ollama.chat(model=MODEL, messages=[{"role": "user", "content": enhanced_prompt}])
+        response = await asyncio.to_thread(llm.chat, "chat", messages=[{"role": "user", "content": enhanced_prompt}])
         ai_response = response["message"]["content"]
         
         # Format the response
@@ -225,41 +923,98 @@ async def enhanced_chat(request: ChatRequest):
         potential_commands = re.findall(command_pattern, ai_response)
         commands_suggested = [cmd for cmd in potential_commands if any(cmd.startswith(prefix) for prefix in ['npm', 'git', 'python', 'node', 'pip', 'cd', 'ls', 'mkdir', 'touch', 'curl', 'docker'])]
         
-        return ChatResponse(
+        chat_response = ChatResponse(
             response=ai_response,
             formatted_response=formatted_response,
             suggestions=suggestions,
             files_referenced=files_referenced,
-            commands_suggested=commands_suggested
+            commands_suggested=commands_suggested,
+            context_stats=context_stats
         )
+        if CHAT_CACHE_ENABLED:
+            chat_cache.store(request.prompt, context_hash, chat_response.dict(exclude={"cached", "cache_similarity"}))
+        return chat_response
         
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
+def build_analysis_prompt(analysis_type: str, file_ext: str, file_content: str) -> str:
+    """Create analysis prompt based on type"""
+    return prompt_templates.render(f"analysis.{analysis_type}", "analysis.default",
+                                   analysis_type=analysis_type, file_ext=file_ext, file_content=file_content)
+
+def build_narrative_prompt(request: FileAnalysisRequest, file_ext: str, facts_report: str) -> str:
+    """Ask the model to summarize precomputed static facts"""
+    return prompt_templates.render("analysis.narrative", analysis_type=request.analysis_type, file_ext=file_ext,
+                                   file_name=os.path.basename(request.file_path), facts=facts_report)
+
+def static_file_analysis(request: FileAnalysisRequest) -> Dict[str, Any]:
+    """Imports, exports, dependency graph and metrics computed without the model"""
+    workspace_path = request.workspace_path or find_workspace_root(request.file_path)
+    if workspace_path:
+        graph = dependency_graphs.get(workspace_path)
+    else:
+        # Not inside a project: analyse just this file instead of scanning its directory tree
+        graph = DependencyGraph(os.path.dirname(os.path.abspath(request.file_path)))
+    entry = graph.update_file(request.file_path)
+    facts = entry["facts"]
+    dependents = graph.dependents(request.file_path)
+    file_name = os.path.basename(request.file_path)
+    analysis = format_facts(file_name, facts, entry["deps"], dependents, request.analysis_type)
+    return {
+        "facts": {**facts, "local_dependencies": entry["deps"], "dependents": dependents,
+                  # False while the workspace scan is incomplete (or skipped), so `dependents` may miss files
+                  "dependents_complete": bool(workspace_path) and graph.scanned and not graph.truncated},
+        "analysis": analysis,
+    }
+
 @app.post("/analyze_file")
 async def analyze_file(request: FileAnalysisRequest):
     """Analyze a specific file"""
-    try:
-        if not os.path.exists(request.file_path):
-            raise HTTPException(status_code=404, detail="File not found")
+    if not await io_pool.run(os.path.exists, request.file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    file_ext = os.path.splitext(request.file_path)[1]
+    if request.analysis_type in STATIC_ANALYSIS_TYPES and file_ext in LANGUAGE_BY_EXTENSION:
+        start = time.perf_counter()
+        try:
+            result = await job_pool.run(static_file_analysis, request)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Analysis error: {str(e)}")
+        metrics.observe("analyze_file.static", time.perf_counter() - start)
         
-        file_content = get_file_content(request.file_path)
-        file_name = os.path.basename(request.file_path)
-        file_ext = os.path.splitext(request.file_path)[1]
-        
-        # Create analysis prompt based on type
-        if request.analysis_type == "overview":
-            prompt = f"Analyze this {file_ext} file and provide an overview of its purpose, structure, and key components:\n\n{file_content}"
-        elif request.analysis_type == "issues":
-            prompt = f"Review this {file_ext} file for potential issues, bugs, or improvements:\n\n{file_content}"
-        elif request.analysis_type == "suggestions":
-            prompt = f"Suggest improvements and best practices for this {file_ext} file:\n\n{file_content}"
-        elif request.analysis_type == "dependencies":
-            prompt = f"Analyze the dependencies and imports in this {file_ext} file:\n\n{file_content}"
-        else:
-            prompt = f"Analyze this {file_ext} file:\n\n{file_content}"
+        analysis = result["analysis"]
+        if request.narrative:
+            prompt = build_narrative_prompt(request, file_ext, analysis)
+            try:
+                response = await asyncio.to_thread(llm.chat, f"analysis.{request.analysis_type}",
+                                                   messages=[{"role": "user", "content": prompt}])
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Analysis error: {str(e)}")
+            analysis = response["message"]["content"] + "\n\n---\n\n" + analysis
         
-        response = ollama.chat(model=MODEL, messages=[{"role": "user", "content": prompt}])
+        return {
+            "file_path": request.file_path,
+            "file_name": os.path.basename(request.file_path),
+            "analysis_type": request.analysis_type,
+            "analysis": analysis,
+            "formatted_analysis": format_ai_response(analysis),
+            "facts": result["facts"],
+            "static": True,
+            "template_version": prompt_templates.version if request.narrative else None
+        }
+    
+    try:
+        file_content = await io_pool.run(get_file_content, request.file_path)
+        file_name = os.path.basename(request.file_path)
+        prompt = build_analysis_prompt(request.analysis_type, file_ext, file_content)
+        template_version = prompt_templates.version
+        response = await asyncio.to_thread(llm.chat, f"analysis.{request.analysis_type}",
+                                           messages=[{"role": "user", "content": prompt}])
         analysis = response["message"]["content"]
         
         return {
@@ -267,7 +1022,8 @@ async def analyze_file(request: FileAnalysisRequest):
             "file_name": file_name,
             "analysis_type": request.analysis_type,
             "analysis": analysis,
-            "formatted_analysis": format_ai_response(analysis)
+            "formatted_analysis": format_ai_response(analysis),
+            "template_version": template_version
         }
         
     except Exception as e:
@@ -299,6 +1055,9 @@ async def execute_command(request: CommandRequest):
             if re.search(pattern, request.command, re.IGNORECASE):
                 raise HTTPException(status_code=403, detail=f"Command blocked for security: {request.command}")
         
+        if request.session_id or request.persistent:
+            return await execute_in_session(request)
+        
         # Execute command in workspace directory
         result = subprocess.run(
             request.command,
@@ -306,7 +1065,7 @@ async def execute_command(request: CommandRequest):
             cwd=request.workspace_path,
             capture_output=True,
             text=True,
-            timeout=30  # 30 second timeout
+            timeout=COMMAND_TIMEOUT
         )
         
         return {
@@ -320,9 +1079,133 @@ async def execute_command(request: CommandRequest):
         
     except subprocess.TimeoutExpired:
         raise HTTPException(status_code=408, detail="Command timeout")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Execution error: {str(e)}")
 
+async def execute_in_session(request: CommandRequest):
+    """Run an approved command in a persistent shell session"""
+    if request.session_id:
+        session = shell_sessions.get(request.session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail=f"Unknown or expired shell session: {request.session_id}")
+        if os.path.realpath(session.workspace_path) != os.path.realpath(request.workspace_path):
+            raise HTTPException(status_code=400, detail="Shell session belongs to a different workspace")
+    else:
+        try:
+            session = await asyncio.to_thread(shell_sessions.for_workspace, request.workspace_path)
+        except SessionLimitError as e:
+            raise HTTPException(status_code=429, detail=str(e))
+    
+    try:
+        result = await asyncio.to_thread(session.run, request.command, COMMAND_TIMEOUT)
+    except TimeoutError:
+        metrics.incr("shell_sessions.timeouts")
+        raise HTTPException(status_code=408, detail="Command timeout (shell session was closed)")
+    except SessionClosedError as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    metrics.incr("shell_sessions.commands")
+    metrics.observe("shell_sessions.command", result["duration_ms"] / 1000)
+    
+    return {
+        "command": request.command,
+        "exit_code": result["exit_code"],
+        "stdout": result["stdout"],
+        "stderr": result["stderr"],
+        "explanation": request.explanation,
+        "success": result["exit_code"] == 0,
+        "session_id": session.session_id,
+        "session_alive": result["session_alive"],
+        "truncated": result["truncated"]
+    }
+
+@app.post("/shell_sessions")
+async def create_shell_session(request: ShellSessionRequest):
+    """Start a persistent shell in a workspace; pass its session_id to /execute_command"""
+    if not request.workspace_path or not os.path.isdir(request.workspace_path):
+        raise HTTPException(status_code=400, detail="Invalid workspace path")
+    try:
+        session = await asyncio.to_thread(shell_sessions.create, request.workspace_path)
+    except SessionLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return session.info()
+
+@app.get("/shell_sessions")
+async def list_shell_sessions():
+    return {**shell_sessions.stats(), "sessions": shell_sessions.list()}
+
+@app.delete("/shell_sessions/{session_id}")
+async def close_shell_session(session_id: str):
+    if not await asyncio.to_thread(shell_sessions.close, session_id):
+        raise HTTPException(status_code=404, detail=f"Unknown shell session: {session_id}")
+    return {"closed": session_id}
+
+@app.on_event("startup")
+async def load_runtime_profile():
+    if RUNTIME_AUTOTUNE and not TRACE_REPLAY_PATH:
+        runtime_tuner.start()  # calibrates in the background when there is no matching profile
+    else:
+        runtime_tuner.ensure(calibrate=False)
+
+@app.get("/runtime_profile")
+async def get_runtime_profile():
+    """Detected hardware, calibration results and the runner options in use"""
+    return runtime_tuner.snapshot()
+
+@app.post("/runtime_profile/calibrate")
+async def recalibrate_runtime_profile():
+    """Re-run the runtime micro-benchmark in the background"""
+    if TRACE_REPLAY_PATH:
+        raise HTTPException(status_code=400, detail="Calibration needs a live model (replay mode is on)")
+    return {"started": runtime_tuner.start(force=True), "status": runtime_tuner.status}
+
+@app.post("/runtime_profile/overrides")
+async def set_runtime_overrides(request: RuntimeOverridesRequest):
+    """Pin runner options (e.g. {"num_thread": 16}); null removes an override"""
+    unknown = set(request.overrides) - RUNTIME_OVERRIDE_KEYS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown runner options: {', '.join(sorted(unknown))}")
+    overrides = await asyncio.to_thread(runtime_tuner.set_overrides, request.overrides)
+    return {"overrides": overrides, "options": runtime_tuner.options()}
+
+@app.on_event("shutdown")
+async def close_shell_sessions():
+    shell_sessions.close_all()
+
+@app.on_event("shutdown")
+async def close_trace():
+    if trace_recorder is not None:
+        trace_recorder.close()
+
+def build_completion_prefix(language: str, context: str) -> str:
+    """Document-dependent start of the completion prompt (shared with prewarm so the KV cache is reused)"""
+    return f"""You are an expert {language} developer. Complete the following code:
+
+Context from file:
+{context}
+
+Current line/code to complete:
+"""
+
+def build_completion_prompt(prompt: str, context: str, language: str) -> str:
+    return build_completion_prefix(language, context) + f"""{prompt}
+
+Provide a concise, accurate completion that follows best practices for {language}."""
+
+def clean_completion(completion: str) -> str:
+    """Clean up completion (remove explanations, just return code)"""
+    lines = completion.strip().split('\n')
+    code_lines = []
+    for line in lines:
+        if not line.strip().startswith('#') and not line.strip().startswith('//'):
+            code_lines.append(line)
+        if len(code_lines) >= 3:  # Limit completion length
+            break
+    return '\n'.join(code_lines)
+
 @app.post("/complete")
 async def complete_code(data: dict):
     """Enhanced code completion with better context"""
@@ -332,40 +1215,211 @@ async def complete_code(data: dict):
         language = data.get("language", "")
         current_file = data.get("current_file", "")
         
+        # Skip or cheapen generation where completions are rarely accepted
+        decision = completion_acceptance.decide(prompt, language)
+        metrics.incr(f"complete.mode.{decision['mode']}")
+        if decision["mode"] == SKIP:
+            return {"completion": "", "language": language, "skipped": True, "mode": SKIP}
+        route = "completion.cheap" if decision["mode"] == CHEAP else "completion"
+        # Alternatives cost extra generations, so the cheap mode only ever gets one
+        n = 1 if decision["mode"] == CHEAP else max(1, min(int(data.get("n") or 1), COMPLETION_MAX_ALTERNATIVES))
+        
         # Enhanced completion prompt
-        completion_prompt = f"""You are an expert {language} developer. Complete the following code:
-
-Context from file:
-{context}
-
-Current line/code to complete:
-{prompt}
-
-Provide a concise, accurate completion that follows best practices for {language}."""
+        completion_prompt = build_completion_prompt(prompt, context, language)
+        model, _ = llm.resolve(route)
+        key = cache_key(model, completion_prompt)
+        alternatives_key = cache_key(model, completion_prompt, "alternatives", n)
+        cached = completion_cache.get(alternatives_key) if n > 1 else completion_cache.get(key)
+        if cached is not None:
+            metrics.incr("complete.cache_hits")
+            result = completion_result(cached, language, decision) if n > 1 else {
+                "completion": cached[0],
+                "confidence": cached[1],
+                "language": language,
+                "mode": decision["mode"],
+                "completion_id": completion_acceptance.issue(language, decision["bucket"])
+            }
+            result["cached"] = True
+            return result
         
-        response = ollama.generate(model=MODEL, prompt=completion_prompt)
-        completion = response["response"].strip()
+        if model_breaker.is_open:
+            return degraded_completion(prompt, context, language)
         
-        # Clean up completion (remove explanations, just return code)
-        lines = completion.split('\n')
-        code_lines = []
-        for line in lines:
-            if not line.strip().startswith('#') and not line.strip().startswith('//'):
-                code_lines.append(line)
-            if len(code_lines) >= 3:  # Limit completion length
-                break
+        start = time.monotonic()
+        generate_options = {"logprobs": True} if COMPLETION_LOGPROBS else {}
+        outcome = CallOutcome()
+        try:
+            with prewarm_scheduler.foreground():
+                response = await asyncio.wait_for(
+                    asyncio.to_thread(llm.generate, route, completion_prompt, model=model,
+                                      options={"temperature": 0} if n > 1 else None,
+                                      slow_after=COMPLETION_TIMEOUT, outcome=outcome, **generate_options),
+                    COMPLETION_TIMEOUT,
+                )
+        except asyncio.TimeoutError:
+            # The worker thread keeps running; claiming the outcome stops it from counting this again
+            if outcome.claim():
+                model_breaker.record_failure(f"completion timed out after {COMPLETION_TIMEOUT}s")
+            return degraded_completion(prompt, context, language, "Model timed out")
+        except CircuitOpenError:
+            return degraded_completion(prompt, context, language)
+        except Exception as e:
+            return degraded_completion(prompt, context, language, str(e))
         
-        clean_completion = '\n'.join(code_lines)
+        clean = clean_completion(response["response"])
+        logprob = mean_logprob(response)
+        confidence = round(math.exp(logprob), 3) if logprob is not None else COMPLETION_DEFAULT_CONFIDENCE
+        completion_cache.set(key, (clean, confidence))
+        degraded_completer.remember(language, prompt, clean)
         
-        return {
-            "completion": clean_completion,
-            "confidence": 0.8,
-            "language": language
-        }
+        if n == 1:
+            return {
+                "completion": clean,
+                "confidence": confidence,
+                "language": language,
+                "mode": decision["mode"],
+                "completion_id": completion_acceptance.issue(language, decision["bucket"])
+            }
+        
+        # Further samples of the same prompt; sequential so each one reuses the prompt's KV cache
+        def generate_sample(options: Dict[str, Any]):
+            return llm.generate(route, completion_prompt, model=model, options=options,
+                                slow_after=COMPLETION_TIMEOUT, **generate_options)
+        
+        deadline = start + COMPLETION_ALTERNATIVES_BUDGET
+        try:
+            with prewarm_scheduler.foreground():
+                sampled = await asyncio.wait_for(
+                    asyncio.to_thread(
+                        sample_alternatives, generate_sample, clean_completion, n,
+                        deadline=deadline, first=response,
+                        temperature=COMPLETION_ALTERNATIVES_TEMPERATURE,
+                    ),
+                    max(0.0, deadline - time.monotonic()),
+                )
+        except asyncio.TimeoutError:
+            # A sample is still running past the budget: answer with the greedy completion alone.
+            # The thread starts no further samples (they are past the deadline).
+            metrics.incr("complete.alternatives.timeouts")
+            sampled = {"alternatives": rank([{"text": clean, "logprob": logprob, "greedy": True}]),
+                       "samples": 1, "prefill_tokens": []}
+        metrics.observe("complete.alternatives", time.monotonic() - start)
+        metrics.incr("complete.alternatives.samples", sampled["samples"])
+        metrics.incr("complete.alternatives.prefill_tokens", sum(sampled["prefill_tokens"][1:]))
+        alternatives = sampled["alternatives"]
+        if not alternatives:
+            alternatives = [{"completion": clean, "score": 0.0, "confidence": 0.0, "votes": 1, "greedy": True,
+                             "scoring": "none"}]
+        if sampled["samples"] == n:
+            completion_cache.set(alternatives_key, alternatives)
+        return completion_result(alternatives, language, decision)
         
     except Exception as e:
         return {"completion": "", "error": str(e)}
 
+def completion_result(alternatives: List[Dict[str, Any]], language: str, decision: Dict[str, Any]) -> Dict[str, Any]:
+    """/complete response for ranked alternatives; the best one is also the `completion`"""
+    return {
+        "completion": alternatives[0]["completion"],
+        "confidence": alternatives[0]["confidence"],
+        "alternatives": alternatives,
+        "language": language,
+        "mode": decision["mode"],
+        "completion_id": completion_acceptance.issue(language, decision["bucket"])
+    }
+
+@app.post("/completion_feedback")
+async def completion_feedback(request: CompletionFeedbackRequest):
+    """Record whether completions were shown, accepted or dismissed in the editor"""
+    recorded = 0
+    for event in request.events:
+        if completion_acceptance.record(event.get("completion_id", ""), event.get("event", "")):
+            recorded += 1
+            metrics.incr(f"complete.feedback.{event['event']}")
+    return {"recorded": recorded, "unknown": len(request.events) - recorded}
+
+@app.get("/completion_feedback")
+async def get_completion_feedback():
+    """Acceptance rates per language and context bucket, and how often each mode was used"""
+    return completion_acceptance.stats()
+
+def degraded_completion(prompt: str, context: str, language: str, error: Optional[str] = None) -> Dict[str, Any]:
+    """Local suggestion used while the model is unavailable"""
+    start = time.perf_counter()
+    suggestion = degraded_completer.suggest(prompt, context, language)
+    metrics.observe("complete.degraded", time.perf_counter() - start)
+    metrics.incr(f"complete.degraded.{suggestion['source']}")
+    result = {
+        "completion": suggestion["completion"],
+        "confidence": 0.3 if suggestion["completion"] else 0.0,
+        "language": language,
+        "degraded": True,
+        "degraded_source": suggestion["source"]
+    }
+    if error:
+        result["error"] = error
+    return result
+
+async def run_prewarm(request: PrewarmRequest, cancel_event: threading.Event):
+    """Prefill the document's completion prefix, then optionally fill the completion cache"""
+    if model_breaker.is_open:
+        return
+    start = time.perf_counter()
+    # The completion route's options: a different num_ctx or runner option would not reuse the KV cache
+    model, options = llm.resolve("completion")
+    prefix = build_completion_prefix(request.language, request.context)
+    for step in prefix_steps(prefix, PREWARM_CHUNK_TOKENS):
+        if cancel_event.is_set():
+            return
+        # num_predict=1: Ollama evaluates the prompt (filling its KV cache) and stops right away.
+        # Leaving the loop closes the stream, which makes Ollama drop the request.
+        stream = iterate_in_thread(
+            lambda step=step: llm.generate("prewarm", step, stream=True, model=model,
+                                           options={**options, "num_predict": 1}, use_breaker=False)
+        )
+        async for chunk in stream:
+            if chunk.get("done") or cancel_event.is_set():
+                break
+        await stream.aclose()
+    if cancel_event.is_set():
+        return
+    metrics.observe("prewarm.prefill", time.perf_counter() - start)
+    
+    if not request.speculate or not request.prompt:
+        return
+    completion_prompt = build_completion_prompt(request.prompt, request.context, request.language)
+    key = cache_key(model, completion_prompt)
+    if completion_cache.get(key) is not None:
+        return
+    
+    chunks = []
+    stream = iterate_in_thread(
+        lambda: llm.generate("completion", completion_prompt, stream=True, model=model, use_breaker=False),
+        cancel_event=cancel_event,
+    )
+    async for chunk in stream:
+        if cancel_event.is_set():
+            return
+        chunks.append(chunk.get("response", ""))
+        if chunk.get("done"):
+            break
+    if not cancel_event.is_set():
+        completion_cache.set(key, (clean_completion("".join(chunks)), COMPLETION_DEFAULT_CONFIDENCE))
+        metrics.incr("prewarm.speculative_completions")
+
+@app.post("/prewarm")
+async def prewarm(request: PrewarmRequest):
+    """Queue a low-priority prewarm of a document's completion context"""
+    key = request.key or request.current_file or cache_key(request.language, request.context)
+    prewarm_scheduler.submit(key, lambda cancel_event: run_prewarm(request, cancel_event))
+    metrics.incr("prewarm.requests")
+    return {"queued": True, "key": key}
+
+@app.post("/prewarm/cancel")
+async def cancel_prewarm(request: PrewarmCancelRequest):
+    """Drop a pending prewarm or stop a running one"""
+    return {"cancelled": prewarm_scheduler.cancel(request.key)}
+
 @app.get("/workspace_files")
 async def get_workspace_files(workspace_path: str, file_extension: str = ""):
     """Get list of files in workspace"""
@@ -398,7 +1452,7 @@ async def get_workspace_files(workspace_path: str, file_extension: str = ""):
 
 @app.websocket("/ws/complete")
 async def websocket_complete(websocket: WebSocket):
-    """Enhanced WebSocket for real-time completion"""
+    """Enhanced WebSocket for real-time completion (protocol v1, see /ws/v2/complete)"""
     await websocket.accept()
     try:
         while True:
@@ -408,17 +1462,9 @@ async def websocket_complete(websocket: WebSocket):
             language = data.get("language", "")
             
             # Enhanced streaming completion
-            completion_prompt = f"""Complete this {language} code:
-            
-Context:
-{context}
-
-Code to complete:
-{prompt}
-
-Provide only the completion, no explanations."""
+            completion_prompt = build_ws_completion_prompt(prompt, context, language)
             
-            response = ollama.generate(model=MODEL, prompt=completion_prompt, stream=True)
+            response = llm.generate("completion", completion_prompt, stream=True)
             
             completion_text = ""
             for chunk in response:
@@ -438,145 +1484,283 @@ Provide only the completion, no explanations."""
     finally:
         await websocket.close()
 
-@app.post("/code_action", response_model=CodeActionResponse)
-async def handle_code_action(request: CodeActionRequest):
-    """Handle code actions like explain, fix, optimize, generate tests, etc."""
-    try:
-        # Build context for the AI
-        context_parts = []
-        
-        if request.file_path and os.path.exists(request.file_path):
-            file_content = get_file_content(request.file_path)
-            context_parts.append(f"Current file: {request.file_path}\n{file_content}")
-        
-        if request.workspace_path and os.path.exists(request.workspace_path):
-            workspace_structure = get_workspace_structure(request.workspace_path)
-            context_parts.append(f"Workspace structure:\n{workspace_structure}")
-        
-        context = "\n\n".join(context_parts)
-        
-        # Create action-specific prompts
-        action_prompts = {
-            "explain_code": f"""Please explain this {request.language} code in detail:
-
-```{request.language}
-{request.code}
-```
-
-Provide a clear, comprehensive explanation of:
-1. What the code does
-2. How it works
-3. Key concepts used
-4. Any potential issues or improvements
+# Version 2 of the WebSocket completion protocol.
+#
+# Client -> server frames:
+#   {"type": "complete", "id": "<request id>", "prompt", "context", "language"}
+#   {"type": "cancel", "id": "<request id>"}
+#   {"type": "ping"} / {"type": "pong"}
+# Server -> client frames:
+#   {"type": "hello", "version": 2, "model"}           once, after accept
+#   {"type": "delta", "id", "text"}                     new tokens only
+#   {"type": "done", "id", "finish_reason", "tokens"}   "stop" or "cancelled"
+#   {"type": "error", "id", "error"}                    connection stays open
+#   {"type": "ping", "ts"} / {"type": "pong", "ts"}     keepalive
+WS_PROTOCOL_VERSION = 2
+WS_PING_INTERVAL = 20  # seconds
+WS_MAX_IN_FLIGHT = 8
 
-Context: {context}""",
+def build_ws_completion_prompt(prompt: str, context: str, language: str) -> str:
+    """Completion prompt used by the WebSocket endpoints"""
+    return f"""Complete this {language} code:
+            
+Context:
+{context}
 
-            "fix_code": f"""Please analyze this {request.language} code for issues and provide fixes:
+Code to complete:
+{prompt}
 
-```{request.language}
-{request.code}
-```
+Provide only the completion, no explanations."""
 
-Please:
-1. Identify any bugs, errors, or issues
-2. Provide corrected code
-3. Explain what was wrong and how you fixed it
-4. Suggest best practices
+@app.websocket("/ws/v2/complete")
+async def websocket_complete_v2(websocket: WebSocket):
+    """Multiplexed streaming completions with token deltas and per-request errors"""
+    await websocket.accept()
+    send_lock = asyncio.Lock()
+    in_flight: Dict[str, Dict[str, Any]] = {}
 
-Context: {context}""",
+    async def send(frame: Dict[str, Any]):
+        async with send_lock:
+            await websocket.send_json(frame)
 
-            "optimize_code": f"""Please optimize this {request.language} code for better performance and readability:
+    async def run_completion(request_id: str, data: Dict[str, Any], cancel_event: threading.Event):
+        completion_prompt = build_ws_completion_prompt(
+            data.get("prompt", ""), data.get("context", ""), data.get("language", "")
+        )
+        start = time.perf_counter()
+        tokens = 0
+        bytes_sent = 0
+        try:
+            stream = iterate_in_thread(
+                lambda: llm.generate("completion", completion_prompt, stream=True),
+                cancel_event=cancel_event,
+            )
+            async for chunk in stream:
+                text = chunk.get("response")
+                if text:
+                    tokens += 1
+                    bytes_sent += len(text.encode("utf-8"))
+                    if tokens == 1:
+                        metrics.observe("ws.first_token", time.perf_counter() - start)
+                    await send({"type": "delta", "id": request_id, "text": text})
+                if chunk.get("done"):
+                    break
+            finish_reason = "cancelled" if cancel_event.is_set() else "stop"
+            await send({"type": "done", "id": request_id, "finish_reason": finish_reason, "tokens": tokens})
+            metrics.observe("ws.completion", time.perf_counter() - start)
+            metrics.incr("ws.delta_bytes", bytes_sent)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            metrics.incr("ws.errors")
+            await send({"type": "error", "id": request_id, "error": str(e)})
+        finally:
+            in_flight.pop(request_id, None)
 
-```{request.language}
-{request.code}
-```
+    async def keepalive():
+        while True:
+            await asyncio.sleep(WS_PING_INTERVAL)
+            await send({"type": "ping", "ts": time.time()})
 
-Please:
-1. Analyze current performance characteristics
-2. Provide optimized version
-3. Explain the improvements made
-4. Consider memory usage, speed, and maintainability
+    await send({"type": "hello", "version": WS_PROTOCOL_VERSION, "model": llm.resolve("completion")[0]})
+    pinger = asyncio.create_task(keepalive())
+    try:
+        while True:
+            data = await websocket.receive_json()
+            frame_type = data.get("type", "complete")
+            request_id = str(data.get("id", ""))
 
-Context: {context}""",
+            if frame_type == "ping":
+                await send({"type": "pong", "ts": time.time()})
+            elif frame_type == "pong":
+                continue
+            elif frame_type == "cancel":
+                entry = in_flight.get(request_id)
+                if entry:
+                    entry["cancel"].set()
+            elif frame_type == "complete":
+                if not request_id:
+                    await send({"type": "error", "id": None, "error": "Missing request id"})
+                elif request_id in in_flight:
+                    await send({"type": "error", "id": request_id, "error": "Duplicate request id"})
+                elif len(in_flight) >= WS_MAX_IN_FLIGHT:
+                    await send({"type": "error", "id": request_id, "error": "Too many requests in flight"})
+                else:
+                    cancel_event = threading.Event()
+                    task = asyncio.create_task(run_completion(request_id, data, cancel_event))
+                    in_flight[request_id] = {"task": task, "cancel": cancel_event}
+            else:
+                await send({"type": "error", "id": request_id or None, "error": f"Unknown frame type: {frame_type}"})
 
-            "generate_tests": f"""Please generate comprehensive tests for this {request.language} code:
+    except WebSocketDisconnect:
+        pass
+    finally:
+        pinger.cancel()
+        for entry in list(in_flight.values()):
+            entry["cancel"].set()
+            entry["task"].cancel()
 
-```{request.language}
-{request.code}
-```
+def resolve_code_action_code(request: CodeActionRequest):
+    """Fill `request.code` from the blob store when only `code_hash` was sent"""
+    if not request.code and request.code_hash:
+        missing: List[str] = []
+        request.code = resolve_blob(request.code_hash, missing) or ""
+        raise_if_missing_blobs(missing)
+    elif request.code:
+        remember_inline_blob(request.code)
 
-Please:
-1. Create unit tests that cover all functionality
-2. Include edge cases and error conditions
-3. Use appropriate testing framework for {request.language}
-4. Provide clear test descriptions
+def code_action_template_version(request: CodeActionRequest) -> Optional[str]:
+    """Template set behind a code action prompt; edit-mode prompts don't come from the registry"""
+    return None if uses_edit_mode(request) else prompt_templates.version
 
-Context: {context}""",
+async def build_code_action_messages(request: CodeActionRequest):
+    """System and user messages for a code action; returns (messages, context_stats)"""
+    if request.action == "review_changes":
+        request.context_mode = "git_diff"
+    if request.context_mode == "default":
+        center_line = focus_line(None, request.selection_start_line, request.selection_end_line)
+        calls = {
+            "current_file": lambda: read_context_file(request.file_path, center_line),
+            "structure": lambda: read_workspace_structure(request.workspace_path),
+        }
+    else:
+        git = await git_context_for(request)
+        calls = {"git_diff": lambda: git.context(diff_context_lines(request))}
+    calls["related"] = lambda: get_related_signatures(request.code, request.workspace_path, request.file_path)
+    reads, timed_out = await io_pool.gather(calls, deadline=CONTEXT_IO_DEADLINE)
+    
+    # Build context for the AI; the code itself is shown verbatim and only referenced from the context
+    sections = [("", section("the code", request.code, language=request.language, raw=True))]
+    
+    git_diff = reads.get("git_diff")
+    if git_diff is not None:
+        sections.append(("Uncommitted changes (git diff):", section("the uncommitted changes", git_diff["text"], raw=True)))
+    
+    if reads.get("current_file") is not None:
+        sections.append((f"Current file: {request.file_path}",
+                         section("the current file", reads["current_file"], path=request.file_path)))
+    
+    if reads.get("structure") is not None:
+        sections.append(("Workspace structure:", section("the workspace structure", reads["structure"])))
+    
+    related = reads["related"]
+    if related:
+        sections.append(("Definitions used in the code:", section("the definitions", related)))
+    
+    packed, report = pack_prompt_context([entry for _, entry in sections], request.strip_comments)
+    report["io_timeouts"] = len(timed_out)
+    if git_diff is not None:
+        report["git_files"], report["git_hunks"] = git_diff["files"], git_diff["hunks"]
+    context_parts = []
+    for (heading, _), result in list(zip(sections, packed))[1:]:
+        if result["text"]:
+            separator = " " if result["reference"] else "\n"
+            context_parts.append(f"{heading}{separator}{result['text']}")
+    context = "\n\n".join(context_parts)
+    
+    if uses_edit_mode(request):
+        prompt = build_edit_prompt(request.action, request.language, request.code, context)
+    else:
+        prompt = prompt_templates.render(f"code_action.{request.action}", "code_action.default",
+                                         language=request.language, code=request.code, context=context)
+    
+    return [
+        {"role": "system", "content": "You are an expert software developer and code assistant. Provide helpful, accurate, and detailed responses about code."},
+        {"role": "user", "content": prompt}
+    ], report
 
-            "generate_docs": f"""Please generate comprehensive documentation for this {request.language} code:
+def uses_edit_mode(request: CodeActionRequest) -> bool:
+    return request.output_mode == "diff" and request.action in EDIT_ACTIONS
 
-```{request.language}
-{request.code}
-```
+def model_usage(response) -> Dict[str, int]:
+    """Token counts from an Ollama response (absent on some versions)"""
+    usage = {}
+    if response.get("prompt_eval_count") is not None:
+        usage["prompt_tokens"] = response["prompt_eval_count"]
+    if response.get("eval_count") is not None:
+        usage["output_tokens"] = response["eval_count"]
+    return usage
 
-Please:
-1. Create detailed docstrings/comments
-2. Document parameters, return values, and exceptions
-3. Provide usage examples
-4. Include any relevant notes or warnings
+def parse_code_action_response(ai_response: str, request: Optional[CodeActionRequest] = None) -> CodeActionResponse:
+    """Pull suggested code, file operations and install commands out of a model answer"""
+    # Extract code blocks and file operations from response
+    suggested_code = None
+    file_operations = []
+    commands = []
+    
+    # Look for code blocks in the response
+    code_block = CODE_FENCE.search(ai_response)
+    if code_block:
+        suggested_code = code_block.group(2).strip()
+    
+    # Look for file operation suggestions
+    if "create file" in ai_response.lower() or "new file" in ai_response.lower():
+        file_operations.append({
+            "type": "create_file",
+            "description": "Create new file as suggested by AI"
+        })
+    
+    # Look for command suggestions
+    command_patterns = [
+        r'npm install ([\w\-@/]+)',
+        r'pip install ([\w\-]+)',
+        r'cargo add ([\w\-]+)',
+        r'yarn add ([\w\-@/]+)'
+    ]
+    
+    for pattern in command_patterns:
+        matches = re.findall(pattern, ai_response)
+        for match in matches:
+            commands.append(f"Install package: {match}")
+    
+    # Edit mode: apply the model's edits to the original code
+    patch = edit_format = edit_error = None
+    if request is not None and uses_edit_mode(request):
+        suggested_code = None
+        try:
+            edits = apply_model_edits(request.code, ai_response)
+            if edits is None:
+                edit_error = "Response contained no edits"
+            else:
+                suggested_code, patch, edit_format = edits["result"], edits["patch"], edits["format"]
+        except EditError as e:
+            edit_error = str(e)
+        if edit_error:
+            metrics.incr("code_action.edit_failures")
+    
+    return CodeActionResponse(
+        response=ai_response,
+        formatted_response=ai_response.replace('\n', '<br>'),
+        suggested_code=suggested_code,
+        file_operations=file_operations,
+        commands=commands,
+        patch=patch,
+        edit_format=edit_format,
+        edit_error=edit_error
+    )
 
-Context: {context}"""
-        }
-        
-        prompt = action_prompts.get(request.action, f"Please help with this {request.language} code:\n\n```{request.language}\n{request.code}\n```")
+@app.post("/code_action", response_model=CodeActionResponse)
+async def handle_code_action(request: CodeActionRequest):
+    """Handle code actions like explain, fix, optimize, generate tests, etc."""
+    resolve_code_action_code(request)
+    try:
+        messages, context_stats = await build_code_action_messages(request)
+        template_version = code_action_template_version(request)
         
         # Get AI response
-        response = ollama.chat(model=MODEL, messages=[
-            {"role": "system", "content": "You are an expert software developer and code assistant. Provide helpful, accurate, and detailed responses about code."},
-            {"role": "user", "content": prompt}
-        ])
-        
+        response = await asyncio.to_thread(llm.chat, f"code_action.{request.action}", messages=messages)
         ai_response = response['message']['content']
         
-        # Extract code blocks and file operations from response
-        suggested_code = None
-        file_operations = []
-        commands = []
-        
-        # Look for code blocks in the response
-        import re
-        code_blocks = re.findall(r'```\w*\n(.*?)\n```', ai_response, re.DOTALL)
-        if code_blocks:
-            suggested_code = code_blocks[0].strip()
-        
-        # Look for file operation suggestions
-        if "create file" in ai_response.lower() or "new file" in ai_response.lower():
-            file_operations.append({
-                "type": "create_file",
-                "description": "Create new file as suggested by AI"
-            })
-        
-        # Look for command suggestions
-        command_patterns = [
-            r'npm install ([\w\-@/]+)',
-            r'pip install ([\w\-]+)',
-            r'cargo add ([\w\-]+)',
-            r'yarn add ([\w\-@/]+)'
-        ]
-        
-        for pattern in command_patterns:
-            matches = re.findall(pattern, ai_response)
-            for match in matches:
-                commands.append(f"Install package: {match}")
-        
-        return CodeActionResponse(
-            response=ai_response,
-            formatted_response=ai_response.replace('\n', '<br>'),
-            suggested_code=suggested_code,
-            file_operations=file_operations,
-            commands=commands
-        )
+        result = parse_code_action_response(ai_response, request)
+        result.usage = model_usage(response)
+        result.context_stats = context_stats
+        result.template_version = template_version
+        return result
         
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"Error in code_action: {e}")
         raise HTTPException(status_code=500, detail=f"Code action failed: {str(e)}")
@@ -584,15 +1768,15 @@ Context: {context}"""
 @app.post("/file_operation", response_model=FileOperationResponse)
 async def handle_file_operation(request: FileOperationRequest):
     """Handle file operations like create, read, write, delete"""
+    return await job_pool.run(file_operation, request)
+
+def file_operation(request: FileOperationRequest) -> FileOperationResponse:
+    """Blocking part of /file_operation (runs on the I/O pool)"""
     try:
         file_path = request.file_path
         
         # Security check - ensure file is within workspace
-        if request.workspace_path:
-            workspace_path = os.path.abspath(request.workspace_path)
-            abs_file_path = os.path.abspath(file_path)
-            if not abs_file_path.startswith(workspace_path):
-                raise HTTPException(status_code=403, detail="File path outside workspace not allowed")
+        check_in_workspace(file_path, request.workspace_path)
         
         if request.operation == "create":
             # Create directory if it doesn't exist
@@ -606,8 +1790,7 @@ async def handle_file_operation(request: FileOperationRequest):
                 )
             
             # Create file with content
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(request.content or "")
+            atomic_write(file_path, request.content or "")
             
             return FileOperationResponse(
                 success=True,
@@ -621,6 +1804,25 @@ async def handle_file_operation(request: FileOperationRequest):
                     message=f"File {file_path} not found"
                 )
             
+            if request.start_line is not None or request.end_line is not None:
+                try:
+                    content, first, last, total = read_file_window(
+                        file_path, start_line=request.start_line or 1, end_line=request.end_line
+                    )
+                except ValueError as e:
+                    return FileOperationResponse(
+                        success=False,
+                        message=f"Invalid line range for {file_path}: {e}"
+                    )
+                return FileOperationResponse(
+                    success=True,
+                    message=f"File {file_path} lines {first}-{last} read successfully",
+                    content=content,
+                    start_line=first,
+                    end_line=last,
+                    total_lines=total
+                )
+            
             content = get_file_content(file_path)
             return FileOperationResponse(
                 success=True,
@@ -632,8 +1834,7 @@ async def handle_file_operation(request: FileOperationRequest):
             # Create directory if it doesn't exist
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
             
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(request.content or "")
+            atomic_write(file_path, request.content or "")
             
             return FileOperationResponse(
                 success=True,
@@ -673,3 +1874,132 @@ async def handle_file_operation(request: FileOperationRequest):
             message=f"File operation failed: {str(e)}"
         )
 
+
+
+@app.post("/file_operations/batch", response_model=BatchFileOperationResponse)
+async def handle_file_operations_batch(request: BatchFileOperationRequest):
+    """Apply many file operations (including unified-diff patches) atomically"""
+    for op in request.operations:
+        check_in_workspace(op.file_path, request.workspace_path)
+
+    start = time.perf_counter()
+    result = await job_pool.run(apply_batch, [op.dict() for op in request.operations])
+    total_ms = round((time.perf_counter() - start) * 1000, 3)
+    metrics.observe("file_operations.batch", total_ms / 1000)
+
+    if result["success"]:
+        message = f"Applied {len(request.operations)} operations"
+    else:
+        metrics.incr("file_operations.batch_failures")
+        message = f"Operation {result['failed_index']} failed: {result['error']}"
+        if result["rolled_back"]:
+            message += " (batch rolled back)"
+
+    return BatchFileOperationResponse(
+        success=result["success"],
+        message=message,
+        rolled_back=result["rolled_back"],
+        failed_index=result.get("failed_index"),
+        results=result["results"],
+        total_ms=total_ms
+    )
+
+
+async def stream_chat_events(route: str, messages: List[Dict[str, str]], stop_after_code: bool = False,
+                             early_code: bool = True):
+    """Stream a model answer as SSE "token" events, plus "suggested_code" when the first code block closes
+
+    Yields (frame, full_text) pairs; full_text is set only on the last item. With
+    `early_code=False` no "suggested_code" event is sent (and `stop_after_code` has no effect).
+    """
+    cancel_event = threading.Event()
+    watcher = CodeFenceWatcher()
+    start = time.perf_counter()
+    stream = iterate_in_thread(lambda: llm.chat(route, messages=messages, stream=True), cancel_event=cancel_event)
+    async for chunk in stream:
+        delta = chunk.get("message", {}).get("content", "")
+        if delta:
+            yield sse_event("token", {"text": delta}), None
+            block = watcher.feed(delta)
+            if block is not None and early_code:
+                metrics.observe(f"stream.first_code_block.{route}", time.perf_counter() - start)
+                yield sse_event("suggested_code", block), None
+                if stop_after_code:
+                    cancel_event.set()
+                    break
+        if chunk.get("done"):
+            break
+    yield "", watcher.text
+
+@app.post("/code_action/stream")
+async def handle_code_action_stream(request: CodeActionRequest):
+    """Streaming /code_action: tokens as they arrive, suggested_code as soon as it is complete"""
+    resolve_code_action_code(request)
+    messages, context_stats = await build_code_action_messages(request)
+    template_version = code_action_template_version(request)
+    
+    # Edit mode: the first fence holds SEARCH/REPLACE edits, not code, and an answer may have several.
+    # Stream the whole answer and send suggested_code only once the edits have been applied.
+    edit_mode = uses_edit_mode(request)
+    
+    async def events():
+        try:
+            async for frame, full_text in stream_chat_events(f"code_action.{request.action}", messages,
+                                                             request.stop_after_code and not edit_mode,
+                                                             early_code=not edit_mode):
+                if full_text is None:
+                    yield frame
+                else:
+                    result = parse_code_action_response(full_text, request)
+                    result.context_stats = context_stats
+                    result.template_version = template_version
+                    if edit_mode and result.suggested_code is not None:
+                        yield sse_event("suggested_code", {"language": request.language, "code": result.suggested_code})
+                    yield sse_event("done", result.dict())
+        except Exception as e:
+            print(f"Error in code_action stream: {e}")
+            yield sse_event("error", {"error": f"Code action failed: {str(e)}"})
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.post("/analyze_file/stream")
+async def analyze_file_stream(request: FileAnalysisRequest):
+    """Streaming /analyze_file; static analysis types send their facts immediately"""
+    if not await io_pool.run(os.path.exists, request.file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    file_ext = os.path.splitext(request.file_path)[1]
+    file_name = os.path.basename(request.file_path)
+    route = f"analysis.{request.analysis_type}"
+    
+    async def events():
+        try:
+            result = None
+            if request.analysis_type in STATIC_ANALYSIS_TYPES and file_ext in LANGUAGE_BY_EXTENSION:
+                result = await job_pool.run(static_file_analysis, request)
+                yield sse_event("facts", {"facts": result["facts"], "analysis": result["analysis"]})
+                if not request.narrative:
+                    analysis = result["analysis"]
+                    yield sse_event("done", {"file_path": request.file_path, "file_name": file_name,
+                                             "analysis_type": request.analysis_type, "analysis": analysis,
+                                             "formatted_analysis": format_ai_response(analysis), "static": True})
+                    return
+                prompt = build_narrative_prompt(request, file_ext, result["analysis"])
+            else:
+                file_content = await io_pool.run(get_file_content, request.file_path)
+                prompt = build_analysis_prompt(request.analysis_type, file_ext, file_content)
+            
+            async for frame, full_text in stream_chat_events(route, [{"role": "user", "content": prompt}]):
+                if full_text is None:
+                    yield frame
+                    continue
+                analysis = full_text if result is None else full_text + "\n\n---\n\n" + result["analysis"]
+                yield sse_event("done", {"file_path": request.file_path, "file_name": file_name,
+                                         "analysis_type": request.analysis_type, "analysis": analysis,
+                                         "formatted_analysis": format_ai_response(analysis),
+                                         "static": result is not None,
+                                         "template_version": prompt_templates.version})
+        except Exception as e:
+            yield sse_event("error", {"error": f"Analysis error: {str(e)}"})
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
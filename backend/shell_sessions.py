@@ -0,0 +1,277 @@
+"""
+Persistent shell sessions for `/execute_command`.
+
+A session is one long-lived `bash` process per workspace. Commands are written
+to its stdin, so `cd`, `export`, `source venv/bin/activate` and shell
+functions carry over between commands, and later commands skip the process
+spawn and environment initialization.
+
+Each command is followed by a sentinel line (unique per session) on stdout
+and stderr. The sentinel on stdout also carries the command's exit code, so
+the reader knows where one command's output ends and the next begins.
+"""
+
+import os
+import queue
+import re
+import shutil
+import signal
+import subprocess
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+MAX_OUTPUT_CHARS = 1_000_000
+
+
+class SessionLimitError(RuntimeError):
+    """All session slots are busy"""
+
+
+class SessionClosedError(RuntimeError):
+    """The session's shell has exited"""
+
+
+def find_shell() -> Optional[str]:
+    return shutil.which("bash") or shutil.which("sh")
+
+
+class ShellSession:
+    """One persistent shell process with sentinel-delimited commands"""
+
+    def __init__(self, workspace_path: str, shell: Optional[str] = None, env: Optional[Dict[str, str]] = None):
+        shell = shell or find_shell()
+        if shell is None:
+            raise RuntimeError("No POSIX shell available for persistent sessions")
+        self.session_id = uuid.uuid4().hex
+        self.workspace_path = workspace_path
+        self.created_at = time.time()
+        self.last_used = time.monotonic()
+        self.commands_run = 0
+        self.lock = threading.Lock()
+        self._sentinel = f"__GEMMAPILOT_DONE_{uuid.uuid4().hex}__"
+        self._sentinel_line = re.compile(re.escape(self._sentinel) + r"(?::(-?\d+))?\n?$")
+
+        args = [shell, "--noprofile", "--norc"] if os.path.basename(shell) == "bash" else [shell]
+        self.process = subprocess.Popen(
+            args,
+            cwd=workspace_path,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            env=env,
+            start_new_session=True,
+        )
+        self._stdout: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._stderr: "queue.Queue[Optional[str]]" = queue.Queue()
+        for stream, lines in ((self.process.stdout, self._stdout), (self.process.stderr, self._stderr)):
+            threading.Thread(target=self._pump, args=(stream, lines), daemon=True).start()
+
+    @staticmethod
+    def _pump(stream, lines: "queue.Queue[Optional[str]]") -> None:
+        for line in iter(stream.readline, ''):
+            lines.put(line)
+        lines.put(None)
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    @property
+    def busy(self) -> bool:
+        return self.lock.locked()
+
+    def _collect(self, lines: "queue.Queue[Optional[str]]", deadline: float):
+        """Read one command's output up to the sentinel; returns (text, exit_code, truncated)"""
+        parts: List[str] = []
+        size = 0
+        truncated = False
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError
+            try:
+                line = lines.get(timeout=remaining)
+            except queue.Empty:
+                raise TimeoutError
+            if line is None:
+                return "".join(parts), None, truncated
+            index = line.find(self._sentinel)
+            if index != -1:
+                match = self._sentinel_line.match(line, index)
+                if match:
+                    parts.append(line[:index])
+                    exit_code = int(match.group(1)) if match.group(1) is not None else None
+                    return "".join(parts), exit_code, truncated
+            if size < MAX_OUTPUT_CHARS:
+                parts.append(line[:MAX_OUTPUT_CHARS - size])
+                size += len(line)
+            truncated = truncated or size > MAX_OUTPUT_CHARS
+
+    def run(self, command: str, timeout: float = 30) -> Dict[str, Any]:
+        """Run `command` in the session; raises TimeoutError (and kills the shell) on timeout"""
+        with self.lock:
+            if not self.alive:
+                raise SessionClosedError(f"Session {self.session_id} has exited")
+            self.last_used = time.monotonic()
+            start = time.perf_counter()
+            # Braces keep cd/export in this shell; stdin is detached so the
+            # command can't swallow the sentinel lines that follow it
+            script = (
+                f"{{ {command}\n}} </dev/null\n"
+                f"__gp_rc=$?\n"
+                f"printf '%s:%s\\n' '{self._sentinel}' \"$__gp_rc\"\n"
+                f"printf '%s\\n' '{self._sentinel}' >&2\n"
+            )
+            try:
+                self.process.stdin.write(script)
+                self.process.stdin.flush()
+            except (BrokenPipeError, OSError):
+                raise SessionClosedError(f"Session {self.session_id} has exited")
+
+            deadline = time.monotonic() + timeout
+            try:
+                stdout, exit_code, stdout_truncated = self._collect(self._stdout, deadline)
+                stderr, _, stderr_truncated = self._collect(self._stderr, deadline)
+            except TimeoutError:
+                self.close()
+                raise
+            if exit_code is None:
+                # The command ended the shell (e.g. `exit 3`)
+                try:
+                    exit_code = self.process.wait(timeout=1)
+                except subprocess.TimeoutExpired:
+                    exit_code = -1
+            self.commands_run += 1
+            self.last_used = time.monotonic()
+            return {
+                "exit_code": exit_code,
+                "stdout": stdout,
+                "stderr": stderr,
+                "truncated": stdout_truncated or stderr_truncated,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                "session_alive": self.alive,
+            }
+
+    def close(self) -> None:
+        if self.alive:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (OSError, AttributeError):
+                self.process.kill()
+            self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout, self.process.stderr):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "workspace_path": self.workspace_path,
+            "created_at": self.created_at,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1),
+            "commands_run": self.commands_run,
+            "busy": self.busy,
+            "alive": self.alive,
+        }
+
+
+class ShellSessionManager:
+    """Bounded set of shell sessions with idle expiry and one default session per workspace"""
+
+    def __init__(self, max_sessions: int = 8, idle_timeout: float = 900.0):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.created = 0
+        self.expired = 0
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, ShellSession]" = OrderedDict()
+        self._defaults: Dict[str, str] = {}  # workspace path -> session id
+
+    def _drop(self, session_id: str) -> Optional[ShellSession]:
+        """Remove a session from the registry (caller holds the lock)"""
+        session = self._sessions.pop(session_id, None)
+        if session is not None and self._defaults.get(session.workspace_path) == session_id:
+            del self._defaults[session.workspace_path]
+        return session
+
+    def reap(self) -> None:
+        """Close sessions that exited or have been idle longer than idle_timeout"""
+        now = time.monotonic()
+        with self._lock:
+            stale = [s for s in self._sessions.values()
+                     if not s.alive or (not s.busy and now - s.last_used > self.idle_timeout)]
+            for session in stale:
+                self._drop(session.session_id)
+                self.expired += 1
+        for session in stale:
+            session.close()
+
+    def create(self, workspace_path: str) -> ShellSession:
+        """Start a new session, evicting the least recently used idle one when at the cap"""
+        self.reap()
+        evicted = None
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                idle = [s for s in self._sessions.values() if not s.busy]
+                if not idle:
+                    raise SessionLimitError(f"All {self.max_sessions} shell sessions are busy")
+                evicted = self._drop(min(idle, key=lambda s: s.last_used).session_id)
+        if evicted is not None:
+            evicted.close()
+        session = ShellSession(workspace_path)
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._defaults.setdefault(workspace_path, session.session_id)
+            self.created += 1
+        return session
+
+    def get(self, session_id: str) -> Optional[ShellSession]:
+        self.reap()
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def for_workspace(self, workspace_path: str) -> ShellSession:
+        """The workspace's default session, started on first use"""
+        self.reap()
+        with self._lock:
+            session_id = self._defaults.get(workspace_path)
+            session = self._sessions.get(session_id) if session_id else None
+        return session or self.create(workspace_path)
+
+    def close(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._drop(session_id)
+        if session is None:
+            return False
+        session.close()
+        return True
+
+    def close_all(self) -> None:
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+            self._defaults.clear()
+        for session in sessions:
+            session.close()
+
+    def list(self) -> List[Dict[str, Any]]:
+        self.reap()
+        with self._lock:
+            return [s.info() for s in self._sessions.values()]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_timeout": self.idle_timeout,
+                "created": self.created,
+                "expired": self.expired,
+            }
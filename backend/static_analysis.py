@@ -0,0 +1,414 @@
+"""
+Static file facts: imports, exports, local dependency graph and basic metrics.
+
+These are exact and cheap to compute, so `/analyze_file` answers the
+"dependencies" and "overview" analysis types from here instead of asking the
+model to read the file. The per-workspace dependency graph is cached per file
+and only re-parsed when a file's mtime or size changes. Workspace scans run
+in the background and are bounded by file count and time, so a request only
+ever parses the file it asks about. Files outside any project are analysed
+on their own.
+"""
+
+import ast
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from symbol_index import LANGUAGE_BY_EXTENSION, SKIP_DIRS, extract_symbols
+
+JS_IMPORT = re.compile(
+    r'''(?:^|[;\s])(?:import\s+(?:[\w*{}\s,$]+\s+from\s+)?|export\s+(?:[\w*{}\s,$]+\s+)?from\s+)['"]([^'"]+)['"]'''
+    r'''|\brequire\(\s*['"]([^'"]+)['"]\s*\)|\bimport\(\s*['"]([^'"]+)['"]\s*\)''',
+    re.MULTILINE,
+)
+JS_EXPORT = re.compile(
+    r'^\s*export\s+(?:default\s+)?(?:async\s+)?(?:function\*?|class|const|let|var|interface|type|enum)\s+([A-Za-z_$][\w$]*)'
+    r'|^\s*export\s*\{([^}]*)\}',
+    re.MULTILINE,
+)
+GO_IMPORT_BLOCK = re.compile(r'^import\s*\(\s*(.*?)\)', re.MULTILINE | re.DOTALL)
+GO_IMPORT_LINE = re.compile(r'^import\s+(?:[\w.]+\s+)?"([^"]+)"', re.MULTILINE)
+RUST_USE = re.compile(r'^\s*(?:pub\s+)?use\s+([\w:]+)', re.MULTILINE)
+RUST_MOD = re.compile(r'^\s*(?:pub\s+)?mod\s+(\w+)\s*;', re.MULTILINE)
+RUST_CRATE = re.compile(r'^\s*extern\s+crate\s+(\w+)', re.MULTILINE)
+
+BRANCH_KEYWORDS = re.compile(r'\b(?:if|for|while|case|catch|except|elif|match)\b|&&|\|\||\?(?!\.)')
+COMMENT_PREFIX = {'python': ('#',), 'javascript': ('//', '/*', '*'), 'typescript': ('//', '/*', '*'),
+                  'go': ('//', '/*', '*'), 'rust': ('//', '/*', '*')}
+JS_EXTENSIONS = ['.ts', '.tsx', '.js', '.jsx', '.mjs', '.cjs']
+
+
+# --- Imports and exports -----------------------------------------------------
+
+def python_imports(tree: ast.AST) -> List[Dict[str, Any]]:
+    imports = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                imports.append({"module": alias.name, "names": [], "level": 0, "line": node.lineno})
+        elif isinstance(node, ast.ImportFrom):
+            imports.append({
+                "module": node.module or "",
+                "names": [alias.name for alias in node.names],
+                "level": node.level,
+                "line": node.lineno,
+            })
+    return imports
+
+
+def python_exports(tree: ast.Module) -> List[str]:
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == '__all__' for t in node.targets):
+            # Only a literal list/tuple of names counts; anything else falls back to the public names
+            if not isinstance(node.value, (ast.List, ast.Tuple)):
+                break
+            try:
+                return [name for name in ast.literal_eval(node.value) if isinstance(name, str)]
+            except ValueError:
+                break
+    names = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.append(node.name)
+        elif isinstance(node, ast.Assign):
+            names.extend(t.id for t in node.targets if isinstance(t, ast.Name))
+    return [name for name in names if not name.startswith('_')]
+
+
+def lexical_imports(source: str, language: str) -> List[Dict[str, Any]]:
+    def line_of(offset: int) -> int:
+        return source.count('\n', 0, offset) + 1
+
+    imports = []
+    if language in ('javascript', 'typescript'):
+        for match in JS_IMPORT.finditer(source):
+            module = next(group for group in match.groups() if group)
+            imports.append({"module": module, "names": [], "level": 0, "line": line_of(match.start())})
+    elif language == 'go':
+        for block in GO_IMPORT_BLOCK.finditer(source):
+            for module in re.findall(r'"([^"]+)"', block.group(1)):
+                imports.append({"module": module, "names": [], "level": 0, "line": line_of(block.start())})
+        for match in GO_IMPORT_LINE.finditer(source):
+            imports.append({"module": match.group(1), "names": [], "level": 0, "line": line_of(match.start())})
+    elif language == 'rust':
+        for pattern, kind in ((RUST_USE, 'use'), (RUST_MOD, 'mod'), (RUST_CRATE, 'crate')):
+            for match in pattern.finditer(source):
+                imports.append({"module": match.group(1), "names": [], "level": 0, "kind": kind,
+                                "line": line_of(match.start())})
+    return sorted(imports, key=lambda item: item["line"])
+
+
+def lexical_exports(source: str, language: str, symbols: List[Dict[str, Any]]) -> List[str]:
+    if language in ('javascript', 'typescript'):
+        names = []
+        for match in JS_EXPORT.finditer(source):
+            if match.group(1):
+                names.append(match.group(1))
+            else:
+                names.extend(part.split(' as ')[-1].strip() for part in match.group(2).split(',') if part.strip())
+        return names
+    if language == 'go':
+        return [s["name"] for s in symbols if s["name"][:1].isupper() and s["kind"] != 'method']
+    if language == 'rust':
+        return [s["name"] for s in symbols if s["signature"].startswith('pub')]
+    return []
+
+
+# --- Metrics -----------------------------------------------------------------
+
+def python_complexity(tree: ast.AST) -> Dict[str, Any]:
+    """Cyclomatic complexity (decision points + 1) per function"""
+    branch_nodes = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.ExceptHandler, ast.With, ast.AsyncWith,
+                    ast.IfExp, ast.comprehension, ast.Assert)
+    per_function = {}
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            score = 1
+            for child in ast.walk(node):
+                if isinstance(child, branch_nodes):
+                    score += 1
+                elif isinstance(child, ast.BoolOp):
+                    score += len(child.values) - 1
+                elif hasattr(ast, 'match_case') and isinstance(child, ast.match_case):
+                    score += 1
+            per_function[f"{node.name}:{node.lineno}"] = score
+    return per_function
+
+
+def line_metrics(source: str, language: str) -> Dict[str, int]:
+    prefixes = COMMENT_PREFIX.get(language, ('#', '//'))
+    total = blank = comment = 0
+    for line in source.splitlines():
+        total += 1
+        stripped = line.strip()
+        if not stripped:
+            blank += 1
+        elif stripped.startswith(prefixes):
+            comment += 1
+    return {"loc": total, "code_lines": total - blank - comment, "blank_lines": blank, "comment_lines": comment}
+
+
+def file_facts(path: str, source: str) -> Dict[str, Any]:
+    """Imports, exports, symbols and metrics for one file, without the model"""
+    language = LANGUAGE_BY_EXTENSION.get(os.path.splitext(path)[1], "")
+    extracted = extract_symbols(path, source) or {"symbols": []}
+    symbols = extracted["symbols"]
+    facts: Dict[str, Any] = {"language": language or "unknown", **line_metrics(source, language)}
+
+    tree = None
+    if language == 'python':
+        try:
+            tree = ast.parse(source)
+        except (SyntaxError, ValueError) as e:
+            facts["parse_error"] = str(e)
+
+    if tree is not None:
+        facts["imports"] = python_imports(tree)
+        facts["exports"] = python_exports(tree)
+        complexity = python_complexity(tree)
+    else:
+        facts["imports"] = lexical_imports(source, language)
+        facts["exports"] = lexical_exports(source, language, symbols)
+        complexity = {}
+        for symbol in symbols:
+            if symbol["kind"] in ('function', 'method'):
+                complexity[f"{symbol['name']}:{symbol['line']}"] = None
+        if language:
+            facts["complexity_total"] = len(BRANCH_KEYWORDS.findall(source)) + max(1, len(complexity))
+
+    facts["function_count"] = sum(1 for s in symbols if s["kind"] in ('function', 'method'))
+    facts["class_count"] = sum(1 for s in symbols if s["kind"] in ('class', 'struct', 'interface', 'trait', 'enum'))
+    facts["symbols"] = [{k: s[k] for k in ("name", "kind", "line", "signature")} for s in symbols]
+    scored = {name: score for name, score in complexity.items() if score is not None}
+    if scored:
+        facts["complexity_total"] = sum(scored.values())
+        facts["complexity_max"] = max(scored.values())
+        facts["most_complex"] = sorted(scored.items(), key=lambda item: -item[1])[:5]
+    return facts
+
+
+# --- Local module resolution and the dependency graph ------------------------
+
+def _first_existing(candidates: List[str]) -> Optional[str]:
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def resolve_import(workspace_path: str, file_path: str, language: str, item: Dict[str, Any]) -> List[str]:
+    """Workspace files an import refers to (empty for third-party/stdlib modules)"""
+    directory = os.path.dirname(file_path)
+    module = item["module"]
+
+    if language == 'python':
+        if item["level"]:
+            base = directory
+            for _ in range(item["level"] - 1):
+                base = os.path.dirname(base)
+            roots = [base]
+        else:
+            roots = [directory, workspace_path]
+        resolved = []
+        parts = module.split('.') if module else []
+        for root in roots:
+            target = os.path.join(root, *parts)
+            found = _first_existing([target + '.py', os.path.join(target, '__init__.py')])
+            if found:
+                resolved.append(found)
+                break
+            # `from package import module`
+            for name in item["names"]:
+                sub = _first_existing([os.path.join(target, name + '.py'), os.path.join(target, name, '__init__.py')])
+                if sub:
+                    resolved.append(sub)
+            if resolved:
+                break
+        return resolved
+
+    if language in ('javascript', 'typescript'):
+        if not module.startswith('.'):
+            return []
+        target = os.path.normpath(os.path.join(directory, module))
+        candidates = [target] + [target + ext for ext in JS_EXTENSIONS] + \
+                     [os.path.join(target, 'index' + ext) for ext in JS_EXTENSIONS]
+        found = _first_existing(candidates)
+        return [found] if found else []
+
+    if language == 'rust' and item.get("kind") == 'mod':
+        found = _first_existing([os.path.join(directory, module + '.rs'), os.path.join(directory, module, 'mod.rs')])
+        return [found] if found else []
+
+    return []
+
+
+class DependencyGraph:
+    """Forward and reverse local dependencies for one workspace, updated per file"""
+
+    def __init__(self, workspace_path: str):
+        self.workspace_path = os.path.abspath(workspace_path)
+        self._lock = threading.Lock()
+        self.files: Dict[str, Dict[str, Any]] = {}  # rel path -> {mtime_ns, size, facts, deps}
+        self.reverse: Dict[str, Set[str]] = {}
+        self.scanned = False  # a complete scan has finished, so `dependents` covers the workspace
+        self.truncated = False  # the last scan hit its file or time limit
+
+    def _rel(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self.workspace_path)
+
+    def update_file(self, path: str, source: Optional[str] = None) -> Dict[str, Any]:
+        abs_path = os.path.abspath(path)
+        rel_path = self._rel(abs_path)
+        stat = os.stat(abs_path)
+        entry = self.files.get(rel_path)
+        if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            return entry
+
+        if source is None:
+            with open(abs_path, 'r', encoding='utf-8', errors='replace') as f:
+                source = f.read()
+        facts = file_facts(abs_path, source)
+        language = facts["language"]
+        deps = set()
+        for item in facts["imports"]:
+            for target in resolve_import(self.workspace_path, abs_path, language, item):
+                if target.startswith(self.workspace_path):
+                    deps.add(self._rel(target))
+        deps.discard(rel_path)
+
+        with self._lock:
+            previous = self.files.get(rel_path)
+            if previous:
+                for dep in previous["deps"]:
+                    self.reverse.get(dep, set()).discard(rel_path)
+            entry = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "facts": facts, "deps": sorted(deps)}
+            self.files[rel_path] = entry
+            for dep in deps:
+                self.reverse.setdefault(dep, set()).add(rel_path)
+        return entry
+
+    def remove_file(self, rel_path: str) -> None:
+        with self._lock:
+            entry = self.files.pop(rel_path, None)
+            if entry:
+                for dep in entry["deps"]:
+                    self.reverse.get(dep, set()).discard(rel_path)
+
+    def refresh(self, max_files: int = 5000, max_seconds: float = 10.0) -> None:
+        """Scan the workspace, stopping after `max_files` source files or `max_seconds`"""
+        deadline = time.monotonic() + max_seconds
+        seen = set()
+        truncated = False
+        for root, dirs, filenames in os.walk(self.workspace_path):
+            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in SKIP_DIRS]
+            for filename in filenames:
+                if os.path.splitext(filename)[1] not in LANGUAGE_BY_EXTENSION:
+                    continue
+                if len(seen) >= max_files or time.monotonic() > deadline:
+                    truncated = True
+                    break
+                path = os.path.join(root, filename)
+                seen.add(self._rel(path))
+                try:
+                    self.update_file(path)
+                except (OSError, ValueError):
+                    continue
+            if truncated:
+                break
+        if not truncated:
+            # Only a complete scan knows which files are gone
+            with self._lock:
+                removed = [p for p in self.files if p not in seen]
+            for rel_path in removed:
+                self.remove_file(rel_path)
+        self.truncated = truncated
+        self.scanned = self.scanned or not truncated
+
+    def dependents(self, path: str) -> List[str]:
+        with self._lock:
+            return sorted(self.reverse.get(self._rel(path), set()))
+
+
+class DependencyGraphRegistry:
+    """One DependencyGraph per workspace, rescanned in the background at most every `refresh_interval` seconds"""
+
+    def __init__(self, refresh_interval: float = 5.0, max_files: int = 5000, max_seconds: float = 10.0):
+        self.refresh_interval = refresh_interval
+        self.max_files = max_files
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._graphs: Dict[str, DependencyGraph] = {}
+        self._last_refresh: Dict[str, float] = {}
+        self._refreshing: Set[str] = set()
+
+    def get(self, workspace_path: str) -> DependencyGraph:
+        """The workspace's graph; starts a background rescan when the last one is stale"""
+        workspace_path = os.path.abspath(workspace_path)
+        now = time.monotonic()
+        with self._lock:
+            graph = self._graphs.setdefault(workspace_path, DependencyGraph(workspace_path))
+            stale = now - self._last_refresh.get(workspace_path, float('-inf')) >= self.refresh_interval
+            if not stale or workspace_path in self._refreshing:
+                return graph
+            self._last_refresh[workspace_path] = now
+            self._refreshing.add(workspace_path)
+        threading.Thread(target=self._refresh, args=(workspace_path, graph), daemon=True,
+                         name="gemmapilot-dependency-scan").start()
+        return graph
+
+    def _refresh(self, workspace_path: str, graph: DependencyGraph) -> None:
+        try:
+            graph.refresh(self.max_files, self.max_seconds)
+        except Exception as e:
+            print(f"⚠️ Warning: Dependency scan of {workspace_path} failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(workspace_path)
+                # Measure the interval from the end of the scan, so long scans do not run back to back
+                self._last_refresh[workspace_path] = time.monotonic()
+
+
+def find_workspace_root(file_path: str) -> Optional[str]:
+    """Nearest ancestor containing a VCS or project marker, or None outside any project"""
+    markers = ('.git', 'pyproject.toml', 'setup.py', 'package.json', 'go.mod', 'Cargo.toml')
+    current = os.path.dirname(os.path.abspath(file_path))
+    while True:
+        if any(os.path.exists(os.path.join(current, marker)) for marker in markers):
+            return current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+
+def format_facts(file_name: str, facts: Dict[str, Any], deps: List[str], dependents: List[str],
+                 analysis_type: str) -> str:
+    """Markdown report of the static facts"""
+    lines = [f"**{file_name}** ({facts['language']})"]
+    if analysis_type == 'overview':
+        lines.append("")
+        lines.append(f"- Lines: {facts['loc']} ({facts['code_lines']} code, {facts['comment_lines']} comment, "
+                     f"{facts['blank_lines']} blank)")
+        lines.append(f"- Functions: {facts['function_count']}, classes/types: {facts['class_count']}")
+        if 'complexity_total' in facts:
+            lines.append(f"- Cyclomatic complexity: {facts['complexity_total']} total"
+                         + (f", max {facts['complexity_max']}" if 'complexity_max' in facts else ""))
+        if facts.get('most_complex'):
+            lines.append("- Most complex: " + ", ".join(f"`{name}` ({score})" for name, score in facts['most_complex']))
+        if facts['symbols']:
+            lines.append("")
+            lines.append("**Definitions:**")
+            lines.extend(f"- `{s['signature']}` (line {s['line']})" for s in facts['symbols'][:50])
+
+    external = sorted({item['module'] for item in facts['imports']})
+    lines.append("")
+    lines.append(f"**Imports ({len(facts['imports'])}):** " + (", ".join(f"`{m}`" for m in external) or "none"))
+    lines.append(f"**Exports:** " + (", ".join(f"`{name}`" for name in facts['exports'][:50]) or "none"))
+    lines.append(f"**Local dependencies:** " + (", ".join(f"`{d}`" for d in deps) or "none"))
+    lines.append(f"**Used by:** " + (", ".join(f"`{d}`" for d in dependents) or "none"))
+    if facts.get('parse_error'):
+        lines.append(f"\n⚠️ Parse error: {facts['parse_error']}")
+    return "\n".join(lines)
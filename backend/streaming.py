@@ -0,0 +1,103 @@
+"""
+Helpers for consuming the blocking Ollama streaming iterators from async code.
+
+`ollama.generate(..., stream=True)` returns a synchronous iterator. Iterating it
+directly inside a coroutine blocks the event loop, so other requests (and
+other completions on the same WebSocket) stall until it finishes.
+"""
+
+import asyncio
+import json
+import re
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+_SENTINEL = object()
+
+
+async def iterate_in_thread(
+    make_iterator: Callable[[], Iterator[Any]],
+    cancel_event: Optional[threading.Event] = None,
+) -> AsyncIterator[Any]:
+    """Run a blocking iterator in a worker thread and yield its items asynchronously
+
+    Setting `cancel_event` (or cancelling the consuming task) stops the worker
+    after the item it is currently waiting on.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    cancel_event = cancel_event or threading.Event()
+
+    def put(item: Any) -> None:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:  # event loop already closed
+            cancel_event.set()
+
+    def worker() -> None:
+        try:
+            for item in make_iterator():
+                if cancel_event.is_set():
+                    break
+                put(item)
+        except BaseException as e:  # forwarded to the consumer
+            if not cancel_event.is_set():
+                put(e)
+        finally:
+            # Also after a cancel: a consumer still waiting for the next item must not hang
+            put(_SENTINEL)
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is _SENTINEL:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        cancel_event.set()
+
+
+# A fenced code block: info string (language, e.g. "c++" or "c#") and body.
+# Shared with parse_code_action_response so streamed and final answers agree.
+CODE_FENCE = re.compile(r'```([\w+#.-]*)\n(.*?)\n```', re.DOTALL)
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class CodeFenceWatcher:
+    """Spots the first complete fenced code block in a token stream
+
+    Only the text since the last opening fence is rescanned, so feeding a
+    long answer token by token stays linear.
+    """
+
+    FENCE = CODE_FENCE
+
+    def __init__(self):
+        self.text = ""
+        self.found = False
+        self._scan_from = 0
+
+    def feed(self, delta: str) -> Optional[Dict[str, str]]:
+        """Add streamed text; returns {"language", "code"} once, when the first block closes"""
+        self.text += delta
+        if self.found:
+            return None
+        opening = self.text.find('```', self._scan_from)
+        if opening == -1:
+            # Keep two characters in case a fence is split across tokens
+            self._scan_from = max(0, len(self.text) - 2)
+            return None
+        self._scan_from = opening
+        match = self.FENCE.search(self.text, opening)
+        if not match:
+            return None
+        self.found = True
+        return {"language": match.group(1), "code": match.group(2).strip()}
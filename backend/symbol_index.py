@@ -0,0 +1,368 @@
+"""
+Incremental symbol and outline index for a workspace.
+
+Python files are parsed with `ast`; JavaScript/TypeScript, Go and Rust use
+fast line-based regex extractors. Each file is re-indexed only when its mtime
+or size changes, and the index is persisted as JSON so a restart does not
+rescan everything.
+"""
+
+import ast
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+SKIP_DIRS = {'node_modules', '__pycache__', 'build', 'dist', 'out', 'target', 'venv', '.venv'}
+INDEX_VERSION = 1
+IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+LANGUAGE_BY_EXTENSION = {
+    '.py': 'python',
+    '.js': 'javascript', '.jsx': 'javascript', '.mjs': 'javascript', '.cjs': 'javascript',
+    '.ts': 'typescript', '.tsx': 'typescript',
+    '.go': 'go',
+    '.rs': 'rust',
+}
+
+# (kind, pattern) pairs; group "name" is the symbol, the whole line is the signature
+LEXICAL_PATTERNS = {
+    'javascript': [
+        ('function', re.compile(r'^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*(?P<name>[A-Za-z_$][\w$]*)\s*\(')),
+        ('class', re.compile(r'^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+(?P<name>[A-Za-z_$][\w$]*)')),
+        ('function', re.compile(r'^\s*(?:export\s+)?(?:const|let|var)\s+(?P<name>[A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?(?:function\b|\([^)]*\)\s*=>|[A-Za-z_$][\w$]*\s*=>)')),
+        ('method', re.compile(r'^\s+(?:static\s+)?(?:async\s+)?(?:get\s+|set\s+)?(?P<name>(?!if\b|for\b|while\b|switch\b|catch\b|return\b)[A-Za-z_$][\w$]*)\s*\([^;]*\)\s*\{\s*$')),
+    ],
+    'typescript': [
+        ('interface', re.compile(r'^\s*(?:export\s+)?(?:declare\s+)?interface\s+(?P<name>[A-Za-z_$][\w$]*)')),
+        ('type', re.compile(r'^\s*(?:export\s+)?(?:declare\s+)?type\s+(?P<name>[A-Za-z_$][\w$]*)\s*(?:<[^=]*>)?\s*=')),
+        ('enum', re.compile(r'^\s*(?:export\s+)?(?:const\s+)?enum\s+(?P<name>[A-Za-z_$][\w$]*)')),
+    ],
+    'go': [
+        ('method', re.compile(r'^func\s+\([^)]*\)\s*(?P<name>[A-Za-z_]\w*)\s*\(')),
+        ('function', re.compile(r'^func\s+(?P<name>[A-Za-z_]\w*)\s*[\[(]')),
+        ('struct', re.compile(r'^type\s+(?P<name>[A-Za-z_]\w*)\s+struct\b')),
+        ('interface', re.compile(r'^type\s+(?P<name>[A-Za-z_]\w*)\s+interface\b')),
+        ('type', re.compile(r'^type\s+(?P<name>[A-Za-z_]\w*)\s+')),
+    ],
+    'rust': [
+        ('function', re.compile(r'^\s*(?:pub(?:\([^)]*\))?\s+)?(?:const\s+)?(?:async\s+)?(?:unsafe\s+)?(?:extern\s+"[^"]*"\s+)?fn\s+(?P<name>[A-Za-z_]\w*)')),
+        ('struct', re.compile(r'^\s*(?:pub(?:\([^)]*\))?\s+)?struct\s+(?P<name>[A-Za-z_]\w*)')),
+        ('enum', re.compile(r'^\s*(?:pub(?:\([^)]*\))?\s+)?enum\s+(?P<name>[A-Za-z_]\w*)')),
+        ('trait', re.compile(r'^\s*(?:pub(?:\([^)]*\))?\s+)?trait\s+(?P<name>[A-Za-z_]\w*)')),
+        ('type', re.compile(r'^\s*(?:pub(?:\([^)]*\))?\s+)?type\s+(?P<name>[A-Za-z_]\w*)')),
+        ('impl', re.compile(r'^\s*impl(?:<[^>]*>)?\s+(?:[\w:<>, ]+\s+for\s+)?(?P<name>[A-Za-z_]\w*)')),
+    ],
+}
+# TypeScript is a superset of the JavaScript patterns
+LEXICAL_PATTERNS['typescript'] = LEXICAL_PATTERNS['typescript'] + LEXICAL_PATTERNS['javascript']
+
+DOC_COMMENT = {
+    'javascript': re.compile(r'^\s*(?:/\*\*|\*|//)\s?(.*?)\s*(?:\*/)?$'),
+    'typescript': re.compile(r'^\s*(?:/\*\*|\*|//)\s?(.*?)\s*(?:\*/)?$'),
+    'go': re.compile(r'^\s*//\s?(.*)$'),
+    'rust': re.compile(r'^\s*///?\s?(.*)$'),
+}
+
+
+def _python_signature(node: ast.AST, source_lines: List[str]) -> str:
+    """Header line(s) of a def/class up to the colon"""
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        prefix = 'async def' if isinstance(node, ast.AsyncFunctionDef) else 'def'
+        signature = f"{prefix} {node.name}({ast.unparse(node.args)})"
+        if node.returns is not None:
+            signature += f" -> {ast.unparse(node.returns)}"
+        return signature
+    if isinstance(node, ast.ClassDef):
+        bases = [ast.unparse(base) for base in node.bases]
+        return f"class {node.name}({', '.join(bases)})" if bases else f"class {node.name}"
+    return source_lines[node.lineno - 1].strip()
+
+
+def extract_python(source: str) -> Dict[str, Any]:
+    tree = ast.parse(source)
+    lines = source.splitlines()
+    symbols: List[Dict[str, Any]] = []
+
+    def visit(body: Iterable[ast.AST], parent: Optional[str]):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                if isinstance(node, ast.ClassDef):
+                    kind = 'class'
+                else:
+                    kind = 'method' if parent else 'function'
+                doc = ast.get_docstring(node) or ""
+                symbols.append({
+                    "name": node.name,
+                    "qualname": f"{parent}.{node.name}" if parent else node.name,
+                    "kind": kind,
+                    "line": node.lineno,
+                    "end_line": getattr(node, 'end_lineno', node.lineno),
+                    "signature": _python_signature(node, lines),
+                    "doc": doc.split('\n\n')[0].strip(),
+                })
+                if isinstance(node, ast.ClassDef):
+                    visit(node.body, node.name if not parent else f"{parent}.{node.name}")
+            elif parent is None and isinstance(node, (ast.Assign, ast.AnnAssign)):
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    if isinstance(target, ast.Name) and target.id.isupper():
+                        symbols.append({
+                            "name": target.id,
+                            "qualname": target.id,
+                            "kind": "constant",
+                            "line": node.lineno,
+                            "end_line": getattr(node, 'end_lineno', node.lineno),
+                            "signature": lines[node.lineno - 1].strip()[:200],
+                            "doc": "",
+                        })
+
+    visit(tree.body, None)
+    references = sorted({node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+                        | {node.attr for node in ast.walk(tree) if isinstance(node, ast.Attribute)})
+    return {"symbols": symbols, "references": references}
+
+
+def extract_lexical(source: str, language: str) -> Dict[str, Any]:
+    patterns = LEXICAL_PATTERNS[language]
+    doc_pattern = DOC_COMMENT.get(language)
+    lines = source.splitlines()
+    symbols: List[Dict[str, Any]] = []
+
+    for number, line in enumerate(lines, start=1):
+        for kind, pattern in patterns:
+            match = pattern.match(line)
+            if not match:
+                continue
+            doc_lines: List[str] = []
+            previous = number - 2
+            while doc_pattern and previous >= 0 and lines[previous].strip().startswith(('//', '/*', '*')):
+                doc_match = doc_pattern.match(lines[previous])
+                if doc_match and doc_match.group(1):
+                    doc_lines.insert(0, doc_match.group(1))
+                previous -= 1
+            symbols.append({
+                "name": match.group('name'),
+                "qualname": match.group('name'),
+                "kind": kind,
+                "line": number,
+                "end_line": number,
+                "signature": line.strip().rstrip('{').strip()[:200],
+                "doc": ' '.join(doc_lines)[:300],
+            })
+            break
+
+    references = sorted(set(IDENTIFIER.findall(source)))
+    return {"symbols": symbols, "references": references}
+
+
+def extract_symbols(path: str, source: str) -> Optional[Dict[str, Any]]:
+    """Symbols and referenced identifiers for a supported file, or None"""
+    language = LANGUAGE_BY_EXTENSION.get(os.path.splitext(path)[1])
+    if language is None:
+        return None
+    if language == 'python':
+        try:
+            result = extract_python(source)
+        except (SyntaxError, ValueError):
+            # Half-typed code: fall back to nothing rather than failing the index
+            result = {"symbols": [], "references": sorted(set(IDENTIFIER.findall(source)))}
+    else:
+        result = extract_lexical(source, language)
+    result["language"] = language
+    return result
+
+
+class SymbolIndex:
+    """Per-workspace symbol index, updated file by file"""
+
+    def __init__(self, workspace_path: str, cache_path: Optional[str] = None, max_file_bytes: int = 1024 * 1024):
+        self.workspace_path = os.path.abspath(workspace_path)
+        self.cache_path = cache_path
+        self.max_file_bytes = max_file_bytes
+        self._lock = threading.Lock()
+        self.files: Dict[str, Dict[str, Any]] = {}  # rel path -> {mtime_ns, size, language, symbols, references}
+        self._by_name: Dict[str, List[Dict[str, Any]]] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION and data.get("workspace") == self.workspace_path:
+                self.files = data.get("files", {})
+                self._rebuild_names()
+        except (OSError, ValueError):
+            self.files = {}
+
+    def save(self) -> None:
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = self.cache_path + '.tmp'
+        with self._lock:
+            data = {"version": INDEX_VERSION, "workspace": self.workspace_path, "files": self.files}
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def _rebuild_names(self) -> None:
+        by_name: Dict[str, List[Dict[str, Any]]] = {}
+        for rel_path, entry in self.files.items():
+            for symbol in entry["symbols"]:
+                by_name.setdefault(symbol["name"], []).append(dict(symbol, file=rel_path))
+        self._by_name = by_name
+
+    def _set_entry(self, rel_path: str, entry: Optional[Dict[str, Any]]) -> None:
+        """Replace (or with None, drop) one file's entry and its names; caller holds _lock
+
+        Name lists are replaced rather than mutated, so readers without the lock see a consistent list.
+        """
+        previous = self.files.pop(rel_path, None)
+        names = set()
+        if previous:
+            names.update(symbol["name"] for symbol in previous["symbols"])
+        if entry is not None:
+            self.files[rel_path] = entry
+            names.update(symbol["name"] for symbol in entry["symbols"])
+        for name in names:
+            symbols = [s for s in self._by_name.get(name, ()) if s["file"] != rel_path]
+            if entry is not None:
+                symbols.extend(dict(symbol, file=rel_path) for symbol in entry["symbols"] if symbol["name"] == name)
+            if symbols:
+                self._by_name[name] = symbols
+            else:
+                self._by_name.pop(name, None)
+
+    def iter_source_files(self) -> Iterable[str]:
+        for root, dirs, filenames in os.walk(self.workspace_path):
+            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in SKIP_DIRS]
+            for filename in filenames:
+                if os.path.splitext(filename)[1] in LANGUAGE_BY_EXTENSION:
+                    yield os.path.join(root, filename)
+
+    def update_file(self, path: str) -> bool:
+        """Re-index one file if it changed; returns True if the entry was updated"""
+        abs_path = os.path.abspath(path)
+        rel_path = os.path.relpath(abs_path, self.workspace_path)
+        try:
+            stat = os.stat(abs_path)
+        except OSError:
+            return self.remove_file(abs_path)
+
+        entry = self.files.get(rel_path)
+        if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            return False
+        if stat.st_size > self.max_file_bytes:
+            return False
+
+        try:
+            with open(abs_path, 'r', encoding='utf-8', errors='replace') as f:
+                source = f.read()
+        except OSError:
+            return False
+        extracted = extract_symbols(abs_path, source)
+        if extracted is None:
+            return False
+
+        with self._lock:
+            self._set_entry(rel_path, {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, **extracted})
+        return True
+
+    def remove_file(self, path: str) -> bool:
+        rel_path = os.path.relpath(os.path.abspath(path), self.workspace_path)
+        with self._lock:
+            if rel_path not in self.files:
+                return False
+            self._set_entry(rel_path, None)
+        return True
+
+    def refresh(self) -> Dict[str, int]:
+        """Index new and changed files and drop deleted ones"""
+        seen = set()
+        updated = 0
+        for path in self.iter_source_files():
+            seen.add(os.path.relpath(path, self.workspace_path))
+            if self.update_file(path):
+                updated += 1
+        removed = 0
+        with self._lock:
+            gone = [p for p in self.files if p not in seen]
+        for rel_path in gone:
+            if self.remove_file(os.path.join(self.workspace_path, rel_path)):
+                removed += 1
+        if updated or removed:
+            self.save()
+        return {"files": len(self.files), "updated": updated, "removed": removed}
+
+    def outline(self, path: str) -> List[Dict[str, Any]]:
+        rel_path = os.path.relpath(os.path.abspath(path), self.workspace_path)
+        self.update_file(path)
+        entry = self.files.get(rel_path)
+        return entry["symbols"] if entry else []
+
+    def lookup(self, name: str, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Definitions named `name` (or matching `Class.method` qualname)"""
+        short_name = name.rsplit('.', 1)[-1]
+        matches = self._by_name.get(short_name, [])
+        if '.' in name:
+            matches = [m for m in matches if m["qualname"] == name]
+        if kind:
+            matches = [m for m in matches if m["kind"] == kind]
+        return matches
+
+    def references(self, name: str) -> List[str]:
+        """Files that mention identifier `name`"""
+        with self._lock:
+            entries = list(self.files.items())
+        return sorted(rel_path for rel_path, entry in entries if name in entry["references"])
+
+    def signatures_for(self, code: str, exclude_file: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Definitions of the identifiers used in `code`, skipping ones defined in `exclude_file`"""
+        exclude = os.path.relpath(os.path.abspath(exclude_file), self.workspace_path) if exclude_file else None
+        found: List[Dict[str, Any]] = []
+        seen = set()
+        for name in IDENTIFIER.findall(code):
+            if name in seen:
+                continue
+            seen.add(name)
+            for symbol in self._by_name.get(name, []):
+                if symbol["file"] != exclude and symbol["kind"] != "constant":
+                    found.append(symbol)
+                    break
+            if len(found) >= limit:
+                break
+        return found
+
+
+class SymbolIndexRegistry:
+    """One SymbolIndex per workspace, persisted under `cache_dir`
+
+    A full refresh (a stat per source file) runs at most every
+    `refresh_interval` seconds; single files can be updated in between.
+    """
+
+    def __init__(self, cache_dir: str, refresh_interval: float = 5.0):
+        self.cache_dir = cache_dir
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, SymbolIndex] = {}
+        self._last_refresh: Dict[str, float] = {}
+
+    def get(self, workspace_path: str, refresh: bool = True) -> SymbolIndex:
+        workspace_path = os.path.abspath(workspace_path)
+        with self._lock:
+            index = self._indexes.get(workspace_path)
+            if index is None:
+                name = re.sub(r'[^A-Za-z0-9_.-]', '_', workspace_path.strip(os.sep)) or 'root'
+                index = SymbolIndex(workspace_path, os.path.join(self.cache_dir, f"{name}.json"))
+                self._indexes[workspace_path] = index
+        now = time.monotonic()
+        if refresh and now - self._last_refresh.get(workspace_path, float('-inf')) >= self.refresh_interval:
+            self._last_refresh[workspace_path] = now
+            index.refresh()
+        return index
@@ -0,0 +1,287 @@
+"""
+Record/replay of model calls and HTTP traffic.
+
+Recording wraps the model provider and appends one JSON line per call to a
+trace file: the prompt, options, and for streamed calls every token delta
+with its delay since the previous one. `TraceMiddleware` adds one line per
+HTTP request (path, body, status, end-to-end latency). Paths ending in
+`.gz` are gzip-compressed.
+
+`ReplayProvider` serves recorded calls back in place of Ollama, with the
+original timing scaled by `speed` (2.0 = twice as fast, 0 = no delays).
+Calls are matched by their prompt; a prompt that was never recorded falls
+back to the next unused recording of the same route.
+`benchmarks/replay_traffic.py` replays the recorded HTTP requests against a
+server and compares latencies.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+
+def call_key(call: str, payload: Any) -> str:
+    """Identity of a model call: call type plus prompt/messages/input (not model or options)"""
+    data = json.dumps([call, payload], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def as_dict(obj: Any) -> Dict[str, Any]:
+    """Plain dict from an Ollama response (dicts or pydantic models, depending on version)"""
+    if isinstance(obj, dict):
+        return obj
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    return dict(obj)
+
+
+def _delta(call: str, chunk: Dict[str, Any]) -> str:
+    if call == "chat":
+        return (chunk.get("message") or {}).get("content") or ""
+    return chunk.get("response") or ""
+
+
+def _final_stats(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    keys = ("done_reason", "eval_count", "prompt_eval_count", "eval_duration", "prompt_eval_duration")
+    return {k: chunk[k] for k in keys if chunk.get(k) is not None}
+
+
+def _open_trace(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def read_trace(path: str) -> Iterator[Dict[str, Any]]:
+    with _open_trace(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class TraceRecorder:
+    """Appends trace records to a JSONL file (thread-safe)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records = 0
+        self._lock = threading.Lock()
+        self._file = _open_trace(path, "a")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.records += 1
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class RecordingProvider:
+    """Wraps a provider and records every call it serves"""
+
+    def __init__(self, inner, recorder: TraceRecorder):
+        self.inner = inner
+        self.recorder = recorder
+
+    def _record(self, call: str, route: str, model: str, payload: Any, options, start_wall: float,
+                latency: float, **fields) -> None:
+        self.recorder.write({
+            "type": "model", "call": call, "route": route, "model": model,
+            "key": call_key(call, payload), "request": payload, "options": options or {},
+            "t": round(start_wall, 3), "latency_ms": round(latency * 1000, 2), **fields,
+        })
+
+    def _call(self, call: str, route: str, payload_field: str, **kwargs):
+        payload = kwargs[payload_field]
+        start_wall, start = time.time(), time.perf_counter()
+        response = getattr(self.inner, call)(route, **kwargs)
+        if kwargs.get("stream"):
+            return self._recorded_stream(call, route, kwargs["model"], payload, kwargs.get("options"),
+                                         response, start_wall, start)
+        response = as_dict(response)
+        self._record(call, route, kwargs["model"], payload, kwargs.get("options"), start_wall,
+                     time.perf_counter() - start, stream=False, text=_delta(call, response),
+                     final=_final_stats(response))
+        return response
+
+    def _recorded_stream(self, call, route, model, payload, options, stream, start_wall, start):
+        chunks: List[List[Any]] = []
+        final: Dict[str, Any] = {}
+        last = start
+        completed = False
+        try:
+            for chunk in stream:
+                chunk = as_dict(chunk)
+                now = time.perf_counter()
+                chunks.append([round((now - last) * 1000, 2), _delta(call, chunk)])
+                last = now
+                if chunk.get("done"):
+                    final = _final_stats(chunk)
+                    completed = True
+                yield chunk
+        finally:
+            self._record(call, route, model, payload, options, start_wall, time.perf_counter() - start,
+                         stream=True, chunks=chunks, final=final, completed=completed)
+
+    def chat(self, route: str, **kwargs):
+        return self._call("chat", route, "messages", **kwargs)
+
+    def generate(self, route: str, **kwargs):
+        return self._call("generate", route, "prompt", **kwargs)
+
+    def embed(self, route: str, **kwargs):
+        start_wall, start = time.time(), time.perf_counter()
+        response = as_dict(self.inner.embed(route, **kwargs))
+        embeddings = [[round(x, 5) for x in vector] for vector in response["embeddings"]]
+        self._record("embed", route, kwargs["model"], kwargs["input"], None, start_wall,
+                     time.perf_counter() - start, embeddings=embeddings)
+        return response
+
+
+class ReplayProvider:
+    """Serves recorded model calls with the original (or scaled) timing"""
+
+    def __init__(self, path: str, speed: float = 1.0):
+        self.path = path
+        self.speed = speed
+        self.hits = 0
+        self.route_fallbacks = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._by_route: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._served: set = set()
+        count = 0
+        for record in read_trace(path):
+            if record.get("type") != "model":
+                continue
+            record["_id"] = count
+            count += 1
+            self._by_key.setdefault(record["key"], deque()).append(record)
+            self._by_route.setdefault(f"{record['call']}:{record['route']}", deque()).append(record)
+        self.loaded = count
+
+    def _take(self, call: str, route: str, payload: Any) -> Dict[str, Any]:
+        """Recording for this call: same prompt first, else the next unused one of the route"""
+        with self._lock:
+            matches = self._by_key.get(call_key(call, payload))
+            if matches:
+                record = matches.popleft() if len(matches) > 1 else matches[0]
+                self._served.add(record["_id"])
+                self.hits += 1
+                return record
+            candidates = self._by_route.get(f"{call}:{route}")
+            while candidates and candidates[0]["_id"] in self._served:
+                candidates.popleft()
+            if candidates:
+                record = candidates.popleft()
+                candidates.append(record)  # keep cycling once a route's recordings are used up
+                self.route_fallbacks += 1
+                return record
+            self.misses += 1
+        raise LookupError(f"No recorded {call} call for route {route!r}")
+
+    def _sleep(self, milliseconds: float) -> None:
+        if self.speed > 0 and milliseconds > 0:
+            time.sleep(milliseconds / 1000 / self.speed)
+
+    def _response(self, call: str, text: str, done: bool, final: Optional[Dict[str, Any]] = None):
+        body = {"message": {"role": "assistant", "content": text}} if call == "chat" else {"response": text}
+        return {**body, "done": done, **(final or {})}
+
+    def _replay_stream(self, call: str, record: Dict[str, Any]):
+        for delay, text in record["chunks"]:
+            self._sleep(delay)
+            yield self._response(call, text, False)
+        yield self._response(call, "", True, record.get("final"))
+
+    def _replay(self, call: str, route: str, payload: Any, stream: bool):
+        record = self._take(call, route, payload)
+        if record.get("stream"):
+            text = "".join(t for _, t in record["chunks"])
+        else:
+            text = record.get("text", "")
+        if stream:
+            if not record.get("stream"):
+                # Recorded as a single response: deliver it in one chunk after the recorded latency
+                record = {**record, "chunks": [[record["latency_ms"], text]]}
+            return self._replay_stream(call, record)
+        self._sleep(record["latency_ms"])
+        return self._response(call, text, True, record.get("final"))
+
+    def chat(self, route: str, messages=None, stream: bool = False, **kwargs):
+        return self._replay("chat", route, messages, stream)
+
+    def generate(self, route: str, prompt: str = "", stream: bool = False, **kwargs):
+        return self._replay("generate", route, prompt, stream)
+
+    def embed(self, route: str, input=None, **kwargs):
+        record = self._take("embed", route, input)
+        self._sleep(record["latency_ms"])
+        return {"embeddings": record["embeddings"]}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "trace": self.path,
+                "speed": self.speed,
+                "loaded": self.loaded,
+                "hits": self.hits,
+                "route_fallbacks": self.route_fallbacks,
+                "misses": self.misses,
+            }
+
+
+class TraceMiddleware:
+    """ASGI middleware recording each HTTP request and its end-to-end latency"""
+
+    def __init__(self, app, recorder: TraceRecorder, skip_paths=("/metrics", "/health")):
+        self.app = app
+        self.recorder = recorder
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        body = bytearray()
+        status = {"code": None}
+        start_wall, start = time.time(), time.perf_counter()
+
+        async def recording_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                body.extend(message.get("body", b""))
+            return message
+
+        async def recording_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                try:
+                    payload = json.loads(body) if body else None
+                except ValueError:
+                    payload = body.decode('utf-8', 'replace')
+                self.recorder.write({
+                    "type": "http", "method": scope["method"], "path": scope["path"],
+                    "query": scope.get("query_string", b"").decode('latin-1'), "body": payload,
+                    "status": status["code"], "t": round(start_wall, 3),
+                    "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+                })
+
+        await self.app(scope, recording_receive, recording_send)
@@ -0,0 +1,333 @@
+"""
+Embedding-backed semantic code search over workspace chunks.
+
+Vectors are L2-normalized and stored as a row-major float16 matrix in a flat
+file that is memory-mapped for search, so a 200k-chunk index costs no heap
+memory until it is scanned. Search converts fixed-size blocks to float32 and
+scores them with BLAS in a thread pool; numpy releases the GIL for both steps.
+
+Files are re-embedded only when their mtime or size changes. Rows of changed
+or deleted files are tombstoned and the matrix is compacted once too many of
+them accumulate. Metadata is checkpointed during long refreshes; on load,
+rows appended after the last checkpoint are truncated, and an index whose
+metadata cannot be trusted is deleted and rebuilt.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # search is disabled without numpy
+    np = None
+
+from symbol_index import LANGUAGE_BY_EXTENSION, SKIP_DIRS
+
+TEXT_EXTENSIONS = set(LANGUAGE_BY_EXTENSION) | {
+    '.md', '.txt', '.json', '.yaml', '.yml', '.toml', '.sh', '.java', '.kt', '.c', '.h', '.cpp', '.hpp',
+    '.cs', '.rb', '.php', '.swift', '.scala', '.sql', '.html', '.css', '.scss', '.vue', '.svelte',
+}
+TOKEN = re.compile(r'[A-Za-z][a-z0-9]*|[A-Z]+(?![a-z])|\d+')
+
+Embedder = Callable[[List[str]], Sequence[Sequence[float]]]
+
+
+class HashingEmbedder:
+    """Dependency-free stand-in for a real embedding model (feature hashing of sub-tokens)"""
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def __call__(self, texts: List[str]) -> "np.ndarray":
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in TOKEN.findall(text):
+                digest = hashlib.blake2b(token.lower().encode(), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], 'little') % self.dim
+                sign = 1.0 if digest[4] & 1 else -1.0
+                matrix[row, bucket] += sign
+        return matrix
+
+
+def normalize_rows(matrix: "np.ndarray") -> "np.ndarray":
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def chunk_lines(text: str, chunk_lines: int = 40, overlap: int = 10) -> List[Tuple[int, int, str]]:
+    """Split text into overlapping line windows: (start_line, end_line, text), 1-based inclusive"""
+    lines = text.splitlines()
+    chunks = []
+    step = max(1, chunk_lines - overlap)
+    for start in range(0, max(len(lines), 1), step):
+        window = lines[start:start + chunk_lines]
+        body = "\n".join(window).strip()
+        if body:
+            chunks.append((start + 1, start + len(window), body))
+        if start + chunk_lines >= len(lines):
+            break
+    return chunks
+
+
+class VectorIndex:
+    """Append-only float16 vector file with tombstones and memory-mapped search"""
+
+    def __init__(self, directory: str, dim: int, block_rows: int = 1024, workers: Optional[int] = None):
+        if np is None:
+            raise RuntimeError("numpy is required for semantic search (pip install numpy)")
+        self.directory = directory
+        self.dim = dim
+        self.block_rows = block_rows
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.vectors_path = os.path.join(directory, "vectors.f16")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.alive_path = os.path.join(directory, "alive.npy")
+        self._lock = threading.RLock()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        self.chunks: List[List[Any]] = []  # row -> [file, start_line, end_line]
+        self.files: Dict[str, Dict[str, Any]] = {}  # file -> {"mtime_ns", "size", "rows": [...]}
+        self.alive = np.zeros(0, dtype=bool)
+        self._matrix = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    # --- persistence ---------------------------------------------------------
+
+    def _load(self) -> None:
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            rows = len(meta["chunks"])
+            on_disk = os.path.getsize(self.vectors_path) // (2 * self.dim) if os.path.exists(self.vectors_path) else 0
+            alive = np.load(self.alive_path) if os.path.exists(self.alive_path) else np.ones(rows, dtype=bool)
+            if meta.get("dim") != self.dim or on_disk < rows or len(alive) != rows:
+                raise ValueError("index does not match its metadata")
+            if on_disk > rows:
+                # Rows appended after the last checkpoint are not referenced by the metadata
+                os.truncate(self.vectors_path, rows * 2 * self.dim)
+            self.chunks = meta["chunks"]
+            self.files = meta["files"]
+            self.alive = alive
+            self._remap()
+        except (OSError, ValueError, KeyError, TypeError):
+            self._reset()
+
+    def _reset(self) -> None:
+        """Start from an empty index, deleting files that metadata no longer describes"""
+        self.chunks, self.files, self.alive, self._matrix = [], {}, np.zeros(0, dtype=bool), None
+        for path in (self.vectors_path, self.alive_path, self.meta_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def save(self) -> None:
+        with self._lock:
+            tmp_path = self.meta_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"dim": self.dim, "chunks": self.chunks, "files": self.files}, f)
+            os.replace(tmp_path, self.meta_path)
+            with open(self.alive_path + ".tmp", 'wb') as f:
+                np.save(f, self.alive)
+            os.replace(self.alive_path + ".tmp", self.alive_path)
+
+    def _remap(self) -> None:
+        rows = len(self.chunks)
+        self._matrix = np.memmap(self.vectors_path, dtype=np.float16, mode='r', shape=(rows, self.dim)) if rows else None
+
+    # --- updates -------------------------------------------------------------
+
+    @property
+    def size(self) -> int:
+        return int(self.alive.sum())
+
+    def add(self, file: str, stat: Tuple[int, int], chunks: List[Tuple[int, int]], vectors: "np.ndarray") -> None:
+        """Append normalized vectors for one file's chunks, replacing its previous rows"""
+        vectors = normalize_rows(vectors).astype(np.float16)
+        with self._lock:
+            self.remove(file)
+            first_row = len(self.chunks)
+            with open(self.vectors_path, 'ab') as f:
+                f.write(vectors.tobytes())
+            self.chunks.extend([file, start, end] for start, end in chunks)
+            self.files[file] = {"mtime_ns": stat[0], "size": stat[1],
+                                "rows": list(range(first_row, first_row + len(chunks)))}
+            self.alive = np.concatenate([self.alive, np.ones(len(chunks), dtype=bool)])
+            self._remap()
+
+    def add_matrix(self, vectors: "np.ndarray", chunks: List[List[Any]]) -> None:
+        """Bulk-append rows (used by the benchmark to build large indexes quickly)"""
+        with self._lock:
+            with open(self.vectors_path, 'ab') as f:
+                f.write(normalize_rows(vectors).astype(np.float16).tobytes())
+            self.chunks.extend(chunks)
+            self.alive = np.concatenate([self.alive, np.ones(len(chunks), dtype=bool)])
+            self._remap()
+
+    def remove(self, file: str) -> None:
+        with self._lock:
+            entry = self.files.pop(file, None)
+            if entry and entry["rows"]:
+                self.alive[entry["rows"]] = False
+
+    def compact(self, max_dead_ratio: float = 0.3) -> bool:
+        """Rewrite the matrix without tombstoned rows if enough of them accumulated"""
+        with self._lock:
+            total = len(self.chunks)
+            if not total or (total - self.size) / total <= max_dead_ratio:
+                return False
+            keep = np.flatnonzero(self.alive)
+            tmp_path = self.vectors_path + ".tmp"
+            matrix = self._matrix
+            with open(tmp_path, 'wb') as f:
+                for i in range(0, len(keep), 65536):
+                    f.write(np.ascontiguousarray(matrix[keep[i:i + 65536]]).tobytes())
+            self._matrix = None
+            os.replace(tmp_path, self.vectors_path)
+            new_row = {int(old): new for new, old in enumerate(keep)}
+            self.chunks = [self.chunks[int(old)] for old in keep]
+            for entry in self.files.values():
+                entry["rows"] = [new_row[row] for row in entry["rows"] if row in new_row]
+            self.alive = np.ones(len(self.chunks), dtype=bool)
+            self._remap()
+            self.save()
+            return True
+
+    # --- search --------------------------------------------------------------
+
+    def _score_block(self, matrix, query, scores, start: int, end: int) -> None:
+        buffer = np.empty((end - start, self.dim), dtype=np.float32)
+        buffer[:] = matrix[start:end]
+        np.dot(buffer, query, out=scores[start:end])
+
+    def search(self, query_vector: Sequence[float], top_k: int = 10) -> List[Tuple[int, float]]:
+        """Top-k (row, cosine similarity) over live rows"""
+        with self._lock:
+            matrix, alive = self._matrix, self.alive
+        return self._search(matrix, alive, query_vector, top_k)
+
+    def search_chunks(self, query_vector: Sequence[float], top_k: int = 10) -> List[Tuple[List[Any], float]]:
+        """Top-k ([file, start_line, end_line], cosine similarity) over live rows"""
+        # compact() renumbers rows by replacing `chunks`, so take matrix and chunks from the same generation
+        with self._lock:
+            matrix, alive, chunks = self._matrix, self.alive, self.chunks
+        return [(chunks[row], score) for row, score in self._search(matrix, alive, query_vector, top_k)]
+
+    def _search(self, matrix, alive, query_vector: Sequence[float], top_k: int) -> List[Tuple[int, float]]:
+        if matrix is None or not len(alive):
+            return []
+        query = normalize_rows(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+        rows = matrix.shape[0]
+        scores = np.empty(rows, dtype=np.float32)
+        ranges = [(i, min(i + self.block_rows, rows)) for i in range(0, rows, self.block_rows)]
+        if self._pool is not None and len(ranges) > 1:
+            per_worker = -(-len(ranges) // self.workers)
+            groups = [ranges[i:i + per_worker] for i in range(0, len(ranges), per_worker)]
+            list(self._pool.map(lambda group: [self._score_block(matrix, query, scores, s, e) for s, e in group],
+                                groups))
+        else:
+            for start, end in ranges:
+                self._score_block(matrix, query, scores, start, end)
+
+        scores[~alive[:rows]] = -np.inf
+        k = min(top_k, int(alive[:rows].sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top]
+
+
+class WorkspaceSearch:
+    """Chunks, embeds and searches one workspace, re-embedding only changed files"""
+
+    def __init__(self, workspace_path: str, index_dir: str, embedder: Embedder, dim: int,
+                 max_file_bytes: int = 512 * 1024, batch_size: int = 32, checkpoint_files: int = 50):
+        self.workspace_path = os.path.abspath(workspace_path)
+        self.embedder = embedder
+        self.max_file_bytes = max_file_bytes
+        self.batch_size = batch_size
+        self.checkpoint_files = checkpoint_files  # save metadata after this many embedded files
+        self.index = VectorIndex(index_dir, dim)
+        self._refresh_lock = threading.Lock()
+
+    def _embed(self, texts: List[str]) -> "np.ndarray":
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            vectors.extend(self.embedder(texts[i:i + self.batch_size]))
+        return np.asarray(vectors, dtype=np.float32)
+
+    def refresh(self) -> Dict[str, Any]:
+        """Embed new and changed files and drop deleted ones"""
+        start = time.perf_counter()
+        with self._refresh_lock:
+            seen = set()
+            embedded_files = embedded_chunks = 0
+            for root, dirs, filenames in os.walk(self.workspace_path):
+                dirs[:] = [d for d in dirs if not d.startswith('.') and d not in SKIP_DIRS]
+                for filename in filenames:
+                    if os.path.splitext(filename)[1] not in TEXT_EXTENSIONS:
+                        continue
+                    path = os.path.join(root, filename)
+                    rel_path = os.path.relpath(path, self.workspace_path)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    if stat.st_size > self.max_file_bytes:
+                        continue
+                    seen.add(rel_path)
+                    entry = self.index.files.get(rel_path)
+                    if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                        continue
+                    try:
+                        with open(path, 'r', encoding='utf-8') as f:
+                            text = f.read()
+                    except (OSError, UnicodeDecodeError):
+                        continue
+                    chunks = chunk_lines(text)
+                    if chunks:
+                        vectors = self._embed([f"{rel_path}\n{body}" for _, _, body in chunks])
+                        self.index.add(rel_path, (stat.st_mtime_ns, stat.st_size),
+                                       [(s, e) for s, e, _ in chunks], vectors)
+                    else:
+                        self.index.remove(rel_path)
+                    embedded_files += 1
+                    embedded_chunks += len(chunks)
+                    if self.checkpoint_files and embedded_files % self.checkpoint_files == 0:
+                        self.index.save()
+            removed = [f for f in list(self.index.files) if f not in seen]
+            for rel_path in removed:
+                self.index.remove(rel_path)
+            if embedded_files or removed:
+                self.index.compact()
+                self.index.save()
+        return {
+            "files_embedded": embedded_files,
+            "chunks_embedded": embedded_chunks,
+            "files_removed": len(removed),
+            "chunks": self.index.size,
+            "refresh_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+
+    def search(self, query: str, top_k: int = 10) -> List[Dict[str, Any]]:
+        query_vector = self._embed([query])[0]
+        results = []
+        for (file, start_line, end_line), score in self.index.search_chunks(query_vector, top_k):
+            results.append({
+                "file": file,
+                "full_path": os.path.join(self.workspace_path, file),
+                "start_line": start_line,
+                "end_line": end_line,
+                "score": round(score, 4),
+            })
+        return results
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Cost of N completion alternatives: independent requests vs shared-prefix sampling.
+
+For completion prompts cut from the backend sources, three strategies are
+timed against an Ollama endpoint (`/api/generate`) or a CPU cost model
+(`--simulate`):
+
+  single       one greedy completion (the baseline cost)
+  independent  N separate completion requests, as when the editor asks again
+               for every alternative. Each gets a unique first line, so each
+               pays the full prefill, as it does once other requests have
+               used the runner in between.
+  shared       `sample_alternatives` from `backend/completion_alternatives.py`,
+               as `/complete` with `n` does: the same prompt N times in a row,
+               so only the first sample pays the prefill.
+
+Every case starts with a fresh nonce so the first call is never served from
+an earlier KV cache. The report has median latency, prompt tokens evaluated
+per case, distinct alternatives after de-duplication, and the cost of
+`shared` relative to `single`. It is written as JSON (`--output`).
+
+Needs the backend dependencies (the prompt template comes from
+`backend/server.py`); the model is called over HTTP with the standard library.
+
+Usage: python benchmarks/bench_alternatives.py [--n 3] [--model gemma3:1b] [--simulate]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+SOURCES = ["backend/cache.py", "backend/llm.py", "backend/metrics.py", "backend/model_router.py",
+           "backend/circuit_breaker.py", "backend/file_reader.py"]
+
+
+def load_cases(count, seed):
+    """(prompt, context) pairs: half of a code line plus the five lines around it"""
+    rng = random.Random(seed)
+    cases = []
+    for path in SOURCES:
+        with open(os.path.join(ROOT, path), "r", encoding="utf-8") as f:
+            lines = f.read().split("\n")
+        for index, line in enumerate(lines):
+            stripped = line.strip()
+            if len(stripped) > 20 and not stripped.startswith(("#", '"""')):
+                context = "\n".join(lines[max(0, index - 5):index + 6])
+                cases.append((line[:len(line) - len(stripped) + len(stripped) // 2], context))
+    rng.shuffle(cases)
+    return cases[:count]
+
+
+def ollama_generate(endpoint, model, num_predict):
+    def generate(prompt, options):
+        body = json.dumps({"model": model, "prompt": prompt, "stream": False,
+                           "options": {"num_predict": num_predict, **options}}).encode("utf-8")
+        request = urllib.request.Request(f"{endpoint.rstrip('/')}/api/generate", data=body,
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=600) as response:
+            return json.loads(response.read())
+    return generate
+
+
+def simulated_generate(args):
+    """Linear CPU cost model with a one-prompt KV cache, like a single Ollama runner"""
+    from prompt_context import estimate_tokens
+
+    state = {"prompt": None}
+    pool = ["return self._entries[key]", "return self._entries.get(key)", "return None",
+            "return self._entries[key][1]"]
+
+    def generate(prompt, options):
+        tokens = estimate_tokens(prompt)
+        evaluated = 1 if prompt == state["prompt"] else tokens
+        state["prompt"] = prompt
+        time.sleep((evaluated * args.sim_prefill_ms + args.num_predict * args.sim_decode_ms) / 1000)
+        seed = options.get("seed", 0)
+        text = pool[0] if not options.get("temperature") else pool[random.Random(seed).randrange(len(pool))]
+        return {"response": text, "prompt_eval_count": evaluated, "eval_count": args.num_predict}
+    return generate
+
+
+def run_case(strategy, generate, server, completion_prompt, n, temperature, nonce):
+    from completion_alternatives import rank, sample_alternatives
+
+    prompt = f"# request {nonce}\n{completion_prompt}"
+    start = time.perf_counter()
+    if strategy == "single":
+        response = generate(prompt, {"temperature": 0})
+        prefill = [response.get("prompt_eval_count", 0)]
+        alternatives = rank([{"text": server.clean_completion(response["response"]), "greedy": True}])
+    elif strategy == "independent":
+        samples, prefill = [], []
+        for i in range(n):
+            options = {"temperature": 0} if i == 0 else {"temperature": temperature, "seed": i}
+            response = generate(f"# request {nonce}.{i}\n{completion_prompt}", options)
+            prefill.append(response.get("prompt_eval_count", 0))
+            samples.append({"text": server.clean_completion(response["response"]), "greedy": i == 0})
+        alternatives = rank(samples)
+    else:
+        sampled = sample_alternatives(lambda options: generate(prompt, options), server.clean_completion, n,
+                                      temperature=temperature)
+        prefill, alternatives = sampled["prefill_tokens"], sampled["alternatives"]
+    return {
+        "strategy": strategy,
+        "ms": (time.perf_counter() - start) * 1000,
+        "prefill_tokens": sum(prefill),
+        "alternatives": len(alternatives),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="N-best completion cost: independent vs shared prefix")
+    parser.add_argument("--endpoint", default=os.environ.get("OLLAMA_HOST", "http://localhost:11434"))
+    parser.add_argument("--model", default="gemma3:1b")
+    parser.add_argument("--n", type=int, default=3)
+    parser.add_argument("--cases", type=int, default=10)
+    parser.add_argument("--num-predict", type=int, default=32)
+    parser.add_argument("--temperature", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--simulate", action="store_true", help="cost model instead of a real endpoint")
+    parser.add_argument("--sim-prefill-ms", type=float, default=1.0, help="simulated ms per prompt token")
+    parser.add_argument("--sim-decode-ms", type=float, default=10.0, help="simulated ms per output token")
+    parser.add_argument("--output", default="alternatives_bench.json")
+    args = parser.parse_args()
+
+    # Import the backend without touching Ollama (no model pulls at import)
+    empty_trace = os.path.join(tempfile.mkdtemp(prefix="gemmapilot-bench-"), "empty.jsonl")
+    open(empty_trace, "w").close()
+    os.environ.setdefault("GEMMAPILOT_REPLAY", empty_trace)
+    import server
+
+    generate = simulated_generate(args) if args.simulate else ollama_generate(args.endpoint, args.model, args.num_predict)
+    cases = load_cases(args.cases, args.seed)
+    mode = "simulated" if args.simulate else f"{args.model} @ {args.endpoint}"
+    print(f"{len(cases)} prompts, n={args.n}, num_predict={args.num_predict} ({mode})")
+
+    nonce = itertools.count(1)
+    rows = []
+    for prompt, context in cases:
+        completion_prompt = server.build_completion_prompt(prompt, context, "python")
+        for strategy in ("single", "independent", "shared"):
+            rows.append(run_case(strategy, generate, server, completion_prompt, args.n, args.temperature, next(nonce)))
+
+    summary = {}
+    for strategy in ("single", "independent", "shared"):
+        selected = [row for row in rows if row["strategy"] == strategy]
+        summary[strategy] = {
+            "median_ms": round(statistics.median(row["ms"] for row in selected), 1),
+            "median_prefill_tokens": statistics.median(row["prefill_tokens"] for row in selected),
+            "mean_alternatives": round(statistics.mean(row["alternatives"] for row in selected), 2),
+        }
+    single_ms = summary["single"]["median_ms"] or 1
+    for strategy, values in summary.items():
+        values["vs_single"] = round(values["median_ms"] / single_ms, 2)
+
+    print(f"{'strategy':<12}{'median ms':>11}{'prefill tok':>13}{'distinct':>10}{'vs single':>11}")
+    for strategy, values in summary.items():
+        print(f"{strategy:<12}{values['median_ms']:>11.1f}{values['median_prefill_tokens']:>13.0f}"
+              f"{values['mean_alternatives']:>10.2f}{values['vs_single']:>10.2f}x")
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"platform": platform.platform(), "processor": platform.processor(), "cpu_count": os.cpu_count()},
+        "model": None if args.simulate else args.model,
+        "simulated": args.simulate,
+        "n": args.n,
+        "num_predict": args.num_predict,
+        "temperature": args.temperature,
+        "summary": summary,
+        "runs": rows,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Benchmark for parallel, deadline-bounded prompt-context reads in `/chat`.
+
+Runs the FastAPI app in-process and sends concurrent `/chat` requests, each
+with a current file and several attachments referenced by path. Model calls
+come from a synthetic replay trace with a fixed latency, so no Ollama is
+needed. Every context read gets an extra `--read-ms` delay, and every
+`--slow-every`-th read takes `--slow-ms`, to mimic a network-mounted
+workspace.
+
+Two modes are compared:
+  inline - the previous behaviour: reads run one after another on the event loop
+  pool   - reads run in parallel on the I/O pool under CONTEXT_IO_DEADLINE
+
+Requires the backend's dependencies (fastapi, httpx, ollama).
+
+Usage: python benchmarks/bench_context_io.py [--clients 16] [--requests 10] [--attachments 5]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND)
+
+
+def write_synthetic_trace(path, model_ms):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"type": "model", "call": "chat", "route": "chat", "model": "bench", "key": "",
+                            "request": [], "latency_ms": model_ms, "stream": False,
+                            "text": "Looks fine.", "final": {}}) + "\n")
+
+
+class InlineIO:
+    """Previous behaviour: blocking reads, sequential, on the event loop"""
+
+    async def run(self, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    async def gather(self, calls, deadline=None, default=None):
+        return {name: fn() for name, fn in calls.items()}, []
+
+    def stats(self):
+        return {}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * (len(ordered) - 1)))]
+
+
+async def run_load(app, workspace, files, args):
+    import httpx
+
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        async def worker(worker_id):
+            for i in range(args.requests):
+                body = {
+                    "prompt": f"client {worker_id} request {i}: review these files",
+                    "workspace_path": workspace,
+                    "current_file": files[0],
+                    "files": [{"path": p} for p in files[1:args.attachments + 1]],
+                    "use_cache": False,
+                }
+                start = time.perf_counter()
+                response = await client.post("/chat", json=body)
+                response.raise_for_status()
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(w) for w in range(args.clients)))
+        wall = time.perf_counter() - start
+    return latencies, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/chat context I/O benchmark")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=10, help="requests per client")
+    parser.add_argument("--attachments", type=int, default=5)
+    parser.add_argument("--model-ms", type=float, default=50.0)
+    parser.add_argument("--read-ms", type=float, default=15.0)
+    parser.add_argument("--slow-ms", type=float, default=3000.0)
+    parser.add_argument("--slow-every", type=int, default=50)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="gemmapilot-bench-")
+    trace = os.path.join(tmp, "trace.jsonl")
+    write_synthetic_trace(trace, args.model_ms)
+    os.environ["GEMMAPILOT_REPLAY"] = trace
+    os.environ["GEMMAPILOT_REPLAY_SPEED"] = "1.0"
+
+    workspace = os.path.join(tmp, "workspace")
+    os.makedirs(workspace)
+    files = []
+    for n in range(args.attachments + 1):
+        path = os.path.join(workspace, f"module_{n}.py")
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(f"def function_{n}_{i}(x):\n    return x * {i}\n\n" for i in range(150))
+        files.append(path)
+
+    import server
+
+    # Simulated mount latency for every context read
+    counter = itertools.count(1)
+    counter_lock = threading.Lock()
+    read_context_file = server.read_context_file
+
+    def slow_read(path, center_line=None):
+        with counter_lock:
+            n = next(counter)
+        time.sleep((args.slow_ms if args.slow_every and n % args.slow_every == 0 else args.read_ms) / 1000)
+        return read_context_file(path, center_line)
+
+    server.read_context_file = slow_read
+    pool = server.io_pool
+    total = args.clients * args.requests
+    print(f"{args.clients} clients × {args.requests} requests, {args.attachments} attachments + current file, "
+          f"read {args.read_ms:.0f} ms (every {args.slow_every}th {args.slow_ms:.0f} ms), model {args.model_ms:.0f} ms")
+    print(f"{'mode':<8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'req/s':>9}")
+    for mode, io in (("inline", InlineIO()), ("pool", pool)):
+        server.io_pool = io
+        latencies, wall = asyncio.run(run_load(server.app, workspace, files, args))
+        print(f"{mode:<8}{statistics.median(latencies):>10.1f}{percentile(latencies, 0.95):>10.1f}"
+              f"{percentile(latencies, 0.99):>10.1f}{max(latencies):>10.1f}{total / wall:>9.1f}")
+    server.io_pool = pool
+    print(f"deadline {server.CONTEXT_IO_DEADLINE}s, I/O pool timeouts: {pool.timeouts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark for diff-output mode of `fix_code` / `optimize_code`.
+
+Takes real files from `backend/`, injects a one-line bug into each and asks a
+running server to fix them with `output_mode` "rewrite" and "diff". Reports
+output tokens (as counted by Ollama) and end-to-end latency per mode, plus how
+often the edits applied and produced the original file back.
+
+Requires a running server (`cd backend && python server.py`) and `requests`.
+
+Usage: python benchmarks/bench_edit_mode.py [--url http://localhost:8000] [--rounds 1]
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+import requests
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+# (file, original text, buggy replacement) - each introduces a single-line bug
+CASES = [
+    ("blob_store.py", "while self.total_bytes > self.max_bytes", "while self.total_bytes < self.max_bytes"),
+    ("cache.py", "entry[0] < time.monotonic()", "entry[0] > time.monotonic()"),
+    ("file_reader.py", "self.offsets.append(pos + 1)", "self.offsets.append(pos)"),
+    ("symbol_index.py", "return source_lines[node.lineno - 1].strip()", "return source_lines[node.lineno].strip()"),
+]
+
+
+def load_cases():
+    cases = []
+    for name, original, buggy in CASES:
+        with open(os.path.join(BACKEND, name), 'r', encoding='utf-8') as f:
+            source = f.read()
+        if original not in source:
+            print(f"⚠️ Skipping {name}: bug site not found")
+            continue
+        cases.append({"name": name, "source": source, "code": source.replace(original, buggy, 1)})
+    return cases
+
+
+def run(url, case, mode):
+    start = time.perf_counter()
+    response = requests.post(f"{url}/code_action", json={
+        "action": "fix_code",
+        "code": case["code"],
+        "language": "python",
+        "output_mode": mode,
+    }, timeout=600)
+    elapsed = time.perf_counter() - start
+    response.raise_for_status()
+    result = response.json()
+    return {
+        "seconds": elapsed,
+        "output_tokens": result.get("usage", {}).get("output_tokens"),
+        "applied": bool(result.get("suggested_code")),
+        "restored": (result.get("suggested_code") or "").strip() == case["source"].strip(),
+    }
+
+
+def summarize(mode, rows):
+    tokens = [r["output_tokens"] for r in rows if r["output_tokens"] is not None]
+    seconds = [r["seconds"] for r in rows]
+    print(f"{mode:>8}: latency median {statistics.median(seconds):6.2f}s  "
+          f"max {max(seconds):6.2f}s  "
+          f"output tokens median {statistics.median(tokens) if tokens else float('nan'):7.1f}  "
+          f"applied {sum(r['applied'] for r in rows)}/{len(rows)}  "
+          f"restored {sum(r['restored'] for r in rows)}/{len(rows)}")
+    return statistics.median(tokens) if tokens else None, statistics.median(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="fix_code rewrite vs diff output benchmark")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--rounds", type=int, default=1)
+    args = parser.parse_args()
+
+    cases = load_cases()
+    print(f"{len(cases)} cases, {args.rounds} round(s), server {args.url}")
+    results = {"rewrite": [], "diff": []}
+    for _ in range(args.rounds):
+        for case in cases:
+            for mode in results:
+                row = run(args.url, case, mode)
+                results[mode].append(row)
+                print(f"  {case['name']:<16} {mode:>8} {row['seconds']:6.2f}s  tokens={row['output_tokens']}")
+
+    rewrite_tokens, rewrite_seconds = summarize("rewrite", results["rewrite"])
+    diff_tokens, diff_seconds = summarize("diff", results["diff"])
+    if rewrite_tokens and diff_tokens:
+        print(f"diff mode: {rewrite_tokens / diff_tokens:.1f}x fewer output tokens, "
+              f"{rewrite_seconds / diff_seconds:.1f}x faster (median)")
+
+
+if __name__ == "__main__":
+    main()
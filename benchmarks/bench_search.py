@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the semantic search vector index.
+
+Builds a synthetic float16 index of N chunks on disk, memory-maps it and
+measures top-k query latency. Uses random vectors, so it measures the index,
+not embedding quality or embedding-model latency.
+
+Usage: python benchmarks/bench_search.py [--chunks 200000] [--dim 384] [--queries 50]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import numpy as np  # noqa: E402
+
+from vector_index import VectorIndex  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector index search benchmark")
+    parser.add_argument("--chunks", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=None, help="search threads (default: min(8, cpu count))")
+    parser.add_argument("--target-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        index = VectorIndex(directory, args.dim, workers=args.workers)
+        start = time.perf_counter()
+        batch = 50_000
+        for offset in range(0, args.chunks, batch):
+            rows = min(batch, args.chunks - offset)
+            vectors = rng.standard_normal((rows, args.dim), dtype=np.float32)
+            index.add_matrix(vectors, [[f"file{(offset + i) // 20}.py", 1, 40] for i in range(rows)])
+        build_s = time.perf_counter() - start
+        size_mb = os.path.getsize(index.vectors_path) / 1e6
+
+        queries = rng.standard_normal((args.queries + 3, args.dim), dtype=np.float32)
+        for query in queries[:3]:  # warm the page cache
+            index.search(query, args.top_k)
+
+        latencies = []
+        for query in queries[3:]:
+            start = time.perf_counter()
+            index.search(query, args.top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        # Check exactness against a brute-force float32 scan
+        matrix = np.asarray(index._matrix, dtype=np.float32)
+        query = queries[-1] / np.linalg.norm(queries[-1])
+        expected = set(np.argsort(-(matrix @ query))[:args.top_k].tolist())
+        got = {row for row, _ in index.search(queries[-1], args.top_k)}
+
+    latencies.sort()
+    p50 = statistics.median(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(f"chunks={args.chunks} dim={args.dim} file={size_mb:.1f}MB build={build_s:.1f}s "
+          f"workers={index.workers} cpus={os.cpu_count()}")
+    print(f"query p50={p50:.1f}ms p95={p95:.1f}ms max={latencies[-1]:.1f}ms "
+          f"(target {args.target_ms:.0f}ms: {'PASS' if p95 <= args.target_ms else 'FAIL'})")
+    print(f"top-{args.top_k} matches brute force: {len(expected & got)}/{args.top_k}")
+    return 0 if p95 <= args.target_ms else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
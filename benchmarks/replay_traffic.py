@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Replay recorded HTTP traffic against a server and compare latencies.
+
+Record a trace with `GEMMAPILOT_RECORD=trace.jsonl.gz` on a normal server.
+Then start the build under test with `GEMMAPILOT_REPLAY=trace.jsonl.gz` (model
+calls are served from the trace with their recorded timing, no Ollama
+needed) and run this script. It sends the recorded requests and reports
+per-endpoint p50/p95 latency next to the recorded numbers.
+
+By default requests are sent one after another. `--pace 1.0` keeps the
+recorded arrival times (2.0 = twice as fast), so concurrency matches the
+original traffic.
+
+Requires `requests` and a running server.
+
+Usage: python benchmarks/replay_traffic.py trace.jsonl.gz [--url http://localhost:8000] [--pace 1.0]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from trace_replay import read_trace  # noqa: E402
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * (len(ordered) - 1)))]
+
+
+def send(url, record):
+    target = url + record["path"] + (f"?{record['query']}" if record.get("query") else "")
+    start = time.perf_counter()
+    response = requests.request(record["method"], target, json=record.get("body"), stream=True, timeout=600)
+    for _ in response.iter_content(chunk_size=None):
+        pass
+    return response.status_code, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded HTTP traffic and compare latency")
+    parser.add_argument("trace")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--pace", type=float, default=0.0,
+                        help="replay arrival times at this speed (0 = sequential, as fast as possible)")
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    records = [r for r in read_trace(args.trace) if r.get("type") == "http"]
+    records.sort(key=lambda r: r["t"])
+    if not records:
+        print("No HTTP requests in trace")
+        return
+    print(f"Replaying {len(records)} requests against {args.url} "
+          f"({'sequential' if args.pace <= 0 else f'pace {args.pace}x'})")
+
+    results = []
+    lock = threading.Lock()
+
+    def run(record):
+        try:
+            status, latency = send(args.url, record)
+        except requests.RequestException as e:
+            status, latency = f"error: {e.__class__.__name__}", None
+        with lock:
+            results.append((record, status, latency))
+
+    started = time.perf_counter()
+    if args.pace <= 0:
+        for record in records:
+            run(record)
+    else:
+        first = records[0]["t"]
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            for record in records:
+                delay = (record["t"] - first) / args.pace - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(run, record)
+    wall = time.perf_counter() - started
+
+    by_path = {}
+    for record, status, latency in results:
+        by_path.setdefault(record["path"], []).append((record, status, latency))
+
+    print(f"\n{'endpoint':<28}{'n':>5}{'rec p50':>10}{'rec p95':>10}{'new p50':>10}{'new p95':>10}{'Δp50':>8}  status mismatches")
+    for path, rows in sorted(by_path.items()):
+        recorded = [r["latency_ms"] for r, _, _ in rows]
+        replayed = [latency for _, _, latency in rows if latency is not None]
+        mismatches = sum(1 for r, status, _ in rows if status != r["status"])
+        if not replayed:
+            print(f"{path:<28}{len(rows):>5}  all requests failed")
+            continue
+        rec_p50, new_p50 = statistics.median(recorded), statistics.median(replayed)
+        change = (new_p50 - rec_p50) / rec_p50 * 100 if rec_p50 else 0.0
+        print(f"{path:<28}{len(rows):>5}{rec_p50:>10.1f}{percentile(recorded, 0.95):>10.1f}"
+              f"{new_p50:>10.1f}{percentile(replayed, 0.95):>10.1f}{change:>7.0f}%  {mismatches}")
+    print(f"\nWall time {wall:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Context-size vs latency sweep for `/chat` prompts.
+
+Builds real `/chat` prompts with `create_enhanced_prompt` over a fixed corpus
+while varying the context knobs in `backend/server.py`:
+
+  FILE_CONTEXT_MAX_LINES    lines of the current file (default 500)
+  WORKSPACE_TREE_DEPTH      depth of the workspace tree (default 3)
+  WORKSPACE_TREE_MAX_LINES  lines of the workspace tree (default 100)
+  attachments               files attached to the request (default 0)
+
+Each prompt is sent to an Ollama endpoint (`--endpoint`, streaming
+`/api/chat`), or costed with a linear CPU model (`--simulate`). For every run
+the report records prompt tokens, prefill time, time to first token, total
+latency, decode tokens/s and, for real models, the share of expected keywords
+the answer mentions (a rough quality signal). Results go to a JSON report
+(`--output`) with per-run rows and per-setting medians.
+
+By default one knob is varied at a time around the current defaults
+(`--grid axes`); `--grid full` runs the cross product. A unique first line
+is added to every prompt so Ollama cannot reuse the KV cache of the previous
+run and hide the prefill cost.
+
+The corpus is a list of {"prompt", "current_file", "keywords"} entries with
+paths relative to `--workspace` (default: this repository). Pass
+`--corpus corpus.json` to use your own.
+
+Requires the backend's dependencies (fastapi, ollama); the model is called
+over HTTP with the standard library.
+
+Usage: python benchmarks/sweep_context.py [--model gemma3:4b] [--repeats 3] [--simulate]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+DEFAULT_CORPUS = [
+    {"prompt": "How does /complete decide between the completion cache, the model and degraded suggestions?",
+     "current_file": "backend/server.py", "keywords": ["completion_cache", "circuit", "degraded", "timeout"]},
+    {"prompt": "Explain how the model router falls back when a route breaks its latency SLO.",
+     "current_file": "backend/model_router.py", "keywords": ["fallback", "p95", "slo", "route"]},
+    {"prompt": "What does the symbol index persist, and when does it re-index a file?",
+     "current_file": "backend/symbol_index.py", "keywords": ["mtime", "json", "size", "refresh"]},
+]
+ATTACHMENT_POOL = ["backend/llm.py", "backend/cache.py", "backend/metrics.py", "backend/streaming.py",
+                   "backend/file_reader.py", "backend/prompt_context.py"]
+
+DEFAULTS = {"max_lines": 500, "tree_depth": 3, "tree_lines": 100, "attachments": 0}
+
+
+def parse_ints(text):
+    return [int(value) for value in text.split(",") if value.strip()]
+
+
+def settings_grid(args):
+    axes = {
+        "max_lines": parse_ints(args.max_lines),
+        "tree_depth": parse_ints(args.tree_depth),
+        "tree_lines": parse_ints(args.tree_lines),
+        "attachments": parse_ints(args.attachments),
+    }
+    if args.grid == "full":
+        names = list(axes)
+        return [dict(zip(names, values)) for values in itertools.product(*(axes[n] for n in names))]
+    settings = [dict(DEFAULTS)]
+    for name, values in axes.items():
+        for value in values:
+            candidate = {**DEFAULTS, name: value}
+            if candidate not in settings:
+                settings.append(candidate)
+    return settings
+
+
+def build_prompt(server, workspace, entry, setting, nonce):
+    server.FILE_CONTEXT_MAX_LINES = setting["max_lines"]
+    server.WORKSPACE_TREE_DEPTH = setting["tree_depth"]
+    server.WORKSPACE_TREE_MAX_LINES = setting["tree_lines"]
+    current = os.path.join(workspace, entry["current_file"])
+    attachments = [os.path.join(workspace, p) for p in ATTACHMENT_POOL if p != entry["current_file"]]
+    request = server.ChatRequest(
+        prompt=entry["prompt"],
+        workspace_path=workspace,
+        current_file=current,
+        files=[{"path": p} for p in attachments[:setting["attachments"]] if os.path.isfile(p)],
+    )
+    prompt, _ = asyncio.run(server.create_enhanced_prompt(request))
+    return f"Request {nonce}\n{prompt}"
+
+
+def call_ollama(endpoint, model, prompt, options):
+    """Stream /api/chat; returns timings in ms, token counts and the answer"""
+    body = json.dumps({"model": model, "messages": [{"role": "user", "content": prompt}],
+                       "stream": True, "options": options}).encode("utf-8")
+    request = urllib.request.Request(f"{endpoint.rstrip('/')}/api/chat", data=body,
+                                     headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    first = None
+    parts = []
+    final = {}
+    with urllib.request.urlopen(request, timeout=600) as response:
+        for line in response:
+            if not line.strip():
+                continue
+            chunk = json.loads(line)
+            content = chunk.get("message", {}).get("content", "")
+            if content and first is None:
+                first = time.perf_counter()
+            parts.append(content)
+            if chunk.get("done"):
+                final = chunk
+    end = time.perf_counter()
+    eval_ns = final.get("eval_duration") or 0
+    return {
+        "prompt_tokens": final.get("prompt_eval_count"),
+        "output_tokens": final.get("eval_count"),
+        "prefill_ms": (final.get("prompt_eval_duration") or 0) / 1e6,
+        "ttft_ms": ((first or end) - start) * 1000,
+        "total_ms": (end - start) * 1000,
+        "tokens_per_s": final["eval_count"] / (eval_ns / 1e9) if eval_ns and final.get("eval_count") else None,
+        "answer": "".join(parts),
+    }
+
+
+def simulate(prompt, args):
+    """Linear CPU cost model: fixed overhead + per-token prefill + per-token decode"""
+    from prompt_context import estimate_tokens
+
+    tokens = estimate_tokens(prompt)
+    prefill = tokens * args.sim_prefill_ms
+    decode = args.num_predict * args.sim_decode_ms
+    return {
+        "prompt_tokens": tokens,
+        "output_tokens": args.num_predict,
+        "prefill_ms": prefill,
+        "ttft_ms": args.sim_overhead_ms + prefill + args.sim_decode_ms,
+        "total_ms": args.sim_overhead_ms + prefill + decode,
+        "tokens_per_s": 1000 / args.sim_decode_ms,
+        "answer": None,
+    }
+
+
+def keyword_score(answer, keywords):
+    if answer is None or not keywords:
+        return None
+    text = answer.lower()
+    return sum(1 for keyword in keywords if keyword.lower() in text) / len(keywords)
+
+
+def median_of(rows, key):
+    values = [row[key] for row in rows if row.get(key) is not None]
+    return round(statistics.median(values), 2) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Context size vs latency sweep")
+    parser.add_argument("--endpoint", default=os.environ.get("OLLAMA_HOST", "http://localhost:11434"))
+    parser.add_argument("--model", default="gemma3:4b")
+    parser.add_argument("--workspace", default=ROOT)
+    parser.add_argument("--corpus", help="JSON file with [{prompt, current_file, keywords}]")
+    parser.add_argument("--max-lines", default="100,250,500,1000")
+    parser.add_argument("--tree-depth", default="1,2,3,4")
+    parser.add_argument("--tree-lines", default="50,100,200")
+    parser.add_argument("--attachments", default="0,1,3,5")
+    parser.add_argument("--grid", choices=("axes", "full"), default="axes")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--num-predict", type=int, default=128)
+    parser.add_argument("--simulate", action="store_true", help="cost model instead of a real endpoint")
+    parser.add_argument("--sim-overhead-ms", type=float, default=50.0)
+    parser.add_argument("--sim-prefill-ms", type=float, default=4.0, help="simulated ms per prompt token")
+    parser.add_argument("--sim-decode-ms", type=float, default=80.0, help="simulated ms per output token")
+    parser.add_argument("--output", default="context_sweep.json")
+    args = parser.parse_args()
+
+    corpus = DEFAULT_CORPUS
+    if args.corpus:
+        with open(args.corpus, "r", encoding="utf-8") as f:
+            corpus = json.load(f)
+
+    # Import the backend without touching Ollama (no model pulls at import)
+    empty_trace = os.path.join(tempfile.mkdtemp(prefix="gemmapilot-sweep-"), "empty.jsonl")
+    open(empty_trace, "w").close()
+    os.environ.setdefault("GEMMAPILOT_REPLAY", empty_trace)
+    import server
+
+    settings = settings_grid(args)
+    options = {"num_predict": args.num_predict, "temperature": 0}
+    mode = "simulated" if args.simulate else f"{args.model} @ {args.endpoint}"
+    print(f"{len(settings)} settings × {len(corpus)} prompts × {args.repeats} repeats ({mode})")
+    print(f"{'lines':>6}{'depth':>6}{'tree':>6}{'att':>5}{'tokens':>8}{'prefill ms':>12}{'ttft ms':>10}"
+          f"{'total ms':>10}{'tok/s':>8}{'quality':>9}")
+
+    nonce = itertools.count(1)
+    rows = []
+    summary = []
+    for setting in settings:
+        setting_rows = []
+        for entry in corpus:
+            for repeat in range(args.repeats):
+                prompt = build_prompt(server, args.workspace, entry, setting, next(nonce))
+                result = simulate(prompt, args) if args.simulate else call_ollama(args.endpoint, args.model, prompt, options)
+                row = {
+                    **setting,
+                    "prompt": entry["prompt"],
+                    "repeat": repeat,
+                    "prompt_chars": len(prompt),
+                    **{k: v for k, v in result.items() if k != "answer"},
+                    "quality": keyword_score(result["answer"], entry.get("keywords")),
+                }
+                setting_rows.append(row)
+        rows.extend(setting_rows)
+        aggregate = {**setting, **{key: median_of(setting_rows, key) for key in
+                                   ("prompt_tokens", "prefill_ms", "ttft_ms", "total_ms", "tokens_per_s", "quality")}}
+        summary.append(aggregate)
+        quality = "-" if aggregate["quality"] is None else f"{aggregate['quality']:.2f}"
+        tokens_per_s = aggregate["tokens_per_s"] or 0
+        print(f"{setting['max_lines']:>6}{setting['tree_depth']:>6}{setting['tree_lines']:>6}{setting['attachments']:>5}"
+              f"{aggregate['prompt_tokens'] or 0:>8.0f}{aggregate['prefill_ms'] or 0:>12.1f}{aggregate['ttft_ms']:>10.1f}"
+              f"{aggregate['total_ms']:>10.1f}{tokens_per_s:>8.1f}{quality:>9}")
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"platform": platform.platform(), "processor": platform.processor(), "cpu_count": os.cpu_count()},
+        "model": None if args.simulate else args.model,
+        "endpoint": None if args.simulate else args.endpoint,
+        "simulated": args.simulate,
+        "options": options,
+        "defaults": DEFAULTS,
+        "corpus": corpus,
+        "summary": summary,
+        "runs": rows,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,8 @@ export const CONFIG: GemmaPilotConfig = {
     backendUrl: 'http://localhost:8000',
     timeout: 30000,
     enableAutoComplete: true,
+    completionAlternatives: 1, // suggestions per automatic inline completion (each extra one is another generation)
+    cycleCompletionAlternatives: 3, // ranked suggestions fetched when the user cycles or triggers completion explicitly
     maxFileSize: 1024 * 1024, // 1MB
     enableFileAnalysis: true,
     enableCommandExecution: true,
@@ -1875,8 +1875,27 @@ export class GemmaPilotChatProvider implements WebviewViewProvider {
     }
 }
 
+// Report what happened to a completion so the backend can stop generating where suggestions are never accepted
+function reportCompletionEvent(completionId: string, event: 'shown' | 'accepted' | 'dismissed'): void {
+    makeRequest(`${CONFIG.backendUrl}/completion_feedback`, {
+        method: 'POST',
+        body: JSON.stringify({ events: [{ completion_id: completionId, event }] }),
+        headers: { 'Content-Type': 'application/json' }
+    }).catch(() => undefined);
+}
+
 // Register providers for inline completions (GitHub Copilot-like)
 export class GemmaPilotCompletionProvider implements vscode.InlineCompletionItemProvider {
+    // Shown completion that has not been accepted yet; a new request means it was dismissed
+    private pendingCompletionId: string | undefined;
+
+    public completionAccepted(completionId: string): void {
+        if (completionId === this.pendingCompletionId) {
+            this.pendingCompletionId = undefined;
+        }
+        reportCompletionEvent(completionId, 'accepted');
+    }
+
     async provideInlineCompletionItems(
         document: vscode.TextDocument,
         position: vscode.Position,
@@ -1884,7 +1903,14 @@ export class GemmaPilotCompletionProvider implements vscode.InlineCompletionItem
         token: vscode.CancellationToken
     ): Promise<vscode.InlineCompletionItem[]> {
         try {
+            if (this.pendingCompletionId) {
+                reportCompletionEvent(this.pendingCompletionId, 'dismissed');
+                this.pendingCompletionId = undefined;
+            }
             if (token.isCancellationRequested) return [];
+            // Alternatives cost extra generations, so only fetch them when the user asks for more
+            // (cycling through suggestions re-requests with an explicit trigger)
+            const explicit = context.triggerKind === vscode.InlineCompletionTriggerKind.Invoke;
             
             const lineText = document.lineAt(position.line).text;
             const prefix = lineText.substring(0, position.character);
@@ -1905,7 +1931,8 @@ export class GemmaPilotCompletionProvider implements vscode.InlineCompletionItem
                 prompt: prefix,
                 context: context,
                 language: document.languageId,
-                position: { line: position.line, character: position.character }
+                position: { line: position.line, character: position.character },
+                n: explicit ? CONFIG.cycleCompletionAlternatives : CONFIG.completionAlternatives
             };
             
             const response = await makeRequest(`${CONFIG.backendUrl}/complete`, {
@@ -1918,15 +1945,35 @@ export class GemmaPilotCompletionProvider implements vscode.InlineCompletionItem
                 return [];
             }
             
-            const completion = response.data.completion.trim();
-            if (!completion) return [];
+            // Ranked alternatives, best first; VS Code lets the user cycle through them
+            const alternatives: Array<{ completion: string }> = response.data.alternatives || [response.data];
+            const completions = alternatives
+                .map(alternative => alternative.completion.trim())
+                .filter(completion => completion.length > 0);
+            if (completions.length === 0) return [];
             
-            const item = new vscode.InlineCompletionItem(
-                completion,
-                new vscode.Range(position, position)
-            );
+            const completionId: string | undefined = response.data.completion_id;
+            const items = completions.map(completion => {
+                const item = new vscode.InlineCompletionItem(
+                    completion,
+                    new vscode.Range(position, position)
+                );
+                if (completionId) {
+                    item.command = {
+                        command: 'gemmapilot.completionAccepted',
+                        title: 'Completion accepted',
+                        arguments: [completionId]
+                    };
+                }
+                return item;
+            });
+            
+            if (completionId) {
+                this.pendingCompletionId = completionId;
+                reportCompletionEvent(completionId, 'shown');
+            }
             
-            return [item];
+            return items;
             
         } catch (error) {
             console.error('Error in inline completion:', error);
@@ -1957,6 +2004,11 @@ export function activate(context: vscode.ExtensionContext): void {
             completionProvider
         )
     );
+    context.subscriptions.push(
+        vscode.commands.registerCommand('gemmapilot.completionAccepted', (completionId: string) => {
+            completionProvider.completionAccepted(completionId);
+        })
+    );
 
     // Register commands
     context.subscriptions.push(
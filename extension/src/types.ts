@@ -101,6 +101,8 @@ export interface GemmaPilotConfig {
     backendUrl: string;
     timeout: number;
     enableAutoComplete: boolean;
+    completionAlternatives: number;
+    cycleCompletionAlternatives: number;
     supportedLanguages: string[];
     maxFileSize: number;
     enableFileAnalysis: boolean;
@@ -8,6 +8,7 @@ import requests
 import json
 import os
 import sys
+import hashlib
 
 BASE_URL = "http://localhost:8000"
 
@@ -124,6 +125,56 @@ def test_command_execution():
         print(f"✗ Command execution failed: {response.status_code}")
         return False
 
+def test_blob_references():
+    """Test hash-referenced attachments with upload-if-missing"""
+    print("\nTesting blob references...")
+    content = "def add(a, b):\n    return a + b\n"
+    blob_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    missing = requests.post(f"{BASE_URL}/blobs/check", json={"hashes": [blob_hash]}).json()["missing"]
+    if missing:
+        requests.post(f"{BASE_URL}/blobs", json={"blobs": [{"hash": blob_hash, "content": content}]})
+
+    data = {
+        "prompt": "What does this file do?",
+        "files": [{"path": "add.py", "hash": blob_hash}]
+    }
+    response = requests.post(f"{BASE_URL}/chat", json=data)
+    if response.status_code == 200:
+        print("✓ Blob references working")
+        return True
+    else:
+        print(f"✗ Blob references failed: {response.status_code}")
+        return False
+
+def test_chat_cache_refresh():
+    """Test that a use_cache=false answer replaces the cached one"""
+    print("\nTesting chat cache refresh...")
+    data = {"prompt": "Name one use of a Python dictionary", "context": "chat cache refresh test"}
+    requests.post(f"{BASE_URL}/chat", json=data)
+    fresh = requests.post(f"{BASE_URL}/chat", json={**data, "use_cache": False}).json()
+    for _ in range(3):
+        result = requests.post(f"{BASE_URL}/chat", json=data).json()
+        if not result.get("cached") or result["response"] != fresh["response"]:
+            print("✗ Chat cache refresh failed: stale answer served after use_cache=false")
+            return False
+    print("✓ Chat cache refresh working")
+    return True
+
+def test_edit_search_prefix_line():
+    """Test that a SEARCH block only matches whole lines, not the start of a longer line"""
+    print("\nTesting edit SEARCH line matching...")
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+    from edit_format import apply_search_replace
+
+    code = "timeout = 100\ntimeout = 10\nlimit = 10\nlimit = 1\n"
+    updated = apply_search_replace(code, [("timeout = 10", "timeout = 20"), ("limit = 1", "limit = 2")])
+    if updated == "timeout = 100\ntimeout = 20\nlimit = 10\nlimit = 2\n":
+        print("✓ Edit SEARCH line matching working")
+        return True
+    print(f"✗ Edit SEARCH line matching failed: {updated!r}")
+    return False
+
 def main():
     """Run all tests"""
     print("🚀 GemmaPilot Backend Feature Tests")
@@ -134,7 +185,10 @@ def main():
         test_code_completion,
         test_file_analysis,
         test_workspace_files,
-        test_command_execution
+        test_command_execution,
+        test_blob_references,
+        test_chat_cache_refresh,
+        test_edit_search_prefix_line
     ]
     
     passed = 0